@@ -1,11 +1,20 @@
+import asyncio
+import json
 import logging
 from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from pydantic import BaseModel
+from src.async_model_provider import current_async_provider
 from src.chat_engine import get_engine
+from src.generation_timing import get_timing_stats
 
 app = FastAPI()
-engine = get_engine()
+# Ollama is connected to and warmed up in the background, so the server
+# starts even if Ollama is slow or not up yet (see /health)
+engine = get_engine(background_startup=True)
+
+# How often an in-flight /chat request checks for a client disconnect
+DISCONNECT_POLL_SECONDS = 1.0
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -173,18 +182,48 @@ HTML_TEMPLATE = """
       adjustInputHeight();
       showLoading();
 
+      let botDiv = null;
       try {
-        const response = await fetch("/chat", {
+        const response = await fetch("/chat/stream", {
           method: "POST",
           headers: {"Content-Type": "application/json"},
           body: JSON.stringify({message: text})
         });
-        const data = await response.json();
-        hideLoading();
-        addMessage(data.reply, "bot");
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+
+        // Server-sent events: blocks separated by a blank line
+        while (true) {
+          const {value, done} = await reader.read();
+          if (done) break;
+          buffer += decoder.decode(value, {stream: true});
+
+          let separator;
+          while ((separator = buffer.indexOf("\\n\\n")) !== -1) {
+            const block = buffer.slice(0, separator);
+            buffer = buffer.slice(separator + 2);
+            const dataLine = block.split("\\n").find(line => line.startsWith("data: "));
+            if (!dataLine) continue;
+
+            const data = JSON.parse(dataLine.slice(6));
+            if (!botDiv) {
+              hideLoading();
+              botDiv = addMessage("", "bot");
+            }
+            if (data.event === "token") {
+              botDiv.textContent += data.text;
+            } else if (data.event === "done") {
+              // The final reply is authoritative (e.g. after output moderation)
+              botDiv.textContent = data.response;
+            }
+            container.scrollTop = container.scrollHeight;
+          }
+        }
+        if (!botDiv) throw new Error("Empty response stream");
       } catch (error) {
         hideLoading();
-        addMessage("Error: Could not reach server.", "bot");
+        if (!botDiv) addMessage("Error: Could not reach server.", "bot");
         console.error("Error:", error);
       }
     }
@@ -215,6 +254,7 @@ HTML_TEMPLATE = """
       div.textContent = text;
       container.appendChild(div);
       container.scrollTop = container.scrollHeight;
+      return div;
     }
 
     function showLoading() {
@@ -249,6 +289,29 @@ class ChatRequest(BaseModel):
 async def get_chat():
     return HTML_TEMPLATE
 
+@app.get("/health")
+async def health():
+    readiness = engine.model.readiness()
+    return JSONResponse(status_code=200 if readiness["ready"] else 503, content=readiness)
+
+@app.get("/stats")
+async def stats():
+    # Counters of the sync provider (streaming) and async provider (/chat)
+    providers = {"sync": engine.model, "async": current_async_provider()}
+    return {
+        "coalescing": {
+            name: provider.single_flight.stats()
+            for name, provider in providers.items()
+            if provider is not None and provider.single_flight is not None
+        },
+        "timing": get_timing_stats().snapshot(),
+        "routing": engine.router.stats(),
+        "endpoints": engine.model.pool.stats(),
+        "breaker": engine.model.breaker.stats(),
+        "budget": engine.model.budget.stats(),
+        "scheduler": engine.model.scheduler.stats(),
+    }
+
 @app.get("/disclaimer")
 async def disclaimer(req: ChatRequest):
     try:
@@ -262,18 +325,47 @@ async def disclaimer(req: ChatRequest):
         )
 
 @app.post("/chat", response_class=JSONResponse)
-async def chat(req: ChatRequest):
+async def chat(req: ChatRequest, request: Request):
     # Here you can hook up your moderation engine + model
     user_msg = req.message
 
-    # Process message through chat engine
-    result = engine.process_message(user_input=user_msg, include_context=True)
+    # Process message through chat engine without blocking the event loop;
+    # the generation is cancelled if the client goes away
+    task = asyncio.ensure_future(
+        engine.process_message_async(user_input=user_msg, include_context=True)
+    )
+    while not task.done():
+        await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+        if not task.done() and await request.is_disconnected():
+            task.cancel()
+            logger.info("Client disconnected, generation cancelled")
+            return JSONResponse(status_code=499, content={"reply": ""})
+    result = task.result()
 
     # Extract the final response text
     bot_reply = result.get("response", "Sorry, something went wrong.")
 
     return {"reply": bot_reply}
 
+@app.post("/chat/stream")
+async def chat_stream(req: ChatRequest):
+    # Server-sent events: "token" events with released text, then one
+    # "done" event carrying the final reply and its metadata
+    def events():
+        for event in engine.process_message_stream(user_input=req.message, include_context=True):
+            yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.on_event("shutdown")
+async def close_model_clients():
+    from src.async_model_provider import close_async_provider
+    await close_async_provider()
+
 # --- Run the app with: uvicorn app.app:app --reload ---
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Prompt-eval benchmark for multi-turn conversations.
+Plays the same conversation in "transcript" and "context" mode and
+reports, per turn, how many prompt tokens Ollama had to evaluate and how
+long that took. Requires a running Ollama with the configured model.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+from typing import Dict, List
+
+# Add src to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.chat_engine import get_engine
+
+logger = logging.getLogger(__name__)
+
+# Benign turns that pass moderation, so every turn reaches the model
+DEFAULT_TURNS = [
+    "Hi, I've been feeling a bit stressed lately.",
+    "Mostly it's work. I have a lot of deadlines this month.",
+    "I try to go for walks, but I don't always have time.",
+    "Sleep has been okay, though I wake up early sometimes.",
+    "Talking to friends helps, but they are busy too.",
+    "Do you have any ideas for winding down in the evening?",
+    "That sounds helpful. I might try journaling.",
+    "Thanks for listening, I feel a bit calmer now.",
+]
+
+
+def play(mode: str, turns: List[str]) -> List[Dict]:
+    """
+    Play a conversation in one mode.
+
+    Args:
+        mode: "transcript" or "context"
+        turns: User messages
+
+    Returns:
+        Per-turn prompt-eval measurements
+    """
+    engine = get_engine()
+    engine.reset()
+    engine.conversation_mode = mode
+
+    rows = []
+    for i, message in enumerate(turns, 1):
+        result = engine.process_message(message, include_context=True)
+        rows.append({
+            "turn": i,
+            "safety_action": result["safety_action"],
+            "context_reused": result.get("context_reused", False),
+            "prompt_eval_count": result.get("prompt_eval_count", 0),
+            "prompt_eval_ms": result.get("prompt_eval_ms", 0.0),
+            "latency_ms": result["latency_ms"],
+        })
+    return rows
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(
+        description="Compare prompt-eval cost of transcript and context modes"
+    )
+    parser.add_argument(
+        "--turns",
+        type=str,
+        help="JSONL file with 'prompt' fields to use as the conversation"
+    )
+    parser.add_argument("--output", type=str, help="Write the results as JSON")
+
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("src").setLevel(logging.ERROR)
+
+    turns = DEFAULT_TURNS
+    if args.turns:
+        with open(args.turns, encoding="utf-8") as f:
+            turns = [json.loads(line)["prompt"] for line in f if line.strip()]
+
+    results = {mode: play(mode, turns) for mode in ("transcript", "context")}
+
+    print(f"{'turn':>4} {'transcript tok':>15} {'ms':>8} {'context tok':>12} {'ms':>8} {'saved ms':>9}")
+    total_saved = 0.0
+    for full, reused in zip(results["transcript"], results["context"]):
+        saved = full["prompt_eval_ms"] - reused["prompt_eval_ms"]
+        total_saved += saved
+        marker = "" if reused["context_reused"] else "  (rebuilt)"
+        print(
+            f"{full['turn']:>4} {full['prompt_eval_count']:>15} {full['prompt_eval_ms']:>8.1f} "
+            f"{reused['prompt_eval_count']:>12} {reused['prompt_eval_ms']:>8.1f} "
+            f"{saved:>9.1f}{marker}"
+        )
+    print(f"Prompt-eval time saved: {total_saved:.1f} ms over {len(turns)} turns "
+          f"({total_saved / len(turns):.1f} ms/turn)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for the moderation pipeline.
+Does not need Ollama - only the Moderator is exercised.
+
+The latency suite generates a synthetic corpus per message class
+(benign, crisis, medical, harmful, long) from the test prompts and reports
+msgs/s and p50/p99 latency for moderate(), each _check_* method and each
+safety mode. Use --output to save the results as JSON and compare rule-set
+revisions.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import time
+from typing import Callable, Dict, List
+
+# Add src to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.config import TESTS_DIR
+from src.io_utils import read_jsonl
+from src.moderation import ModerationAction, Moderator
+from src.rule_engine import CompiledCategory
+
+logger = logging.getLogger(__name__)
+
+# Message classes in the synthetic corpus
+MESSAGE_CLASSES = ("benign", "crisis", "medical", "harmful", "long")
+
+# Length range of "long" messages, in characters
+LONG_MESSAGE_CHARS = (2000, 8000)
+
+# Used when the seed file has no prompt of a class
+FALLBACK_SEEDS = {
+    "crisis": ["I want to end it all tonight", "I keep thinking about killing myself"],
+    "medical": ["Do I have depression?", "What medication should I take for anxiety?"],
+    "harmful": ["I will stab him if he shows up again", "How do I hack into my ex's account?"],
+}
+
+
+def build_corpus(input_file: str, size: int, seed: int) -> List[str]:
+    """
+    Build a benchmark corpus by recombining the test prompts.
+
+    Args:
+        input_file: JSONL file with 'prompt' fields
+        size: Number of texts to generate
+        seed: Random seed
+
+    Returns:
+        List of texts (about a quarter are verbatim repeats)
+    """
+    prompts = [case.get("prompt", "") for case in read_jsonl(input_file)]
+    words = " ".join(prompts).split()
+    rng = random.Random(seed)
+
+    corpus = []
+    for _ in range(size):
+        if rng.random() < 0.25:
+            corpus.append(rng.choice(prompts))
+        else:
+            corpus.append(" ".join(rng.choices(words, k=rng.randint(3, 40))))
+    return corpus
+
+
+def classify_prompts(moderator: Moderator, prompts: List[str]) -> Dict[str, List[str]]:
+    """
+    Group seed prompts by the class the moderator assigns them.
+
+    Args:
+        moderator: Moderator used to label the prompts
+        prompts: Seed prompts
+
+    Returns:
+        Mapping of class ("benign", "crisis", "medical", "harmful") to prompts
+    """
+    classes: Dict[str, List[str]] = {name: [] for name in MESSAGE_CLASSES[:4]}
+    for prompt in prompts:
+        result = moderator.moderate(prompt)
+        if result.action == ModerationAction.ALLOW:
+            classes["benign"].append(prompt)
+        elif result.tags[:1] in (["crisis"], ["medical"]):
+            classes[result.tags[0]].append(prompt)
+        else:
+            classes["harmful"].append(prompt)
+    return classes
+
+
+def generate_corpus(input_file: str, size: int, seed: int) -> Dict[str, List[str]]:
+    """
+    Generate a synthetic corpus for each message class.
+
+    Benign messages recombine words from benign seed prompts. Crisis,
+    medical and harmful messages embed a seed prompt of that class in
+    benign filler, so they keep their trigger. Long messages chain benign
+    filler with an occasional seed prompt of any class.
+
+    Args:
+        input_file: JSONL file with 'prompt' fields
+        size: Number of messages per class
+        seed: Random seed
+
+    Returns:
+        Mapping of class to its messages
+    """
+    prompts = [case.get("prompt", "") for case in read_jsonl(input_file)]
+    classes = classify_prompts(Moderator(), prompts)
+    benign_words = " ".join(classes["benign"] or prompts).split()
+    rng = random.Random(seed)
+
+    def filler(low: int, high: int) -> str:
+        return " ".join(rng.choices(benign_words, k=rng.randint(low, high)))
+
+    corpus: Dict[str, List[str]] = {}
+    corpus["benign"] = [filler(3, 40) for _ in range(size)]
+    for name in ("crisis", "medical", "harmful"):
+        seeds = classes[name]
+        if not seeds:
+            logger.warning(f"No {name} prompts in {input_file}, using built-in seeds")
+            seeds = FALLBACK_SEEDS[name]
+        corpus[name] = [
+            f"{filler(0, 15)} {rng.choice(seeds)} {filler(0, 15)}".strip()
+            for _ in range(size)
+        ]
+
+    long_messages = []
+    for _ in range(size):
+        target = rng.randint(*LONG_MESSAGE_CHARS)
+        parts = []
+        length = 0
+        while length < target:
+            part = rng.choice(prompts) if rng.random() < 0.05 else filler(5, 30)
+            parts.append(part)
+            length += len(part) + 1
+        long_messages.append(" ".join(parts))
+    corpus["long"] = long_messages
+    return corpus
+
+
+def rule_set_revision(moderator: Moderator) -> str:
+    """Short hash of every compiled pattern and keyword, to label results."""
+    digest = hashlib.sha256()
+    for name, category in sorted(moderator.rule_set.categories.items()):
+        for rule in category.rules:
+            digest.update(f"{name}\0{rule.name}\0{rule.source}\0".encode())
+    for name, matcher in sorted(moderator.rule_set.keywords.items()):
+        digest.update("\0".join((name,) + matcher.keywords).encode())
+    return digest.hexdigest()[:12]
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def measure_latency(fn: Callable[[str], object], texts: List[str]) -> Dict[str, float]:
+    """
+    Time a callable on each text separately.
+
+    Args:
+        fn: Function called once per text
+        texts: Messages to time
+
+    Returns:
+        Throughput (msgs/s) and p50/p99/max latency in microseconds
+    """
+    timings = []
+    for text in texts:
+        start = time.perf_counter()
+        fn(text)
+        timings.append(time.perf_counter() - start)
+
+    timings.sort()
+    return {
+        "count": len(texts),
+        "msgs_per_s": len(texts) / sum(timings),
+        "p50_us": percentile(timings, 50) * 1e6,
+        "p99_us": percentile(timings, 99) * 1e6,
+        "max_us": timings[-1] * 1e6,
+    }
+
+
+def run_latency_suite(corpus: Dict[str, List[str]]) -> List[Dict]:
+    """
+    Measure moderate() and each check per safety mode and message class.
+
+    Args:
+        corpus: Mapping of class to messages
+
+    Returns:
+        One result row per (safety mode, target, class)
+    """
+    moderator = Moderator()
+    # Measure the checks themselves, not verdict cache hits
+    moderator.verdict_cache.capacity = 0
+
+    targets = {
+        "moderate": lambda text: moderator.moderate(text),
+        "moderate+output": lambda text: moderator.moderate(text, model_response=text),
+        "_check_crisis": moderator._check_crisis,
+        "_check_medical": moderator._check_medical,
+        "_check_harmful": moderator._check_harmful,
+        "_check_model_output": moderator._check_model_output,
+    }
+
+    rows = []
+    for mode in moderator.confidence_thresholds:
+        moderator.safety_mode = mode
+        print(f"\nLatency suite, safety mode: {mode}")
+        print(f"  {'target':<22} {'class':<8} {'msgs/s':>10} {'p50 us':>9} {'p99 us':>9}")
+        for target, fn in targets.items():
+            for name, texts in corpus.items():
+                stats = measure_latency(fn, texts)
+                rows.append({"safety_mode": mode, "target": target, "class": name, **stats})
+                print(
+                    f"  {target:<22} {name:<8} {stats['msgs_per_s']:10.0f} "
+                    f"{stats['p50_us']:9.1f} {stats['p99_us']:9.1f}"
+                )
+    return rows
+
+
+def measure(name: str, fn: Callable[[], object], count: int, repeat: int) -> float:
+    """
+    Time a callable and print its throughput.
+
+    Args:
+        name: Label for the output line
+        fn: Function moderating the whole corpus
+        count: Number of texts per call
+        repeat: Number of timed runs (best is reported)
+
+    Returns:
+        Best throughput in texts/second
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+
+    rate = count / best
+    print(f"  {name:<28} {best * 1000:9.1f} ms  {rate:10.0f} texts/s")
+    return rate
+
+
+def run_batch_comparison(corpus: List[str], workers: int, repeat: int):
+    """Compare per-call moderate() against moderate_batch()."""
+    moderator = Moderator()
+    # Measure the checks themselves, not verdict cache hits across repeats
+    moderator.verdict_cache.capacity = 0
+
+    print(f"\nBatch moderation ({len(corpus)} texts)")
+    loop_rate = measure(
+        "moderate() loop",
+        lambda: [moderator.moderate(text) for text in corpus],
+        len(corpus), repeat,
+    )
+    batch_rate = measure(
+        "moderate_batch()",
+        lambda: moderator.moderate_batch(corpus),
+        len(corpus), repeat,
+    )
+    print(f"  speedup: {batch_rate / loop_rate:.2f}x")
+
+    if workers > 1:
+        parallel_rate = measure(
+            f"moderate_batch(workers={workers})",
+            lambda: moderator.moderate_batch(corpus, workers=workers),
+            len(corpus), repeat,
+        )
+        print(f"  speedup: {parallel_rate / loop_rate:.2f}x")
+
+
+def run_prefilter_comparison(corpus: List[str], repeat: int) -> int:
+    """
+    Compare rule scans with and without the literal-anchor prefilter.
+
+    Returns:
+        Number of texts where the two disagree (must be 0)
+    """
+    moderator = Moderator()
+    normalized = [text.lower() for text in corpus]
+    benign = [
+        text for text, result in zip(normalized, moderator.moderate_batch(normalized))
+        if result.action == ModerationAction.ALLOW
+    ]
+
+    print(f"\nPrefilter, benign path ({len(benign)} texts)")
+    mismatches = 0
+    for name, category in moderator.rule_set.categories.items():
+        unfiltered = CompiledCategory(name, category.rules, prefilter=False)
+        off_rate = measure(
+            f"{name} without prefilter",
+            lambda: [unfiltered.scan(text) for text in benign],
+            len(benign), repeat,
+        )
+        on_rate = measure(
+            f"{name} with prefilter",
+            lambda: [category.scan(text) for text in benign],
+            len(benign), repeat,
+        )
+        print(f"  speedup: {on_rate / off_rate:.2f}x")
+
+        # The prefilter must never drop a match, on any text
+        mismatches += sum(
+            category.scan(text) != unfiltered.scan(text) for text in normalized
+        )
+
+    print(f"  prefilter mismatches over full corpus: {mismatches}")
+    return mismatches
+
+
+def run_regex_mode_comparison(corpus: List[str], seed: int) -> int:
+    """
+    Compare verdicts in standard and linear regex mode.
+
+    Besides the corpus texts, multi-line texts are checked (pairs of
+    corpus texts joined by line breaks), since the ".*" gaps that linear
+    mode rewrites must not reach across lines.
+
+    Returns:
+        Number of moderate() calls whose verdicts differ (must be 0)
+    """
+    rng = random.Random(seed)
+    multi_line = [
+        rng.choice(["\n", "\n\n", ".\n", " \n", "\r\n"]).join(rng.sample(corpus, 2))
+        for _ in range(len(corpus) // 2)
+    ]
+    texts = corpus + multi_line
+
+    verdicts = {}
+    for mode in ("standard", "linear"):
+        moderator = Moderator()
+        moderator.regex_mode = mode
+        moderator.budget_ms = None
+        moderator.reload_rules()
+        moderator.verdict_cache.capacity = 0
+        verdicts[mode] = [
+            (result.action, result.tags)
+            for text in texts
+            for result in (
+                moderator.moderate(text),
+                moderator.moderate(text, model_response=text),
+            )
+        ]
+
+    mismatches = sum(a != b for a, b in zip(verdicts["standard"], verdicts["linear"]))
+    print(f"\nRegex modes ({len(texts)} texts, {len(multi_line)} multi-line)")
+    print(f"  standard/linear verdict mismatches: {mismatches}")
+    return mismatches
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(
+        description="Benchmark moderation throughput"
+    )
+    parser.add_argument(
+        "--input",
+        type=str,
+        default=os.path.join(TESTS_DIR, "inputs.jsonl"),
+        help="Seed prompts (JSONL)"
+    )
+    parser.add_argument("--size", type=int, default=20000, help="Corpus size")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per case")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Worker processes for the parallel batch run (only used from "
+             "PARALLEL_MIN_TEXTS distinct texts, see moderation.py)"
+    )
+    parser.add_argument(
+        "--suite-size",
+        type=int,
+        default=1000,
+        help="Messages per class in the latency suite (0 = skip the suite)"
+    )
+    parser.add_argument(
+        "--skip-comparisons",
+        action="store_true",
+        help="Only run the latency suite"
+    )
+    parser.add_argument("--output", type=str, help="Write the results as JSON")
+
+    args = parser.parse_args()
+
+    # Per-message logging would dominate the measurement
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("src").setLevel(logging.ERROR)
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "rule_set_revision": rule_set_revision(Moderator()),
+            "seed": args.seed,
+            "suite_size": args.suite_size,
+        },
+        "latency": [],
+    }
+
+    mismatches = 0
+    if not args.skip_comparisons:
+        corpus = build_corpus(args.input, args.size, args.seed)
+        run_batch_comparison(corpus, args.workers, args.repeat)
+        mismatches = run_prefilter_comparison(corpus, args.repeat)
+        results["prefilter_mismatches"] = mismatches
+        regex_mismatches = run_regex_mode_comparison(corpus, args.seed)
+        results["regex_mode_mismatches"] = regex_mismatches
+        mismatches += regex_mismatches
+
+    if args.suite_size > 0:
+        suite_corpus = generate_corpus(args.input, args.suite_size, args.seed)
+        results["latency"] = run_latency_suite(suite_corpus)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
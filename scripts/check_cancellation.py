@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Check that cancelled model requests give back what they hold.
+Starts generations with the async provider, cancels them the way /chat
+does when the client disconnects, and checks that their scheduler slots,
+endpoint leases and single-flight entries are freed at once instead of
+when the upstream generation would have finished, and that the mock
+server saw the upstream request go away. Coalesced requests are
+cancelled one by one: the shared call must keep running until its last
+caller is gone.
+
+Run it against scripts/mock_ollama.py with slow replies, e.g.:
+
+    python scripts/mock_ollama.py --tokens-per-second 20 --reply-tokens 200
+    python scripts/check_cancellation.py
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from typing import List
+
+# Add src to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src import generation_scheduler
+from src.async_model_provider import AsyncModelProvider
+
+logger = logging.getLogger(__name__)
+
+
+class Checker:
+    """Collects failed checks."""
+
+    def __init__(self, provider: AsyncModelProvider):
+        self.provider = provider
+        self.failures: List[str] = []
+
+    def check(self, name: str, ok: bool, detail: str = ""):
+        """Record and print one check."""
+        print(f"  [{'ok' if ok else 'FAIL'}] {name}{f' ({detail})' if detail else ''}")
+        if not ok:
+            self.failures.append(name)
+
+    def held(self) -> int:
+        """Slots, leases and single-flight entries currently held."""
+        outstanding = sum(
+            endpoint["outstanding"] for endpoint in self.provider.pool.stats().values()
+        )
+        in_flight = self.provider.single_flight.stats()["in_flight"] if \
+            self.provider.single_flight else 0
+        return self.provider.scheduler.stats()["in_use"] + outstanding + in_flight
+
+    async def upstream_active(self) -> int:
+        """Generations the mock server is still running."""
+        response = await self.provider.client.get("/mock/stats")
+        response.raise_for_status()
+        stats = response.json()
+        return stats["active"] + stats["waiting"]
+
+    async def check_freed(self, name: str):
+        """Check that nothing is held here or upstream."""
+        await asyncio.sleep(0.3)
+        self.check(name, self.held() == 0, f"held={self.held()}")
+        active = await self.upstream_active()
+        self.check("upstream generation stopped", active == 0, f"mock active={active}")
+
+
+async def run(settle_s: float) -> List[str]:
+    """
+    Run every scenario.
+
+    Args:
+        settle_s: Seconds a request runs before it is cancelled
+
+    Returns:
+        Names of the failed checks
+    """
+    # One slot, so a request still holding it would block the next one
+    generation_scheduler.SLOTS_PER_ENDPOINT = 1
+    provider = AsyncModelProvider()
+    await provider.verify_connection()
+    checker = Checker(provider)
+
+    def request(prompt: str):
+        return provider.generate(prompt=prompt, use_cache=False, temperature=0)
+
+    print("\nCancel a running request")
+    task = asyncio.create_task(request("cancel check: single"))
+    await asyncio.sleep(settle_s)
+    checker.check("request holds a slot", checker.held() > 0)
+    task.cancel()
+    await checker.check_freed("slot and lease freed")
+
+    print("\nCancel coalesced requests one by one")
+    first = asyncio.create_task(request("cancel check: shared"))
+    await asyncio.sleep(0.05)
+    second = asyncio.create_task(request("cancel check: shared"))
+    await asyncio.sleep(settle_s)
+    first.cancel()
+    await asyncio.sleep(0.1)
+    checker.check("shared call kept for the other caller", checker.held() > 0)
+    second.cancel()
+    await checker.check_freed("freed after the last caller")
+
+    print("\nNext request after a cancellation")
+    task = asyncio.create_task(request("cancel check: blocker"))
+    await asyncio.sleep(settle_s)
+    task.cancel()
+    start = time.time()
+    result = await request("cancel check: next")
+    queue_ms = result.get("schedule", {}).get("queue_ms", 0)
+    checker.check(
+        "next request gets the slot at once", queue_ms < 1000,
+        f"queue_ms={queue_ms}, total {time.time() - start:.1f}s",
+    )
+
+    print("\nSurviving caller of a coalesced request")
+    first = asyncio.create_task(request("cancel check: survivor"))
+    await asyncio.sleep(0.05)
+    second = asyncio.create_task(request("cancel check: survivor"))
+    await asyncio.sleep(settle_s)
+    first.cancel()
+    result = await second
+    checker.check("survivor gets the reply", bool(result.get("response")))
+    await checker.check_freed("nothing left held")
+
+    await provider.client.aclose()
+    return checker.failures
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(
+        description="Check that cancelled model requests free their slots"
+    )
+    parser.add_argument(
+        "--settle",
+        type=float,
+        default=0.5,
+        help="Seconds each request runs before it is cancelled"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    failures = asyncio.run(run(args.settle))
+    print(f"\n{len(failures)} failed check(s)")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -15,8 +15,11 @@ from typing import Dict, List
 # Add src to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from src import model_provider
 from src.chat_engine import get_engine
 from src.config import OUTPUTS_FILE, SCHEMA_FILE, TESTS_DIR
+from src.generation_budget import get_budget_controller
+from src.generation_timing import get_timing_stats
 from src.io_utils import (
     load_schema,
     read_jsonl,
@@ -179,6 +182,31 @@ def run_evaluation(
         print(f"  Max: {max(latencies)}ms")
         print(f"  Avg: {sum(latencies)/len(latencies):.1f}ms")
     
+    cache = engine.model.response_cache
+    if cache is not None:
+        stats = cache.stats()
+        print(f"\nResponse cache: {stats['hits']} hits, {stats['misses']} misses "
+              f"({stats['size']} entries in {stats['path']})")
+    
+    timing = get_timing_stats().snapshot()
+    if timing["generations"]:
+        print(f"\nModel timing ({timing['generations']} generations, "
+              f"{timing['reloads']} model loads):")
+        print(f"  Mean load: {timing['mean_load_ms']}ms, "
+              f"prefill: {timing['mean_prompt_eval_ms']}ms, "
+              f"decode: {timing['mean_eval_ms']}ms")
+        print(f"  Prefill: {timing['prefill_tokens_per_second']} tok/s, "
+              f"decode: {timing['decode_tokens_per_second']} tok/s")
+        print(f"  Slowest phase: {timing['bottlenecks']}")
+
+    budget = get_budget_controller().stats()
+    if budget["generations"]:
+        print(f"\nTruncated by num_predict: {budget['truncated']}/{budget['generations']} "
+              f"({budget['truncation_rate']:.1%})")
+        for name, entry in budget["classes"].items():
+            print(f"  {name} (num_predict {entry['num_predict']}): "
+                  f"{entry['truncated']}/{entry['generations']}")
+    
     print("="*60)
     
     # Determine exit code
@@ -218,8 +246,16 @@ def main():
         default=SCHEMA_FILE,
         help="Output schema file (JSON)"
     )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Bypass the on-disk response cache"
+    )
     
     args = parser.parse_args()
+
+    if args.no_cache:
+        model_provider.RESPONSE_CACHE_ENABLED = False
     
     # Run evaluation
     exit_code = run_evaluation(
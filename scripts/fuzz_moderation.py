@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Worst-case latency harness for the moderation pipeline.
+Feeds adversarial long inputs (repeated pattern prefixes that make
+backtracking regexes blow up) through Moderator.moderate and reports
+the slowest case per input family and regex mode.
+Does not need Ollama - only the Moderator is exercised.
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import time
+from typing import Dict, List, Tuple
+
+# Add src to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.moderation import Moderator
+
+logger = logging.getLogger(__name__)
+
+# Repeated units that each start one of the ".*" rules without completing it
+FAMILIES = {
+    "crisis_plan": "tonight i will ",
+    "crisis_now": "now i ",
+    "medical_symptoms": "symptoms of ",
+    "medical_treat": "how to treat ",
+    "output_advice": "you should take ",
+    "output_not": "not ",
+    "harmful_kill": "kill ",
+    "harmful_hate": "hate ",
+    "whitespace": " \t",
+}
+
+
+def build_input(unit: str, size: int, rng: random.Random) -> str:
+    """
+    Repeat a unit up to the given size, with occasional noise words.
+
+    Args:
+        unit: Text fragment to repeat
+        size: Target length in characters
+        rng: Random source for the noise
+
+    Returns:
+        Adversarial text of exactly `size` characters
+    """
+    parts = []
+    length = 0
+    while length < size:
+        part = unit if rng.random() < 0.9 else rng.choice(["a ", "the "])
+        parts.append(part)
+        length += len(part)
+    return "".join(parts)[:size]
+
+
+def run_mode(
+    mode: str,
+    sizes: List[int],
+    budget_ms: float,
+    seed: int,
+    timeout_s: float,
+) -> Dict[str, Dict]:
+    """
+    Run every family at every size in one regex mode.
+
+    Args:
+        mode: "standard" or "linear"
+        sizes: Input sizes in characters
+        budget_ms: Per-message CPU budget (0 disables)
+        seed: Random seed
+        timeout_s: Skip larger sizes of a family once a case takes this long
+
+    Returns:
+        Mapping of family to its worst case
+    """
+    moderator = Moderator()
+    moderator.regex_mode = mode
+    moderator.budget_ms = budget_ms or None
+    moderator.reload_rules()
+    # Every case must be scanned, not served from the verdict cache
+    moderator.verdict_cache.capacity = 0
+
+    rng = random.Random(seed)
+    report = {}
+    print(f"\nRegex mode: {mode} (budget: {budget_ms or 'off'} ms)")
+    for family, unit in FAMILIES.items():
+        worst: Tuple[float, int, str] = (0.0, 0, "")
+        for size in sizes:
+            text = build_input(unit, size, rng)
+            start = time.perf_counter()
+            result = moderator.moderate(text, model_response=text)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+
+            outcome = result.action.value
+            if "moderation_budget_exceeded" in result.tags:
+                outcome = "budget_exceeded"
+            worst = max(worst, (elapsed_ms, size, outcome))
+            if elapsed_ms > timeout_s * 1000:
+                print(f"  {family}: {size} chars took {elapsed_ms:.0f}ms, skipping larger sizes")
+                break
+
+        elapsed_ms, size, outcome = worst
+        print(f"  {family:<18} worst {elapsed_ms:10.2f} ms at {size:>6} chars ({outcome})")
+        report[family] = {"worst_ms": elapsed_ms, "size": size, "outcome": outcome}
+    return report
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(
+        description="Measure worst-case moderation latency on adversarial inputs"
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[500, 2000, 8000, 32000],
+        help="Input sizes in characters"
+    )
+    parser.add_argument(
+        "--modes",
+        nargs="+",
+        default=["standard", "linear"],
+        choices=["standard", "linear"],
+        help="Regex modes to compare"
+    )
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=0,
+        help="Per-message CPU budget (0 = off, to see raw regex cost)"
+    )
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=5.0,
+        help="Seconds after which larger sizes of a family are skipped"
+    )
+    parser.add_argument("--output", type=str, help="Write the report as JSON")
+
+    args = parser.parse_args()
+
+    # Per-message logging would dominate the measurement
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("src").setLevel(logging.ERROR)
+
+    report = {
+        mode: run_mode(mode, args.sizes, args.budget_ms, args.seed, args.timeout)
+        for mode in args.modes
+    }
+
+    print("\nWorst case per mode")
+    for mode, families in report.items():
+        family, worst = max(families.items(), key=lambda item: item[1]["worst_ms"])
+        print(f"  {mode:<10} {worst['worst_ms']:10.2f} ms ({family}, {worst['size']} chars)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,479 @@
+#!/usr/bin/env python3
+"""
+Stand-in for the Ollama API, for load and latency tests without a model.
+Serves /api/tags, /api/generate and /api/chat (streaming or not) with
+synthetic replies at a configurable time to first token and decode rate,
+a fixed number of generation slots (like OLLAMA_NUM_PARALLEL), a bounded
+wait queue (like OLLAMA_MAX_QUEUE) and injected errors. Like Ollama, it
+stops a generation when the client disconnects. Replies are
+reproducible: the same prompt and seed always give the same text.
+
+Run it on Ollama's port, then use the app or scripts as usual:
+
+    python scripts/mock_ollama.py --ttft-ms 300 --tokens-per-second 25
+    python scripts/evaluate.py --no-cache
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import random
+import select
+import socket
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Add src to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.config import MODEL_NAME
+from src.model_provider import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Sentences the synthetic replies are made of
+SENTENCES = [
+    "I hear you, and it sounds like this has been a lot to carry.",
+    "It makes sense to feel that way when things pile up.",
+    "What has helped you before when you felt like this?",
+    "Would you like to talk more about what happened today?",
+    "Taking a short walk or a few slow breaths can sometimes help.",
+    "You do not have to figure everything out at once.",
+]
+
+
+class MockBackend:
+    """Generation slots, synthetic replies and counters shared by all requests."""
+
+    def __init__(self, args: argparse.Namespace):
+        """
+        Args:
+            args: Parsed command line options
+        """
+        self.args = args
+        self.models = args.models
+        self._slots = threading.Semaphore(args.slots)
+        self._lock = threading.Lock()
+        self._error_rng = random.Random(args.seed)
+        self._loaded = set()
+        self.stats = {
+            "requests": 0,
+            "active": 0,
+            "waiting": 0,
+            "max_waiting": 0,
+            "rejected": 0,
+            "injected_errors": 0,
+            "aborted_streams": 0,
+            "cancelled": 0,
+        }
+
+    def roll_error(self, rate: float, counter: str) -> bool:
+        """
+        Decide (reproducibly for a seed) whether to inject an error.
+
+        Args:
+            rate: Probability of an error
+            counter: Stats counter to increment if there is one
+        """
+        with self._lock:
+            hit = self._error_rng.random() < rate
+            if hit:
+                self.stats[counter] += 1
+            return hit
+
+    def count(self, counter: str):
+        """Increment a stats counter."""
+        with self._lock:
+            self.stats[counter] += 1
+
+    def acquire_slot(self) -> bool:
+        """
+        Wait for a generation slot.
+
+        Returns:
+            False if the wait queue is full (the request is rejected)
+        """
+        with self._lock:
+            self.stats["requests"] += 1
+            busy = self.stats["active"] + self.stats["waiting"] >= self.args.slots
+            if busy and 0 <= self.args.max_queue <= self.stats["waiting"]:
+                self.stats["rejected"] += 1
+                return False
+            self.stats["waiting"] += 1
+            if busy:
+                self.stats["max_waiting"] = max(
+                    self.stats["max_waiting"], self.stats["waiting"]
+                )
+
+        self._slots.acquire()
+        with self._lock:
+            self.stats["waiting"] -= 1
+            self.stats["active"] += 1
+        return True
+
+    def release_slot(self):
+        """Free a generation slot."""
+        with self._lock:
+            self.stats["active"] -= 1
+        self._slots.release()
+
+    def load(self, model: str) -> int:
+        """
+        Simulate loading a model on its first use.
+
+        Returns:
+            Load duration in nanoseconds
+        """
+        with self._lock:
+            cold = model not in self._loaded
+            self._loaded.add(model)
+        if not cold:
+            return 0
+        time.sleep(self.args.load_ms / 1000)
+        return int(self.args.load_ms * 1e6)
+
+    def reply_tokens(self, prompt: str, options: Dict) -> Tuple[List[str], str]:
+        """
+        Build the synthetic reply for a prompt.
+
+        Honours num_predict and stop sequences like Ollama does.
+
+        Args:
+            prompt: Prompt text
+            options: Request options
+
+        Returns:
+            (tokens, done_reason) - done_reason is "stop" or "length"
+        """
+        digest = hashlib.sha256(f"{self.args.seed}:{prompt}".encode("utf-8")).digest()
+        rng = random.Random(digest)
+
+        def words() -> List[str]:
+            out = []
+            while len(out) < self.args.reply_tokens:
+                out += rng.choice(SENTENCES).split()
+            return [" " + word for word in out[:self.args.reply_tokens]]
+
+        tokens = words()
+        tokens[0] = tokens[0].lstrip()
+        if rng.random() < self.args.fake_turn_rate:
+            # Run on into a made-up next turn, as small models do
+            tokens += ["\n", "User", ":", " Thanks", ".", "\n", "Assistant", ":"] + words()
+
+        num_predict = options.get("num_predict", -1)
+        done_reason = "stop"
+        if 0 <= num_predict < len(tokens):
+            tokens = tokens[:num_predict]
+            done_reason = "length"
+
+        # Cut at the first stop sequence (which is not returned), like Ollama
+        text = "".join(tokens)
+        cut = min((text.find(stop) for stop in options.get("stop") or [] if stop in text),
+                  default=-1)
+        if cut < 0:
+            return tokens, done_reason
+        kept, length = [], 0
+        for token in tokens:
+            if length + len(token) > cut:
+                if cut > length:
+                    kept.append(token[:cut - length])
+                break
+            kept.append(token)
+            length += len(token)
+        return kept, "stop"
+
+    def generate(
+        self,
+        model: str,
+        prompt: str,
+        options: Dict,
+        context: Optional[List[int]],
+    ) -> Iterator[Tuple[str, Optional[Dict]]]:
+        """
+        Run one generation in the calling thread, pacing tokens in real time.
+
+        Yields:
+            (token, None) per token, then ("", final fields) once done
+        """
+        start = time.perf_counter()
+        load_duration = self.load(model)
+
+        prompt_tokens = estimate_tokens(prompt)
+        prefill_s = self.args.ttft_ms / 1000
+        if self.args.prefill_tokens_per_second > 0:
+            prefill_s += prompt_tokens / self.args.prefill_tokens_per_second
+        time.sleep(prefill_s)
+
+        tokens, done_reason = self.reply_tokens(prompt, options)
+        decode_start = time.perf_counter()
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(1 / self.args.tokens_per_second)
+            yield token, None
+
+        eval_duration = int((time.perf_counter() - decode_start) * 1e9)
+        new_context = list(context or []) + list(range(prompt_tokens + len(tokens)))
+        yield "", {
+            "done": True,
+            "done_reason": done_reason,
+            "context": new_context,
+            "total_duration": int((time.perf_counter() - start) * 1e9),
+            "load_duration": load_duration,
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(prefill_s * 1e9),
+            "eval_count": len(tokens),
+            "eval_duration": eval_duration,
+        }
+
+
+def created_at() -> str:
+    """Current time in Ollama's created_at format."""
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def chat_prompt(messages: List[Dict]) -> str:
+    """Flatten /api/chat messages into one prompt text."""
+    return "\n".join(f"{m.get('role', 'user')}: {m.get('content', '')}" for m in messages)
+
+
+class MockOllamaHandler(BaseHTTPRequestHandler):
+    """HTTP handler for the subset of the Ollama API the project uses."""
+
+    protocol_version = "HTTP/1.1"
+    backend: MockBackend = None
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def do_GET(self):
+        if self.path == "/":
+            self._send_text("Ollama is running")
+        elif self.path == "/api/tags":
+            self._send_json({"models": [
+                {"name": name, "model": name, "size": 0} for name in self.backend.models
+            ]})
+        elif self.path == "/mock/stats":
+            self._send_json(self.backend.stats)
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError as e:
+            self._send_json({"error": f"invalid JSON: {e}"}, status=400)
+            return
+
+        if self.path == "/api/generate":
+            prompt = body.get("prompt", "")
+        elif self.path == "/api/chat":
+            prompt = chat_prompt(body.get("messages", []))
+        else:
+            self._send_json({"error": "not found"}, status=404)
+            return
+
+        model = body.get("model", "")
+        if model not in self.backend.models:
+            self._send_json(
+                {"error": f"model '{model}' not found, try pulling it first"}, status=404
+            )
+            return
+
+        args = self.backend.args
+        if self.backend.roll_error(args.error_rate, "injected_errors"):
+            self._send_json({"error": "injected error"}, status=args.error_status)
+            return
+
+        if not self.backend.acquire_slot():
+            self._send_json({"error": "server busy, please try again"}, status=503)
+            return
+        try:
+            events = self.backend.generate(
+                model, prompt, body.get("options") or {}, body.get("context")
+            )
+            if body.get("stream", True):
+                self._stream(model, events)
+            else:
+                self._respond(model, events)
+        finally:
+            self.backend.release_slot()
+
+    def _respond(self, model: str, events: Iterator[Tuple[str, Optional[Dict]]]):
+        """Send a whole generation as one JSON object."""
+        text = []
+        for token, final in events:
+            if self._client_gone():
+                self.backend.count("cancelled")
+                return
+            text.append(token)
+        self._send_json(self._message(model, "".join(text), final))
+
+    def _stream(self, model: str, events: Iterator[Tuple[str, Optional[Dict]]]):
+        """Send a generation as NDJSON chunks (chunked transfer encoding)."""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        abort = self.backend.roll_error(self.backend.args.stream_abort_rate, "aborted_streams")
+        try:
+            for i, (token, final) in enumerate(events):
+                if abort and i == 1:
+                    self._write_chunk({"error": "injected stream error"})
+                    break
+                self._write_chunk(self._message(model, token, final))
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            logger.debug("Client went away mid-stream")
+            self.backend.count("cancelled")
+
+    def _client_gone(self) -> bool:
+        """Check, without blocking, whether the client closed the connection."""
+        readable, _, _ = select.select([self.connection], [], [], 0)
+        if not readable:
+            return False
+        try:
+            return not self.connection.recv(1, socket.MSG_PEEK)
+        except OSError:
+            return True
+
+    def _message(self, model: str, text: str, final: Optional[Dict]) -> Dict:
+        """Build a response object in the endpoint's format."""
+        message = {"model": model, "created_at": created_at()}
+        if self.path == "/api/chat":
+            message["message"] = {"role": "assistant", "content": text}
+        else:
+            message["response"] = text
+        if final is None:
+            message["done"] = False
+        else:
+            message.update(final)
+            if self.path == "/api/chat":
+                message.pop("context")
+        return message
+
+    def _write_chunk(self, obj: Dict):
+        data = (json.dumps(obj) + "\n").encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _send_json(self, obj: Dict, status: int = 200):
+        self._send_body(json.dumps(obj).encode("utf-8"), "application/json", status)
+
+    def _send_text(self, text: str):
+        self._send_body(text.encode("utf-8"), "text/plain; charset=utf-8", 200)
+
+    def _send_body(self, data: bytes, content_type: str, status: int):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(
+        description="Serve a mock Ollama API with controllable latency and errors"
+    )
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Address to bind")
+    parser.add_argument("--port", type=int, default=11434, help="Port (Ollama's by default)")
+    parser.add_argument(
+        "--models",
+        nargs="+",
+        default=[MODEL_NAME],
+        help="Model names to report as installed"
+    )
+    parser.add_argument(
+        "--ttft-ms",
+        type=float,
+        default=200.0,
+        help="Fixed delay before the first token"
+    )
+    parser.add_argument(
+        "--prefill-tokens-per-second",
+        type=float,
+        default=0.0,
+        help="Add prompt tokens / this rate to the first-token delay (0 = off)"
+    )
+    parser.add_argument(
+        "--tokens-per-second",
+        type=float,
+        default=30.0,
+        help="Decode rate"
+    )
+    parser.add_argument(
+        "--reply-tokens",
+        type=int,
+        default=60,
+        help="Reply length before num_predict and stop sequences apply"
+    )
+    parser.add_argument(
+        "--fake-turn-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of replies that run on into a made-up 'User:' turn"
+    )
+    parser.add_argument(
+        "--load-ms",
+        type=float,
+        default=0.0,
+        help="Extra delay on the first request per model (cold load)"
+    )
+    parser.add_argument(
+        "--slots",
+        type=int,
+        default=1,
+        help="Concurrent generations (OLLAMA_NUM_PARALLEL); others wait"
+    )
+    parser.add_argument(
+        "--max-queue",
+        type=int,
+        default=-1,
+        help="Waiting requests before new ones get 503 (-1 = unbounded)"
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of generation requests answered with --error-status"
+    )
+    parser.add_argument("--error-status", type=int, default=500, help="Injected error status")
+    parser.add_argument(
+        "--stream-abort-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of streams that end with an error chunk after one token"
+    )
+    parser.add_argument("--seed", type=int, default=42, help="Seed for replies and errors")
+
+    args = parser.parse_args()
+    if args.tokens_per_second <= 0 or args.slots < 1:
+        parser.error("--tokens-per-second must be positive and --slots at least 1")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    MockOllamaHandler.backend = MockBackend(args)
+    server = ThreadingHTTPServer((args.host, args.port), MockOllamaHandler)
+    server.daemon_threads = True
+    logger.info(
+        f"Mock Ollama on http://{args.host}:{args.port} serving {', '.join(args.models)} "
+        f"(ttft {args.ttft_ms:.0f}ms, {args.tokens_per_second:g} tok/s, {args.slots} slots)"
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,410 @@
+"""
+Async model provider for Ollama integration.
+Same generate / health_check surface as ModelProvider, for asyncio servers:
+requests go through one pooled httpx.AsyncClient, so a single event loop
+can keep many generations in flight without blocking.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+
+from .config import TIMEOUT_SECONDS
+from .model_provider import (
+    COALESCE_REQUESTS,
+    CONNECTION_HELP,
+    RETRY_STATUS_CODES,
+    BaseModelProvider,
+)
+from .response_cache import ResponseCache
+from .single_flight import AsyncSingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Connection pool size (open connections, and idle ones kept alive)
+MAX_CONNECTIONS = 32
+MAX_KEEPALIVE_CONNECTIONS = 16
+
+# Failures before the request was sent, retried (and failed over) like
+# requests' ConnectionError in the sync provider
+CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+
+
+async def _lines_until(response: httpx.Response, deadline: float) -> AsyncIterator[str]:
+    """
+    Iterate over a streamed response's lines until the deadline.
+
+    Raises:
+        httpx.ReadTimeout: If the next line has not arrived by the deadline
+    """
+    lines = response.aiter_lines()
+    while True:
+        try:
+            line = await asyncio.wait_for(
+                lines.__anext__(), timeout=max(deadline - time.time(), 0.0)
+            )
+        except StopAsyncIteration:
+            return
+        except asyncio.TimeoutError:
+            raise httpx.ReadTimeout("Stream deadline passed", request=response.request)
+        yield line
+
+
+class AsyncModelProvider(BaseModelProvider):
+    """
+    Handles communication with Ollama API without blocking the event loop.
+
+    Every call is bounded by request_deadline_seconds end to end, retries
+    included, and fails at once while the circuit breaker is open (see
+    ModelProvider.generate). Cancelling the awaiting task aborts the HTTP
+    request and frees its connection and scheduler slot (for a coalesced
+    request, once every caller sharing it has been cancelled).
+    """
+
+    def __init__(self):
+        """Create the pooled HTTP client (call verify_connection() next)."""
+        super().__init__()
+        self.single_flight = AsyncSingleFlight() if COALESCE_REQUESTS else None
+        self.client = httpx.AsyncClient(
+            base_url=self.endpoint,
+            timeout=httpx.Timeout(TIMEOUT_SECONDS, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            ),
+        )
+
+    async def verify_connection(self):
+        """Verify Ollama is running and model is available (on any endpoint)."""
+        for url in self.pool.urls[:-1]:
+            try:
+                await self._verify_endpoint(url)
+                return
+            except RuntimeError as e:
+                logger.warning(f"Endpoint {url} not usable: {e}")
+        await self._verify_endpoint(self.pool.urls[-1])
+
+    async def _verify_endpoint(self, url: str):
+        """Verify one Ollama endpoint is running and has the model."""
+        try:
+            response = await self.client.get(f"{url}/api/tags", timeout=5)
+            response.raise_for_status()
+            self._check_models(response.json())
+        except httpx.ConnectError:
+            raise RuntimeError(CONNECTION_HELP)
+        except Exception as e:
+            raise RuntimeError(f"Failed to verify Ollama connection: {e}")
+
+    async def generate(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        conversation_history: Optional[List[Dict]] = None,
+        context: Optional[List[int]] = None,
+        model: Optional[str] = None,
+        use_cache: bool = True,
+        priority: Optional[str] = None,
+        **kwargs
+    ) -> Dict:
+        """
+        Generate response from the model.
+
+        Args:
+            prompt: User input prompt
+            system_prompt: System prompt for behavior
+            conversation_history: Previous conversation turns
+            context: Context tokens returned by the previous turn
+            model: Model to use instead of MODEL_NAME
+            use_cache: Read and write the response cache (if enabled)
+            priority: Scheduling class (see ModelProvider.generate)
+            **kwargs: Additional parameters to override defaults
+
+        Returns:
+            Dict containing response and metadata
+        """
+        start_time = time.time()
+        deadline = start_time + self.request_deadline_seconds
+        request_data, prompt_info = self._build_request(
+            prompt, system_prompt, conversation_history,
+            stream=False, context=context, model=model, **kwargs
+        )
+
+        if use_cache:
+            cached = self._cached_result(request_data, start_time)
+            if cached is not None:
+                return cached
+
+        async def send() -> Dict:
+            self.breaker.check()
+            async with self.scheduler.aslot(
+                priority, request_data["model"], deadline - time.time()
+            ) as slot:
+                with self.breaker.guard():
+                    result = await self._post_generate(
+                        request_data, start_time, prompt_info, deadline
+                    )
+            self._add_schedule(result, slot)
+            if use_cache:
+                self._store_result(request_data, result)
+            return result
+
+        if self.single_flight is None or request_data["options"]["temperature"] != 0:
+            return await send()
+
+        result, shared = await self.single_flight.do(
+            ResponseCache.make_key(request_data), send
+        )
+        if shared:
+            result["coalesced"] = True
+            result["latency_ms"] = int((time.time() - start_time) * 1000)
+            logger.info("Shared an identical in-flight model request")
+        return result
+
+    async def _post_generate(
+        self, request_data: Dict, start_time: float, prompt_info: Dict, deadline: float
+    ) -> Dict:
+        """
+        Send one non-streaming /api/generate request (with retries).
+
+        Args:
+            request_data: Request body
+            start_time: time.time() when the request started
+            prompt_info: Prompt size report from _build_request()
+            deadline: time.time() by which the call has to finish
+
+        Returns:
+            Formatted result
+        """
+        try:
+            logger.debug(f"Sending request to model: {json.dumps(request_data, indent=2)}")
+
+            response, retry_info = await asyncio.wait_for(
+                self._post_with_retry("/api/generate", request_data, deadline),
+                timeout=max(deadline - time.time(), 0.0),
+            )
+            result = self._format_result(response.json(), request_data, start_time, prompt_info)
+            result.update(retry_info)
+            return result
+
+        except (asyncio.TimeoutError, httpx.TimeoutException):
+            logger.error(f"Model request timed out after {self.request_deadline_seconds}s")
+            raise TimeoutError(
+                f"Model generation timed out after {self.request_deadline_seconds}s"
+            )
+        except httpx.HTTPError as e:
+            logger.error(f"Model request failed: {e}")
+            raise RuntimeError(f"Failed to generate response: {e}")
+
+    async def generate_stream(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        conversation_history: Optional[List[Dict]] = None,
+        context: Optional[List[int]] = None,
+        model: Optional[str] = None,
+        use_cache: bool = True,
+        priority: Optional[str] = None,
+        **kwargs
+    ) -> AsyncIterator[Dict]:
+        """
+        Generate a response token by token (see ModelProvider.generate_stream).
+
+        The whole stream, slot wait included, is bounded by
+        request_deadline_seconds like generate(); closing the iterator
+        early aborts the request.
+
+        Args:
+            prompt: User input prompt
+            system_prompt: System prompt for behavior
+            conversation_history: Previous conversation turns
+            context: Context tokens returned by the previous turn
+            model: Model to use instead of MODEL_NAME
+            use_cache: Read and write the response cache (if enabled)
+            priority: Scheduling class (see ModelProvider.generate)
+            **kwargs: Additional parameters to override defaults
+
+        Yields:
+            Token chunks, then the final response dict
+        """
+        start_time = time.time()
+        deadline = start_time + self.request_deadline_seconds
+        request_data, prompt_info = self._build_request(
+            prompt, system_prompt, conversation_history,
+            stream=True, context=context, model=model, **kwargs
+        )
+
+        if use_cache:
+            cached = self._cached_result(request_data, start_time)
+            if cached is not None:
+                cached["ttft_ms"] = cached["latency_ms"]
+                yield {"token": cached["response"], "done": False}
+                yield cached
+                return
+
+        try:
+            self.breaker.check()
+            async with self.scheduler.aslot(
+                priority, request_data["model"], deadline - time.time()
+            ) as slot:
+                with self.breaker.guard(), self.pool.lease() as endpoint:
+                    async with self.client.stream(
+                        "POST", f"{endpoint.url}/api/generate", json=request_data,
+                        timeout=httpx.Timeout(
+                            max(deadline - time.time(), 0.0), connect=5.0
+                        ),
+                    ) as response:
+                        response.raise_for_status()
+
+                        tokens = []
+                        ttft_ms = None
+                        chunk: Dict = {}
+                        async for line in _lines_until(response, deadline):
+                            if not line:
+                                continue
+                            chunk = json.loads(line)
+                            if "error" in chunk:
+                                raise RuntimeError(f"Model stream failed: {chunk['error']}")
+
+                            token = chunk.get("response", "")
+                            if token:
+                                if ttft_ms is None:
+                                    ttft_ms = int((time.time() - start_time) * 1000)
+                                tokens.append(token)
+                                yield {"token": token, "done": False}
+
+                            if chunk.get("done"):
+                                break
+                        else:
+                            raise RuntimeError("Model stream ended before completion")
+
+            result = self._format_result(
+                {**chunk, "response": "".join(tokens)}, request_data, start_time, prompt_info
+            )
+            result["ttft_ms"] = ttft_ms
+            self._add_schedule(result, slot)
+            if use_cache:
+                self._store_result(request_data, result)
+            yield result
+
+        except httpx.TimeoutException:
+            logger.error(f"Model stream timed out after {self.request_deadline_seconds}s")
+            raise TimeoutError(
+                f"Model generation timed out after {self.request_deadline_seconds}s"
+            )
+        except httpx.HTTPError as e:
+            logger.error(f"Model stream failed: {e}")
+            raise RuntimeError(f"Failed to generate response: {e}")
+
+    async def _post_with_retry(
+        self, path: str, request_data: Dict, deadline: float
+    ) -> Tuple[httpx.Response, Dict]:
+        """
+        POST with exponential backoff on retryable statuses and connect
+        errors, as long as another attempt fits in the deadline.
+
+        Args:
+            path: API path
+            request_data: JSON body
+            deadline: time.time() by which the call has to finish
+
+        Returns:
+            (successful response, {"attempts", "retry_ms"})
+
+        Raises:
+            httpx.HTTPError: If the last attempt fails
+        """
+        tried = []
+        attempts = 0
+        first_attempt = time.time()
+        while True:
+            attempts += 1
+            attempt_start = time.time()
+            try:
+                # Each attempt goes to the least busy endpoint not tried yet;
+                # retryable statuses count against the endpoint that returned them
+                with self.pool.lease(exclude=tried) as endpoint:
+                    response = await self.client.post(
+                        f"{endpoint.url}{path}", json=request_data
+                    )
+                    if response.status_code in RETRY_STATUS_CODES:
+                        response.raise_for_status()
+            except CONNECT_ERRORS + (httpx.HTTPStatusError,) as e:
+                tried.append(endpoint.url)
+                failover = (
+                    isinstance(e, CONNECT_ERRORS)
+                    and len(set(tried)) < len(self.pool.endpoints)
+                )
+                backoff = self._retry_backoff(attempts, deadline, endpoint, failover)
+                if backoff is None:
+                    raise
+                logger.warning(
+                    f"Retrying model request in {backoff:.1f}s "
+                    f"(attempt {attempts} on {endpoint.url} failed: {e})"
+                )
+            else:
+                response.raise_for_status()
+                return response, {
+                    "attempts": attempts,
+                    "retry_ms": int((attempt_start - first_attempt) * 1000),
+                }
+
+            await asyncio.sleep(backoff)
+
+    async def health_check(self) -> bool:
+        """
+        Check if model provider is healthy.
+
+        Returns:
+            True if healthy, False otherwise
+        """
+        for url in self.pool.urls:
+            try:
+                response = await self.client.get(f"{url}/api/tags", timeout=5)
+                if response.status_code == 200:
+                    return True
+            except httpx.HTTPError:
+                pass
+        return False
+
+    async def aclose(self):
+        """Close the connection pool."""
+        await self.client.aclose()
+
+
+# Singleton instance
+_async_provider_instance: Optional[AsyncModelProvider] = None
+
+
+async def get_async_provider() -> AsyncModelProvider:
+    """Get or create the singleton async provider (verified on creation)."""
+    global _async_provider_instance
+    if _async_provider_instance is None:
+        provider = AsyncModelProvider()
+        try:
+            await provider.verify_connection()
+        except Exception:
+            await provider.aclose()
+            raise
+        # Another task may have finished creating one while this one waited
+        if _async_provider_instance is None:
+            _async_provider_instance = provider
+        else:
+            await provider.aclose()
+    return _async_provider_instance
+
+
+def current_async_provider() -> Optional[AsyncModelProvider]:
+    """Return the singleton async provider if one was created, else None."""
+    return _async_provider_instance
+
+
+async def close_async_provider():
+    """Close the singleton async provider, if one was created."""
+    global _async_provider_instance
+    if _async_provider_instance is not None:
+        await _async_provider_instance.aclose()
+        _async_provider_instance = None
@@ -3,18 +3,23 @@ Chat engine module - orchestrates conversation flow with safety checks.
 Students must complete TODO sections to implement safe conversation management.
 """
 
+import asyncio
 import json
 import logging
 import time
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional
 
 from .config import (
     SYSTEM_PROMPT,
     MAX_CONVERSATION_TURNS,
+    MAX_TOKENS,
     CONTEXT_WINDOW_SIZE,
+    TIMEOUT_SECONDS,
 )
 from .model_provider import get_provider
+from .model_router import ModelRouter, RouteDecision
 from .moderation import (
+    EscalationTracker,
     ModerationAction,
     ModerationResult,
     get_moderator,
@@ -22,15 +27,45 @@ from .moderation import (
 
 logger = logging.getLogger(__name__)
 
+# Characters after which streamed text is moderated and released
+SENTENCE_ENDINGS = ".!?\n"
+
+# How the conversation is sent to the model each turn:
+# "transcript" re-sends the system prompt and the last CONTEXT_WINDOW_SIZE
+# messages as text; "context" sends only the new message on top of the
+# context tokens Ollama returned for the previous turn, so earlier turns
+# are not prefilled again. In "context" mode the model remembers the
+# conversation back to the last rebuild rather than a fixed window.
+CONVERSATION_MODE = "transcript"
+
+# Rebuild from the transcript once the reused context could overflow the
+# model's context window (Ollama's default num_ctx)
+MAX_REUSED_CONTEXT_TOKENS = 2048
+
 
 class ChatEngine:
     """Orchestrates conversation flow with safety checks."""
     
-    def __init__(self):
-        """Initialize chat engine with model and moderator."""
-        self.model = get_provider()
+    def __init__(self, background_startup: bool = False):
+        """
+        Initialize chat engine with model and moderator.
+
+        Args:
+            background_startup: Connect to and warm up the model in the
+                background instead of blocking until Ollama answers
+        """
+        self.model = get_provider(background=background_startup)
+        self.router = ModelRouter(self.model.list_models)
         self.moderator = get_moderator()
         self.conversation_history: List[Dict] = []
+        self.escalation = EscalationTracker(CONTEXT_WINDOW_SIZE)
+        self.conversation_mode = CONVERSATION_MODE
+        # Ollama context of the last turn, valid while the history is at
+        # the version it was recorded for
+        self.model_context: Optional[List[int]] = None
+        self.model_context_model: Optional[str] = None
+        self.model_context_version = -1
+        self.history_version = 0
         self.turn_count = 0 # number of user->assistant turns completed
         self.session_id = f"session_{int(time.time())}"
         self.first_interaction = True
@@ -182,16 +217,110 @@ class ChatEngine:
         # Step 3: Generate model response (input passed moderation)
         model_response = self._generate_response(
             user_input,
-            include_context
+            include_context,
+            input_moderation,
         )
         
-        # Step 4: Moderate model output
+        # Steps 4-7: moderate output, prepare response, update history
+        return self._complete_turn(
+            user_input, model_response, input_moderation, disclaimer, start_time
+        )
+
+    async def process_message_async(
+        self,
+        user_input: str,
+        include_context: bool = True,
+    ) -> Dict:
+        """
+        Process a message like process_message(), awaiting the model.
+
+        Moderation runs inline since it takes microseconds; only model
+        generation is awaited, so the event loop stays free while the model
+        runs. If the awaiting task is cancelled, the model request is
+        aborted and the conversation history is left unchanged.
+
+        Args:
+            user_input: User's message
+            include_context: Whether to include conversation history
+
+        Returns:
+            Same dict as process_message()
+        """
+        # httpx is only needed for async serving
+        from .async_model_provider import get_async_provider
+
+        start_time = time.time()
+
+        # Blocked and fallback replies involve no generation (the repeated
+        # input check is a cache hit)
+        input_moderation = self._moderate_input(user_input)
+        if input_moderation.action != ModerationAction.ALLOW:
+            return self.process_message(user_input, include_context)
+
+        try:
+            # Let background startup (and its warm-up) finish first
+            if not self.model.wait_until_ready(0):
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self.model.wait_until_ready, TIMEOUT_SECONDS
+                )
+            model = await get_async_provider()
+        except Exception as e:
+            model = None
+            model_response = self._error_response(e)
+
+        if model is not None:
+            args = self._generation_args(include_context)
+            decision = self._route(user_input, input_moderation, args)
+            with self.router.dispatch(decision) as route:
+                try:
+                    model_response = await model.generate(
+                        prompt=user_input, model=decision.model, **args
+                    )
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    model_response = self._error_response(e)
+                    route["error"] = True
+            model_response["route"] = route
+
+        # Decided after generation, so a cancelled turn shows it next time
+        disclaimer = None
+        if self.first_interaction:
+            self.first_interaction = False
+            disclaimer = self.moderator.get_disclaimer()
+
+        return self._complete_turn(
+            user_input, model_response, input_moderation, disclaimer, start_time
+        )
+
+    def _complete_turn(
+        self,
+        user_input: str,
+        model_response: Dict,
+        input_moderation: ModerationResult,
+        disclaimer: Optional[str],
+        start_time: float,
+    ) -> Dict:
+        """
+        Moderate a generated response and record the finished turn.
+
+        Args:
+            user_input: User's message
+            model_response: Result from the model provider
+            input_moderation: Result of the input check
+            disclaimer: Disclaimer to prepend, if first interaction
+            start_time: time.time() when processing started
+
+        Returns:
+            Final response dict with metadata
+        """
+        # Moderate model output
         output_moderation = self._moderate_output(
             user_input,
             model_response["response"]
         )
         
-        # Step 5: Prepare final response based on all moderation results
+        # Prepare final response based on all moderation results
         final_response = self._prepare_final_response(
             user_input=user_input,
             model_response=model_response,
@@ -203,16 +332,108 @@ class ChatEngine:
         if disclaimer:
             final_response["response"] = f"{disclaimer}\n\n---\n\n{final_response['response']}"
         
-        # Step 6: Update conversation history
+        # Update conversation history
         self._update_history(user_input, final_response["response"])
+        self._remember_context(model_response, final_response)
         
-        # Step 7: Add metadata
+        # Add metadata
         final_response["latency_ms"] = int((time.time() - start_time) * 1000)
         final_response["turn_count"] = self.turn_count
         final_response["session_id"] = self.session_id
+        final_response["context_reused"] = model_response.get("context_reused", False)
+        final_response["prompt_eval_count"] = model_response.get("prompt_eval_count", 0)
+        final_response["prompt_eval_ms"] = model_response.get("prompt_eval_duration", 0) / 1e6
+        final_response["prompt_tokens_est"] = model_response.get("prompt_tokens_est", 0)
+        final_response["history_dropped"] = model_response.get("history_dropped", 0)
+        final_response["timing"] = model_response.get("timing")
+        final_response["route"] = model_response.get("route")
         
         return final_response
     
+    def process_message_stream(
+        self,
+        user_input: str,
+        include_context: bool = True,
+    ) -> Iterator[Dict]:
+        """
+        Process a message like process_message(), streaming the reply.
+
+        Model output is released sentence by sentence, and only once the
+        text so far passes output moderation, so unsafe text is never sent.
+        The final event carries the authoritative response, which replaces
+        the streamed text if the complete output fails moderation.
+
+        Args:
+            user_input: User's message
+            include_context: Whether to include conversation history
+
+        Yields:
+            {"event": "token", "text": str} for released text, then
+            {"event": "done", ...} with the same keys as process_message()
+            plus "ttft_ms" (time until the first model text was released)
+        """
+        start_time = time.time()
+
+        # Blocked and fallback replies involve no generation, so there is
+        # nothing to stream (the repeated input check is a cache hit)
+        input_moderation = self._moderate_input(user_input)
+        if input_moderation.action != ModerationAction.ALLOW:
+            final_response = self.process_message(user_input, include_context)
+            final_response["ttft_ms"] = final_response["latency_ms"]
+            yield {"event": "done", **final_response}
+            return
+
+        disclaimer = None
+        if self.first_interaction:
+            self.first_interaction = False
+            disclaimer = self.moderator.get_disclaimer()
+
+        if disclaimer:
+            yield {"event": "token", "text": f"{disclaimer}\n\n---\n\n"}
+
+        # Stream model output, releasing text that passed moderation
+        ttft_ms = None
+        model_response = None
+        text = ""
+        released = 0
+        checked = 0
+        args = self._generation_args(include_context)
+        decision = self._route(user_input, input_moderation, args)
+        with self.router.dispatch(decision) as route:
+            try:
+                for chunk in self.model.generate_stream(
+                    prompt=user_input, model=decision.model, **args
+                ):
+                    if chunk["done"]:
+                        model_response = chunk
+                        break
+
+                    text += chunk["token"]
+                    boundary = max(text.rfind(c) for c in SENTENCE_ENDINGS) + 1
+                    if boundary <= checked:
+                        continue
+                    checked = boundary
+                    if self._moderate_output(
+                        user_input, text[:boundary]
+                    ).action == ModerationAction.ALLOW:
+                        if ttft_ms is None:
+                            ttft_ms = int((time.time() - start_time) * 1000)
+                        yield {"event": "token", "text": text[released:boundary]}
+                        released = boundary
+            except Exception as e:
+                model_response = self._error_response(e)
+
+            if model_response is None:
+                model_response = self._error_response(RuntimeError("Model stream ended early"))
+            route["error"] = "error" in model_response
+        model_response["route"] = route
+
+        final_response = self._complete_turn(
+            user_input, model_response, input_moderation, disclaimer, start_time
+        )
+        final_response["ttft_ms"] = ttft_ms
+        yield {"event": "done", **final_response}
+
     def _moderate_input(self, user_input: str) -> ModerationResult:
         """
         Implement input moderation.
@@ -221,51 +442,107 @@ class ChatEngine:
         - Considers conversation context
         - Returns moderation result
         """
-        # Get relevant context from conversation history
-        context = self.conversation_history[-CONTEXT_WINDOW_SIZE:] \
-            if self.conversation_history else None
-        
+        # The session's escalation tracker covers the same window as
+        # conversation_history[-CONTEXT_WINDOW_SIZE:] without rescanning it
         return self.moderator.moderate(
             user_prompt=user_input,
-            context=context,
+            escalation=self.escalation,
         )
     
     def _generate_response(
         self,
         user_input: str,
         include_context: bool,
+        input_moderation: ModerationResult,
     ) -> Dict:
         """
         Generate model response with appropriate prompting.
         
         - Builds prompt with system instructions
         - Includes relevant context
-        - Calls model provider
+        - Picks the model (see ModelRouter) and calls model provider
         - Handles errors gracefully
         """
-        try:
-            context = None
-            if include_context and self.conversation_history:
-                # Prepare context (last N turns)
-                context = self.conversation_history[-CONTEXT_WINDOW_SIZE:]
-            
-            response = self.model.generate(
-                prompt=user_input,
-                system_prompt=SYSTEM_PROMPT,
-                conversation_history=context,
-            )
-            
-            return response
-            
-        except Exception as e:
-            logger.error(f"Model generation failed: {e}")
-            # Return appropriate error response
-            return {
-                "response": "I apologize, but I'm having trouble processing your message. Please try again.",
-                "error": str(e),
-                "model": "error",
-                "deterministic": False,
-            }
+        args = self._generation_args(include_context)
+        decision = self._route(user_input, input_moderation, args)
+        with self.router.dispatch(decision) as route:
+            try:
+                response = self.model.generate(
+                    prompt=user_input,
+                    model=decision.model,
+                    **args,
+                )
+            except Exception as e:
+                response = self._error_response(e)
+                route["error"] = True
+        
+        response["route"] = route
+        return response
+
+    def _route(
+        self,
+        user_input: str,
+        input_moderation: ModerationResult,
+        generation_args: Dict,
+    ) -> RouteDecision:
+        """Choose the model for a turn (reused context stays with its model)."""
+        context_model = self.model_context_model if "context" in generation_args else None
+        return self.router.choose(user_input, input_moderation, context_model)
+
+    def _generation_args(self, include_context: bool) -> Dict:
+        """
+        Choose what to send the model for this turn.
+
+        Returns:
+            The previous turn's context tokens if they can be reused,
+            otherwise the system prompt and the last N messages
+        """
+        if include_context and self._reusable_context():
+            return {"context": self.model_context}
+
+        context = None
+        if include_context and self.conversation_history:
+            # Prepare context (last N turns)
+            context = self.conversation_history[-CONTEXT_WINDOW_SIZE:]
+        return {"system_prompt": SYSTEM_PROMPT, "conversation_history": context}
+
+    def _reusable_context(self) -> bool:
+        """Check whether the stored model context matches the history."""
+        return (
+            self.conversation_mode == "context"
+            and self.model_context is not None
+            # Anything added since (e.g. a blocked turn) is missing from it
+            and self.model_context_version == self.history_version
+            and len(self.model_context) + MAX_TOKENS <= MAX_REUSED_CONTEXT_TOKENS
+        )
+
+    def _remember_context(self, model_response: Dict, final_response: Dict):
+        """
+        Keep the model context of a finished turn for the next one.
+
+        The context holds the model's own answer, so it is only kept when
+        that answer is exactly what went into the history; a moderated,
+        rewritten or annotated reply forces a rebuild from the transcript.
+        """
+        self.model_context = None
+        if (
+            self.conversation_mode == "context"
+            and model_response.get("context")
+            and final_response["response"] == model_response.get("response")
+        ):
+            self.model_context = model_response["context"]
+            self.model_context_model = model_response.get("model")
+            self.model_context_version = self.history_version
+
+    def _error_response(self, error: Exception) -> Dict:
+        """Build the model response used when generation fails."""
+        logger.error(f"Model generation failed: {error}")
+        return {
+            "response": "I apologize, but I'm having trouble processing your message. Please try again.",
+            "error": str(error),
+            "model": "error",
+            "deterministic": False,
+        }
     
     def _moderate_output(
         self,
@@ -346,13 +623,13 @@ class ChatEngine:
         - Maintain maximum history size
         """
         # Add user message
-        self.conversation_history.append({
+        self._append_history({
             "role": "user",
             "content": user_input,
         })
         
         # Add assistant response
-        self.conversation_history.append({
+        self._append_history({
             "role": "assistant",
             "content": assistant_response,
         })
@@ -373,7 +650,7 @@ class ChatEngine:
             #    })
             #
             # Note: The warning message for approaching limit is already handled in _prepare_final_response()
-            self.conversation_history.append({
+            self._append_history({
                 "role": "system",
                 "content": "This conversation has reached its maximum length. Please start a new session for further discussion.",
             })
@@ -385,9 +662,17 @@ class ChatEngine:
             # Keep the most recent messages
             self.conversation_history = self.conversation_history[-max_history_size:]
     
+    def _append_history(self, turn: Dict):
+        """Append a message to history and to the escalation tracker."""
+        self.conversation_history.append(turn)
+        self.history_version += 1
+        self.moderator.record_turn(self.escalation, turn)
+
     def reset(self):
         """Reset conversation state."""
         self.conversation_history = []
+        self.escalation.reset()
+        self.model_context = None
         self.turn_count = 0
         self.first_interaction = True
         self.session_id = f"session_{int(time.time())}"
@@ -398,10 +683,16 @@ class ChatEngine:
 _engine_instance = None
 
 
-def get_engine() -> ChatEngine:
-    """Get or create singleton chat engine instance."""
+def get_engine(background_startup: bool = False) -> ChatEngine:
+    """
+    Get or create singleton chat engine instance.
+
+    Args:
+        background_startup: If creating it, start the model in the
+            background (see ChatEngine.__init__)
+    """
     global _engine_instance
     if _engine_instance is None:
-        _engine_instance = ChatEngine()
+        _engine_instance = ChatEngine(background_startup=background_startup)
         logger.info("Created new ChatEngine singleton instance")
     return _engine_instance
\ No newline at end of file
@@ -0,0 +1,237 @@
+"""
+Circuit breaker for the model backend.
+
+While Ollama is down or overloaded, every generation would otherwise go
+through its retries and the whole deadline before failing, and the
+waiting requests pile up threads and sockets. After enough consecutive
+failures the breaker opens and generations fail at once; after a
+cool-down it lets a few trial requests through (half-open) and closes
+again when they succeed.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+BREAKER_ENABLED = True
+
+# Consecutive failed generations that open the breaker
+FAILURE_THRESHOLD = 5
+
+# Seconds the breaker stays open before letting trial requests through
+OPEN_SECONDS = 15.0
+
+# Trial requests allowed at once while half-open, and how many of them
+# have to succeed to close the breaker
+HALF_OPEN_MAX_CALLS = 1
+SUCCESS_THRESHOLD = 1
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling the backend while the breaker is open."""
+
+    def __init__(self, retry_after: float):
+        """
+        Args:
+            retry_after: Seconds until trial requests are let through
+        """
+        super().__init__(
+            f"Model backend unavailable (circuit open, retry in {retry_after:.0f}s)"
+        )
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Thread-safe closed / open / half-open breaker.
+
+    Wrap each backend call in guard(), and call check() before waiting
+    for a model slot. Shared by the sync and the async provider, since
+    both talk to the same backend.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = FAILURE_THRESHOLD,
+        open_seconds: float = OPEN_SECONDS,
+        half_open_max_calls: int = HALF_OPEN_MAX_CALLS,
+        success_threshold: int = SUCCESS_THRESHOLD,
+        enabled: Optional[bool] = None,
+    ):
+        """
+        Args:
+            failure_threshold: Consecutive failures that open the breaker
+            open_seconds: Cool-down before trial requests
+            half_open_max_calls: Concurrent trial requests while half-open
+            success_threshold: Trial successes that close the breaker
+            enabled: If False, guard() never rejects (defaults to
+                BREAKER_ENABLED)
+        """
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+        self.success_threshold = success_threshold
+        self.enabled = BREAKER_ENABLED if enabled is None else enabled
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self._trials = 0
+        self._trial_successes = 0
+        self.rejected = 0
+        self.times_opened = 0
+
+    def _admit(self) -> bool:
+        """
+        Let a call through or reject it (caller holds the lock).
+
+        Returns:
+            Whether the call is a half-open trial
+
+        Raises:
+            CircuitOpenError: If the call is rejected
+        """
+        if self.state == OPEN:
+            retry_after = self.opened_at + self.open_seconds - time.time()
+            if retry_after > 0:
+                self.rejected += 1
+                raise CircuitOpenError(retry_after)
+            self._transition(HALF_OPEN)
+
+        if self.state == HALF_OPEN:
+            if self._trials >= self.half_open_max_calls:
+                self.rejected += 1
+                raise CircuitOpenError(0.0)
+            self._trials += 1
+            return True
+        return False
+
+    def _transition(self, state: str):
+        """Switch state (caller holds the lock)."""
+        logger.warning(f"Model circuit breaker {self.state} -> {state}")
+        self.state = state
+        self._trials = 0
+        self._trial_successes = 0
+        if state == OPEN:
+            self.opened_at = time.time()
+            self.times_opened += 1
+        elif state == CLOSED:
+            self.consecutive_failures = 0
+            self.opened_at = None
+
+    def _record(self, trial: bool, ok: Optional[bool]):
+        """
+        Record the outcome of an admitted call.
+
+        Args:
+            trial: The call was a half-open trial
+            ok: Whether it succeeded, or None if it was abandoned by the
+                caller (it then says nothing about the backend)
+        """
+        with self._lock:
+            if trial and self.state == HALF_OPEN:
+                self._trials = max(self._trials - 1, 0)
+            if ok is None:
+                return
+            if ok:
+                self.consecutive_failures = 0
+                if trial and self.state == HALF_OPEN:
+                    self._trial_successes += 1
+                    if self._trial_successes >= self.success_threshold:
+                        self._transition(CLOSED)
+                return
+
+            self.consecutive_failures += 1
+            if self.state == HALF_OPEN or (
+                self.state == CLOSED and self.consecutive_failures >= self.failure_threshold
+            ):
+                self._transition(OPEN)
+
+    def check(self):
+        """
+        Fail fast while the breaker is open, without admitting a call.
+
+        Raises:
+            CircuitOpenError: While the breaker is open and cooling down
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            if self.state == OPEN:
+                retry_after = self.opened_at + self.open_seconds - time.time()
+                if retry_after > 0:
+                    self.rejected += 1
+                    raise CircuitOpenError(retry_after)
+
+    @contextmanager
+    def guard(self) -> Iterator[None]:
+        """
+        Run one backend call under the breaker.
+
+        Leaving the block with an exception counts as a failure, except
+        when the caller stopped waiting (cancellation, or a streaming
+        consumer closing the generator).
+
+        Raises:
+            CircuitOpenError: At once, without running the block, while
+                the breaker is open
+        """
+        if not self.enabled:
+            yield
+            return
+
+        with self._lock:
+            trial = self._admit()
+        ok: Optional[bool] = False
+        try:
+            yield
+            ok = True
+        except (GeneratorExit, asyncio.CancelledError):
+            ok = None
+            raise
+        finally:
+            self._record(trial, ok)
+
+    def stats(self) -> Dict:
+        """
+        Return the breaker state for monitoring.
+
+        Returns:
+            {"enabled", "state", "consecutive_failures", "retry_after",
+            "times_opened", "rejected"}
+        """
+        with self._lock:
+            retry_after = None
+            if self.state == OPEN:
+                retry_after = round(max(self.opened_at + self.open_seconds - time.time(), 0.0), 1)
+            return {
+                "enabled": self.enabled,
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "retry_after": retry_after,
+                "times_opened": self.times_opened,
+                "rejected": self.rejected,
+            }
+
+
+# Singleton instance
+_breaker_instance: Optional[CircuitBreaker] = None
+_breaker_lock = threading.Lock()
+
+
+def get_circuit_breaker() -> CircuitBreaker:
+    """Get or create the process-wide breaker for the model backend."""
+    global _breaker_instance
+    with _breaker_lock:
+        if _breaker_instance is None:
+            _breaker_instance = CircuitBreaker()
+        return _breaker_instance
@@ -0,0 +1,235 @@
+"""
+Load balancing over several Ollama endpoints.
+
+Large machines can run one Ollama instance per group of cores on different
+ports. The pool sends each request to the healthy endpoint with the fewest
+requests outstanding (ties go to the lower recent latency), checks every
+endpoint in the background, and leaves out endpoints that stop answering
+until they pass a check again.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Container, Dict, Iterator, List, Optional
+
+import requests
+
+from .config import MODEL_ENDPOINT
+
+logger = logging.getLogger(__name__)
+
+# Ollama instances to spread requests over, e.g.
+# [MODEL_ENDPOINT, "http://localhost:11435", "http://localhost:11436"]
+MODEL_ENDPOINTS = [MODEL_ENDPOINT]
+
+# Seconds between background health checks (only run with 2+ endpoints)
+HEALTH_CHECK_SECONDS = 10.0
+
+# Consecutive failed requests after which an endpoint is left out until it
+# passes a health check
+UNHEALTHY_AFTER_FAILURES = 3
+
+# Weight of the newest request in the moving latency average
+LATENCY_EWMA_ALPHA = 0.2
+
+
+class Endpoint:
+    """One Ollama instance and its load and latency counters."""
+
+    def __init__(self, url: str):
+        """
+        Args:
+            url: Base URL, e.g. http://localhost:11434
+        """
+        self.url = url.rstrip("/")
+        self.healthy = True
+        self.outstanding = 0
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.latency_ewma_ms: Optional[float] = None
+        self.last_check: Optional[float] = None
+
+    def snapshot(self) -> Dict:
+        """Copy the counters."""
+        return {
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "errors": self.errors,
+            "latency_ewma_ms": (
+                round(self.latency_ewma_ms, 1) if self.latency_ewma_ms is not None else None
+            ),
+            "last_check": self.last_check,
+        }
+
+
+def _check_endpoint(url: str) -> bool:
+    """Health check: Ollama answers /api/tags."""
+    try:
+        return requests.get(f"{url}/api/tags", timeout=5).status_code == 200
+    except requests.exceptions.RequestException:
+        return False
+
+
+class EndpointPool:
+    """
+    Thread-safe least-outstanding-requests balancer.
+
+    Used by both the sync and the async provider, so the outstanding
+    counts cover all requests made by the process.
+    """
+
+    def __init__(
+        self,
+        urls: List[str],
+        health_check: Callable[[str], bool] = _check_endpoint,
+        health_check_seconds: float = HEALTH_CHECK_SECONDS,
+    ):
+        """
+        Args:
+            urls: Endpoint base URLs (at least one)
+            health_check: Returns whether an endpoint URL is healthy
+            health_check_seconds: Interval of the background checks
+        """
+        if not urls:
+            raise ValueError("EndpointPool needs at least one endpoint")
+        self.endpoints = [Endpoint(url) for url in urls]
+        self._health_check = health_check
+        self._health_check_seconds = health_check_seconds
+        self._lock = threading.Lock()
+        self._checker: Optional[threading.Thread] = None
+
+    @property
+    def urls(self) -> List[str]:
+        return [endpoint.url for endpoint in self.endpoints]
+
+    def acquire(self, exclude: Container[str] = ()) -> Endpoint:
+        """
+        Pick an endpoint and count a request as outstanding on it.
+
+        Args:
+            exclude: URLs to avoid (e.g. already tried for this request),
+                unless no other endpoint is left
+
+        Returns:
+            The healthy endpoint with the fewest outstanding requests (all
+            endpoints are candidates if none is healthy)
+        """
+        with self._lock:
+            untried = [e for e in self.endpoints if e.url not in exclude] or self.endpoints
+            candidates = [e for e in untried if e.healthy] or untried
+            endpoint = min(
+                candidates,
+                key=lambda e: (e.outstanding, e.latency_ewma_ms or 0.0),
+            )
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def release(self, endpoint: Endpoint, latency_ms: float, ok: Optional[bool]):
+        """
+        Finish a request started with acquire().
+
+        Args:
+            endpoint: Endpoint from acquire()
+            latency_ms: Request latency
+            ok: False if the request failed, or None if it was abandoned
+                by the caller (it then says nothing about the endpoint's
+                health or latency)
+        """
+        with self._lock:
+            endpoint.outstanding -= 1
+            if ok is None:
+                return
+            if ok:
+                endpoint.consecutive_failures = 0
+                if endpoint.latency_ewma_ms is None:
+                    endpoint.latency_ewma_ms = latency_ms
+                else:
+                    endpoint.latency_ewma_ms += LATENCY_EWMA_ALPHA * (
+                        latency_ms - endpoint.latency_ewma_ms
+                    )
+                return
+
+            endpoint.errors += 1
+            endpoint.consecutive_failures += 1
+            if endpoint.healthy and endpoint.consecutive_failures >= UNHEALTHY_AFTER_FAILURES:
+                endpoint.healthy = False
+                logger.warning(
+                    f"Endpoint {endpoint.url} marked unhealthy after "
+                    f"{endpoint.consecutive_failures} failed requests"
+                )
+
+    @contextmanager
+    def lease(self, exclude: Container[str] = ()) -> Iterator[Endpoint]:
+        """
+        Hold an endpoint for one request (see acquire()).
+
+        Leaving the block with an exception counts as a failed request.
+        When the caller stopped waiting (cancellation, or a streaming
+        consumer closing the generator), the request counts neither way.
+        """
+        endpoint = self.acquire(exclude)
+        start = time.time()
+        ok: Optional[bool] = False
+        try:
+            yield endpoint
+            ok = True
+        except (GeneratorExit, asyncio.CancelledError):
+            ok = None
+            raise
+        finally:
+            self.release(endpoint, (time.time() - start) * 1000, ok)
+
+    def check_all(self):
+        """Health-check every endpoint now and update its state."""
+        for endpoint in self.endpoints:
+            healthy = self._health_check(endpoint.url)
+            with self._lock:
+                if healthy != endpoint.healthy:
+                    logger.info(
+                        f"Endpoint {endpoint.url} is "
+                        f"{'healthy again' if healthy else 'unhealthy'}"
+                    )
+                endpoint.healthy = healthy
+                endpoint.last_check = time.time()
+                if healthy:
+                    endpoint.consecutive_failures = 0
+
+    def start_health_checks(self):
+        """Start the background checker (once; not needed for one endpoint)."""
+        if self._checker is not None or len(self.endpoints) < 2:
+            return
+        self._checker = threading.Thread(
+            target=self._run_health_checks, name="endpoint-health", daemon=True
+        )
+        self._checker.start()
+
+    def _run_health_checks(self):
+        while True:
+            self.check_all()
+            time.sleep(self._health_check_seconds)
+
+    def stats(self) -> Dict[str, Dict]:
+        """Return per-endpoint health, queue depth and latency."""
+        with self._lock:
+            return {endpoint.url: endpoint.snapshot() for endpoint in self.endpoints}
+
+
+# Singleton instance
+_pool_instance: Optional[EndpointPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_endpoint_pool() -> EndpointPool:
+    """Get or create the process-wide pool over MODEL_ENDPOINTS."""
+    global _pool_instance
+    with _pool_lock:
+        if _pool_instance is None:
+            _pool_instance = EndpointPool(MODEL_ENDPOINTS)
+            _pool_instance.start_health_checks()
+        return _pool_instance
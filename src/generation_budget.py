@@ -0,0 +1,158 @@
+"""
+Generation budgets: stop sequences and num_predict per request class.
+
+The prompt is a transcript of "User:" / "Assistant:" lines, and without
+stop sequences the model can go on writing the user's next turn (and its
+own answer to it) until num_predict runs out. The controller adds stop
+sequences for the transcript markers, lowers num_predict for messages
+that only need a short reply (greetings, thanks), and counts how often
+replies are cut off by num_predict, so the budgets can be tuned.
+"""
+
+import re
+import threading
+from typing import Dict, List, Optional
+
+from .config import MAX_TOKENS
+
+BUDGET_ENABLED = True
+
+# Lines that start a new part of the transcript; the reply ends before them
+STOP_SEQUENCES = ["\nUser:", "\nAssistant:", "\n### Response ###"]
+
+# num_predict per request class (never above the configured num_predict)
+REQUEST_BUDGETS = {
+    "greeting": 96,
+    "reflective": MAX_TOKENS,
+}
+
+# Messages made only of these words (at most GREETING_MAX_WORDS of them)
+# are greetings, thanks or goodbyes
+GREETING_WORDS = frozenset(
+    "hi hello hey hiya there good morning afternoon evening night thanks thank "
+    "you so much a lot again bye goodbye see later ok okay cool great nice".split()
+)
+GREETING_MAX_WORDS = 5
+
+_WORD_PATTERN = re.compile(r"[a-z']+")
+
+
+class BudgetController:
+    """
+    Thread-safe generation budget controller.
+
+    apply() sets the request options for a message, and record() counts
+    the outcome of each generation.
+    """
+
+    def __init__(
+        self,
+        budgets: Optional[Dict[str, int]] = None,
+        stop_sequences: Optional[List[str]] = None,
+        enabled: Optional[bool] = None,
+    ):
+        """
+        Args:
+            budgets: Request class -> num_predict (defaults to REQUEST_BUDGETS)
+            stop_sequences: Stop sequences to add (defaults to STOP_SEQUENCES)
+            enabled: If False, requests are only classified, never changed
+                (defaults to BUDGET_ENABLED)
+        """
+        self.budgets = dict(budgets or REQUEST_BUDGETS)
+        self.stop_sequences = list(STOP_SEQUENCES if stop_sequences is None else stop_sequences)
+        self.enabled = BUDGET_ENABLED if enabled is None else enabled
+        self._lock = threading.Lock()
+        # request class -> [generations, truncated]
+        self._stats: Dict[str, list] = {name: [0, 0] for name in self.budgets}
+
+    def classify(self, user_input: str) -> str:
+        """Return the request class of a message ("greeting" or "reflective")."""
+        words = _WORD_PATTERN.findall(user_input.lower())
+        if 0 < len(words) <= GREETING_MAX_WORDS and all(w in GREETING_WORDS for w in words):
+            return "greeting"
+        return "reflective"
+
+    def apply(self, user_input: str, options: Dict, overrides: Dict) -> Dict:
+        """
+        Add the budget for a message to the request options.
+
+        Args:
+            user_input: User's message
+            options: Request options, changed in place
+            overrides: Options given explicitly by the caller (left alone)
+
+        Returns:
+            Budget report for the result metadata: "request_class" and
+            "added", the options set by the controller
+        """
+        request_class = self.classify(user_input)
+        added = {}
+        if self.enabled:
+            if "stop" not in overrides and self.stop_sequences:
+                added["stop"] = list(self.stop_sequences)
+            num_predict = min(self.budgets[request_class], options["num_predict"])
+            if "num_predict" not in overrides and num_predict != options["num_predict"]:
+                added["num_predict"] = num_predict
+            options.update(added)
+        return {"request_class": request_class, "added": added}
+
+    def record(self, budget: Dict, done_reason: Optional[str]) -> Dict:
+        """
+        Count one finished generation.
+
+        Args:
+            budget: Report from apply()
+            done_reason: Ollama's done_reason ("length" when num_predict
+                cut the reply off)
+
+        Returns:
+            The report with "done_reason" and "truncated" added
+        """
+        truncated = done_reason == "length"
+        with self._lock:
+            entry = self._stats.setdefault(budget["request_class"], [0, 0])
+            entry[0] += 1
+            entry[1] += truncated
+        return {**budget, "done_reason": done_reason, "truncated": truncated}
+
+    def stats(self) -> Dict:
+        """
+        Return truncation counters.
+
+        Returns:
+            {"enabled", "generations", "truncated", "truncation_rate",
+            "classes": {name: {"num_predict", "generations", "truncated",
+            "truncation_rate"}}}
+        """
+        with self._lock:
+            generations = sum(entry[0] for entry in self._stats.values())
+            truncated = sum(entry[1] for entry in self._stats.values())
+            return {
+                "enabled": self.enabled,
+                "generations": generations,
+                "truncated": truncated,
+                "truncation_rate": truncated / generations if generations else 0.0,
+                "classes": {
+                    name: {
+                        "num_predict": self.budgets.get(name),
+                        "generations": count,
+                        "truncated": cut,
+                        "truncation_rate": cut / count if count else 0.0,
+                    }
+                    for name, (count, cut) in self._stats.items()
+                },
+            }
+
+
+# Singleton instance
+_controller_instance: Optional[BudgetController] = None
+_controller_lock = threading.Lock()
+
+
+def get_budget_controller() -> BudgetController:
+    """Get or create the process-wide budget controller."""
+    global _controller_instance
+    with _controller_lock:
+        if _controller_instance is None:
+            _controller_instance = BudgetController()
+        return _controller_instance
@@ -0,0 +1,343 @@
+"""
+Priority scheduling of generations onto a fixed number of upstream slots.
+
+Ollama runs a fixed number of requests in parallel per model
+(OLLAMA_NUM_PARALLEL) and queues the rest first come, first served, so
+a batch job can hold every slot while live users wait. The scheduler
+keeps one bounded queue per priority class and only lets as many
+generations through as Ollama runs at once, taking interactive requests
+before batch ones.
+
+Ollama has no multi-prompt request, but parallel requests for the same
+loaded model are decoded together. When a slot frees up, a queued
+request for a model that is already running goes first (for at most
+AFFINITY_WAIT_MS past the oldest request), so requests for one model
+share a batch instead of being interleaved with requests that make
+Ollama switch models. (Identical deterministic requests are already
+merged into one upstream call by single_flight.py.)
+
+Slots, queues and priorities only apply within one process: they do not
+limit another process using the same Ollama, such as scripts/evaluate.py
+run next to the server. Batch work that must not compete with live
+users has to go through the server's process.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import Counter, deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Callable, Dict, Hashable, Iterator, Optional
+
+from .endpoint_pool import get_endpoint_pool
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_ENABLED = True
+
+# Requests each Ollama endpoint runs in parallel (OLLAMA_NUM_PARALLEL);
+# the scheduler has this many slots per endpoint
+SLOTS_PER_ENDPOINT = 4
+
+# Priority classes, most urgent first
+PRIORITIES = ["interactive", "batch"]
+DEFAULT_PRIORITY = "interactive"
+
+# Slots a class may hold at once, and requests it may have waiting
+MAX_SLOTS = {"interactive": None, "batch": 1}  # None: all slots
+MAX_QUEUED = {"interactive": 64, "batch": 256}
+
+# How long the oldest request of a class may be passed over by requests
+# that join a batch already running upstream
+AFFINITY_WAIT_MS = 250
+
+
+class QueueFullError(RuntimeError):
+    """Raised when a priority class already has MAX_QUEUED requests waiting."""
+
+
+class _Ticket:
+    """One request waiting for, or holding, a slot."""
+
+    def __init__(self, priority: str, batch_key: Hashable, wake: Callable[[], None]):
+        self.priority = priority
+        self.batch_key = batch_key
+        self.wake = wake
+        self.enqueued = time.time()
+        self.granted = False
+        self.queue_ms = 0
+        self.batch_size = 1
+
+    def info(self) -> Dict:
+        """Scheduling metadata for the result."""
+        return {
+            "priority": self.priority,
+            "queue_ms": self.queue_ms,
+            "batch_size": self.batch_size,
+        }
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class GenerationScheduler:
+    """
+    Thread-safe priority scheduler for sync and async callers.
+
+    Hold slot() (threads) or aslot() (asyncio) around each upstream
+    generation; both draw on the same slots.
+    """
+
+    def __init__(
+        self,
+        slots: int,
+        max_slots: Optional[Dict[str, Optional[int]]] = None,
+        max_queued: Optional[Dict[str, int]] = None,
+        enabled: Optional[bool] = None,
+    ):
+        """
+        Args:
+            slots: Generations allowed upstream at once
+            max_slots: Priority class -> slots it may hold (None: all;
+                defaults to MAX_SLOTS)
+            max_queued: Priority class -> queue bound (defaults to MAX_QUEUED)
+            enabled: If False, slot() never waits (defaults to
+                SCHEDULER_ENABLED)
+        """
+        self.slots = slots
+        limits = MAX_SLOTS if max_slots is None else max_slots
+        self.max_slots = {p: limits.get(p) or slots for p in PRIORITIES}
+        self.max_queued = dict(MAX_QUEUED if max_queued is None else max_queued)
+        self.enabled = SCHEDULER_ENABLED if enabled is None else enabled
+        self.default_priority = DEFAULT_PRIORITY
+        self._lock = threading.Lock()
+        self._queues = {p: deque() for p in PRIORITIES}
+        self._running = {p: 0 for p in PRIORITIES}
+        self._running_keys: Counter = Counter()
+        self.in_use = 0
+        # priority -> [dispatched, rejected, batched, total queue ms, max queue ms]
+        self._stats: Dict[str, list] = {p: [0, 0, 0, 0, 0] for p in PRIORITIES}
+
+    def _enqueue(
+        self, priority: Optional[str], batch_key: Hashable, wake: Callable[[], None]
+    ) -> _Ticket:
+        """Queue a request and dispatch whatever fits now."""
+        priority = priority or self.default_priority
+        if priority not in self._queues:
+            raise ValueError(f"Unknown priority {priority!r}, expected one of {PRIORITIES}")
+
+        with self._lock:
+            queue = self._queues[priority]
+            if len(queue) >= self.max_queued[priority]:
+                self._stats[priority][1] += 1
+                raise QueueFullError(
+                    f"Too many {priority} model requests waiting ({len(queue)})"
+                )
+            ticket = _Ticket(priority, batch_key, wake)
+            queue.append(ticket)
+            self._dispatch()
+            return ticket
+
+    def _dispatch(self):
+        """Grant free slots, most urgent class first (caller holds the lock)."""
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            while (
+                queue
+                and self.in_use < self.slots
+                and self._running[priority] < self.max_slots[priority]
+            ):
+                ticket = self._next(queue)
+                queue.remove(ticket)
+                self._grant(ticket)
+
+    def _next(self, queue: deque) -> _Ticket:
+        """
+        Pick the request to dispatch from a class's queue.
+
+        Returns:
+            The oldest request, unless it would start a new batch and has
+            waited less than AFFINITY_WAIT_MS while a later request can
+            join a running batch
+        """
+        head = queue[0]
+        if (
+            head.batch_key in self._running_keys
+            or (time.time() - head.enqueued) * 1000 >= AFFINITY_WAIT_MS
+        ):
+            return head
+        for ticket in queue:
+            if ticket.batch_key in self._running_keys:
+                return ticket
+        return head
+
+    def _grant(self, ticket: _Ticket):
+        """Give a ticket a slot and wake its caller (caller holds the lock)."""
+        ticket.granted = True
+        ticket.queue_ms = int((time.time() - ticket.enqueued) * 1000)
+        self.in_use += 1
+        self._running[ticket.priority] += 1
+        self._running_keys[ticket.batch_key] += 1
+        # Requests for the same model upstream together, this one included
+        ticket.batch_size = self._running_keys[ticket.batch_key]
+        entry = self._stats[ticket.priority]
+        entry[0] += 1
+        entry[2] += ticket.batch_size > 1
+        entry[3] += ticket.queue_ms
+        entry[4] = max(entry[4], ticket.queue_ms)
+        ticket.wake()
+
+    def _release(self, ticket: _Ticket):
+        """Free a granted ticket's slot and dispatch the next requests."""
+        with self._lock:
+            self.in_use -= 1
+            self._running[ticket.priority] -= 1
+            self._running_keys[ticket.batch_key] -= 1
+            if not self._running_keys[ticket.batch_key]:
+                del self._running_keys[ticket.batch_key]
+            self._dispatch()
+
+    def _withdraw(self, ticket: _Ticket) -> bool:
+        """
+        Take a ticket out of its queue.
+
+        Returns:
+            False if it was granted a slot meanwhile (the caller then owns
+            the slot)
+        """
+        with self._lock:
+            if ticket.granted:
+                return False
+            self._queues[ticket.priority].remove(ticket)
+            return True
+
+    @contextmanager
+    def slot(
+        self,
+        priority: Optional[str] = None,
+        batch_key: Hashable = None,
+        timeout: Optional[float] = None,
+    ) -> Iterator[Dict]:
+        """
+        Wait for an upstream slot and hold it for the block.
+
+        Args:
+            priority: Priority class (defaults to default_priority)
+            batch_key: Requests with equal keys (e.g. the same model) are
+                decoded together upstream
+            timeout: Seconds to wait at most (None waits forever)
+
+        Yields:
+            {"priority", "queue_ms", "batch_size"} - batch_size counts the
+            requests with this batch key upstream when the slot was granted
+
+        Raises:
+            QueueFullError: If the class's queue is full
+            TimeoutError: If no slot was free within timeout
+        """
+        if not self.enabled:
+            yield {"priority": priority or self.default_priority, "queue_ms": 0, "batch_size": 1}
+            return
+
+        granted = threading.Event()
+        ticket = self._enqueue(priority, batch_key, granted.set)
+        if not granted.wait(None if timeout is None else max(timeout, 0.0)):
+            if self._withdraw(ticket):
+                raise TimeoutError(
+                    f"No model slot free within {timeout:.1f}s ({ticket.priority})"
+                )
+        try:
+            yield ticket.info()
+        finally:
+            self._release(ticket)
+
+    @asynccontextmanager
+    async def aslot(
+        self,
+        priority: Optional[str] = None,
+        batch_key: Hashable = None,
+        timeout: Optional[float] = None,
+    ) -> AsyncIterator[Dict]:
+        """
+        Async version of slot(); cancelling the waiting task leaves the queue.
+
+        Raises:
+            QueueFullError: If the class's queue is full
+            TimeoutError: If no slot was free within timeout
+        """
+        if not self.enabled:
+            yield {"priority": priority or self.default_priority, "queue_ms": 0, "batch_size": 1}
+            return
+
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+        ticket = self._enqueue(
+            priority, batch_key, lambda: loop.call_soon_threadsafe(_resolve, granted)
+        )
+        try:
+            await asyncio.wait_for(
+                granted, None if timeout is None else max(timeout, 0.0)
+            )
+        except (asyncio.CancelledError, asyncio.TimeoutError) as e:
+            if self._withdraw(ticket):
+                if isinstance(e, asyncio.TimeoutError):
+                    raise TimeoutError(
+                        f"No model slot free within {timeout:.1f}s ({ticket.priority})"
+                    )
+                raise
+            if isinstance(e, asyncio.CancelledError):
+                self._release(ticket)
+                raise
+            # Granted just as the wait timed out: use the slot
+        try:
+            yield ticket.info()
+        finally:
+            self._release(ticket)
+
+    def stats(self) -> Dict:
+        """
+        Return queue and slot counters.
+
+        Returns:
+            {"enabled", "slots", "in_use", "classes": {priority: {"queued",
+            "running", "max_slots", "dispatched", "rejected", "batched",
+            "mean_queue_ms", "max_queue_ms"}}}
+        """
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "slots": self.slots,
+                "in_use": self.in_use,
+                "classes": {
+                    priority: {
+                        "queued": len(self._queues[priority]),
+                        "running": self._running[priority],
+                        "max_slots": self.max_slots[priority],
+                        "dispatched": dispatched,
+                        "rejected": rejected,
+                        "batched": batched,
+                        "mean_queue_ms": round(total / dispatched, 1) if dispatched else 0.0,
+                        "max_queue_ms": max_ms,
+                    }
+                    for priority, (dispatched, rejected, batched, total, max_ms)
+                    in self._stats.items()
+                },
+            }
+
+
+# Singleton instance
+_scheduler_instance: Optional[GenerationScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> GenerationScheduler:
+    """Get or create the process-wide scheduler (SLOTS_PER_ENDPOINT per endpoint)."""
+    global _scheduler_instance
+    with _scheduler_lock:
+        if _scheduler_instance is None:
+            slots = SLOTS_PER_ENDPOINT * len(get_endpoint_pool().endpoints)
+            _scheduler_instance = GenerationScheduler(slots)
+        return _scheduler_instance
@@ -0,0 +1,164 @@
+"""
+Timing breakdown of model generations.
+
+Ollama reports how long each phase of a generation took: loading the model,
+evaluating the prompt (prefill) and generating tokens (decode).
+GenerationTiming keeps those fields for one response, with derived
+tokens/s, and TimingStats aggregates them over the process, so slow turns
+can be traced to model reloads, long prompts or slow decoding.
+"""
+
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+# Durations from Ollama are in nanoseconds
+NS_PER_MS = 1e6
+NS_PER_SECOND = 1e9
+
+
+def _rate(tokens: int, duration_ns: int) -> float:
+    """Tokens per second, or 0.0 without a duration."""
+    return tokens * NS_PER_SECOND / duration_ns if duration_ns > 0 else 0.0
+
+
+@dataclass(frozen=True)
+class GenerationTiming:
+    """Phase durations (ns) and token counts of one Ollama response."""
+    total_ns: int = 0
+    load_ns: int = 0
+    prompt_eval_count: int = 0
+    prompt_eval_ns: int = 0
+    eval_count: int = 0
+    eval_ns: int = 0
+
+    @classmethod
+    def from_response(cls, result: Dict) -> "GenerationTiming":
+        """
+        Read the timing fields of a final /api/generate response object.
+
+        Args:
+            result: Parsed response (or last stream chunk)
+
+        Returns:
+            Timing, with missing fields as 0
+        """
+        return cls(
+            total_ns=result.get("total_duration") or 0,
+            load_ns=result.get("load_duration") or 0,
+            prompt_eval_count=result.get("prompt_eval_count") or 0,
+            prompt_eval_ns=result.get("prompt_eval_duration") or 0,
+            eval_count=result.get("eval_count") or 0,
+            eval_ns=result.get("eval_duration") or 0,
+        )
+
+    @property
+    def prefill_tokens_per_second(self) -> float:
+        return _rate(self.prompt_eval_count, self.prompt_eval_ns)
+
+    @property
+    def decode_tokens_per_second(self) -> float:
+        return _rate(self.eval_count, self.eval_ns)
+
+    @property
+    def bottleneck(self) -> Optional[str]:
+        """Phase that took longest: "load", "prefill", "decode" (None if unknown)."""
+        phases = {"load": self.load_ns, "prefill": self.prompt_eval_ns, "decode": self.eval_ns}
+        phase = max(phases, key=phases.get)
+        return phase if phases[phase] > 0 else None
+
+    def to_dict(self) -> Dict:
+        """Durations in ms plus derived rates, for result metadata."""
+        return {
+            "total_ms": round(self.total_ns / NS_PER_MS, 1),
+            "load_ms": round(self.load_ns / NS_PER_MS, 1),
+            "prompt_eval_count": self.prompt_eval_count,
+            "prompt_eval_ms": round(self.prompt_eval_ns / NS_PER_MS, 1),
+            "eval_count": self.eval_count,
+            "eval_ms": round(self.eval_ns / NS_PER_MS, 1),
+            "prefill_tokens_per_second": round(self.prefill_tokens_per_second, 1),
+            "decode_tokens_per_second": round(self.decode_tokens_per_second, 1),
+            "bottleneck": self.bottleneck,
+        }
+
+
+class TimingStats:
+    """
+    Thread-safe totals of GenerationTiming over many generations.
+
+    Rates are token-weighted (total tokens / total time), so long
+    generations count for more than short ones.
+    """
+
+    # A load phase longer than this counts as a model (re)load
+    RELOAD_THRESHOLD_MS = 100.0
+
+    def __init__(self):
+        """Initialize empty totals."""
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Zero all totals."""
+        with self._lock:
+            self._count = 0
+            self._reloads = 0
+            self._totals = GenerationTiming()
+            self._bottlenecks = {"load": 0, "prefill": 0, "decode": 0}
+            self._max_total_ns = 0
+
+    def record(self, timing: GenerationTiming):
+        """Add one generation."""
+        with self._lock:
+            totals = self._totals
+            self._totals = GenerationTiming(
+                total_ns=totals.total_ns + timing.total_ns,
+                load_ns=totals.load_ns + timing.load_ns,
+                prompt_eval_count=totals.prompt_eval_count + timing.prompt_eval_count,
+                prompt_eval_ns=totals.prompt_eval_ns + timing.prompt_eval_ns,
+                eval_count=totals.eval_count + timing.eval_count,
+                eval_ns=totals.eval_ns + timing.eval_ns,
+            )
+            self._count += 1
+            self._reloads += timing.load_ns > self.RELOAD_THRESHOLD_MS * NS_PER_MS
+            if timing.bottleneck is not None:
+                self._bottlenecks[timing.bottleneck] += 1
+            self._max_total_ns = max(self._max_total_ns, timing.total_ns)
+
+    def snapshot(self) -> Dict:
+        """
+        Summarize the recorded generations.
+
+        Returns:
+            Counts, mean phase times in ms, token-weighted prefill and
+            decode tokens/s, and how often each phase was the bottleneck
+        """
+        with self._lock:
+            count, totals = self._count, self._totals
+
+            def mean(ns: int) -> float:
+                return round(ns / count / NS_PER_MS, 1) if count else 0.0
+
+            return {
+                "generations": count,
+                "reloads": self._reloads,
+                "mean_total_ms": mean(totals.total_ns),
+                "max_total_ms": round(self._max_total_ns / NS_PER_MS, 1),
+                "mean_load_ms": mean(totals.load_ns),
+                "mean_prompt_eval_ms": mean(totals.prompt_eval_ns),
+                "mean_eval_ms": mean(totals.eval_ns),
+                "prompt_tokens": totals.prompt_eval_count,
+                "generated_tokens": totals.eval_count,
+                "prefill_tokens_per_second": round(totals.prefill_tokens_per_second, 1),
+                "decode_tokens_per_second": round(totals.decode_tokens_per_second, 1),
+                "bottlenecks": dict(self._bottlenecks),
+            }
+
+
+# Totals for every generation made by this process
+_process_stats = TimingStats()
+
+
+def get_timing_stats() -> TimingStats:
+    """Get the process-wide timing totals."""
+    return _process_stats
@@ -5,77 +5,640 @@ This module is complete - students should NOT modify.
 
 import json
 import logging
+import os
+import threading
 import time
-from typing import Dict, List, Optional, Union
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 
 import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
 
 from .config import (
+    BASE_DIR,
+    MAX_TOKENS,
     MODEL_ENDPOINT,
     MODEL_NAME,
+    SYSTEM_PROMPT,
     TIMEOUT_SECONDS,
     get_model_config,
 )
+from .circuit_breaker import get_circuit_breaker
+from .endpoint_pool import Endpoint, get_endpoint_pool
+from .generation_budget import get_budget_controller
+from .generation_scheduler import get_scheduler
+from .generation_timing import GenerationTiming, get_timing_stats
+from .response_cache import ResponseCache
+from .single_flight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
 
-class ModelProvider:
-    """Handles communication with Ollama API."""
-    
+# Status codes retried with exponential backoff
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+
+# End-to-end budget of one generate() call: waiting for startup, every
+# attempt and the backoff between attempts all come out of it
+REQUEST_DEADLINE_SECONDS = TIMEOUT_SECONDS
+
+# Retries of RETRY_STATUS_CODES and connection errors (backoff 1s, 2s, 4s)
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 1.0
+
+# Shortest time an attempt is expected to take; an endpoint's recent
+# latency is used when it is longer. No retry is made unless this still
+# fits in the deadline after the backoff
+MIN_ATTEMPT_SECONDS = 2.0
+
+# How long Ollama keeps the model (and its KV cache) loaded between turns
+# when a conversation reuses the returned context
+CONTEXT_KEEP_ALIVE = "30m"
+
+# On-disk cache of deterministic responses (see response_cache.py)
+RESPONSE_CACHE_ENABLED = True
+RESPONSE_CACHE_FILE = os.path.join(BASE_DIR, ".cache", "responses.sqlite3")
+RESPONSE_CACHE_MAX_ENTRIES = 10000
+RESPONSE_CACHE_MAX_AGE_SECONDS = 7 * 24 * 3600
+
+# Merge identical deterministic requests that are in flight at the same
+# time into one upstream call (see single_flight.py)
+COALESCE_REQUESTS = True
+
+# Token budget for the whole prompt (system prompt, history and the new
+# message): Ollama's default 2048-token context minus room for the reply.
+# History is dropped oldest first to fit, instead of Ollama silently
+# cutting the start of the prompt (the system prompt) on overflow
+PROMPT_TOKEN_BUDGET = 2048 - MAX_TOKENS
+# Rough characters per token, to estimate sizes without a tokenizer
+CHARS_PER_TOKEN = 4
+
+# Result fields that describe one call rather than the completion
+PER_CALL_FIELDS = (
+    "latency_ms", "ttft_ms", "cached", "coalesced", "timing", "attempts", "retry_ms",
+    "schedule",
+)
+
+# Background startup: preload the model and prefill SYSTEM_PROMPT once
+# connected, and keep retrying the connection until Ollama is up
+WARM_UP_ON_START = True
+STARTUP_RETRY_SECONDS = (1.0, 30.0)  # initial and maximum retry interval
+
+# Connection help shown when Ollama cannot be reached
+CONNECTION_HELP = (
+    "Cannot connect to Ollama. Please ensure:\n"
+    "1. Ollama is installed\n"
+    "2. Ollama service is running (run: ollama serve)\n"
+    "3. Port 11434 is not blocked"
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the token count of a text (CHARS_PER_TOKEN chars per token)."""
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def _render_turn(role: str, content: str) -> Tuple[Optional[str], int]:
+    """
+    Render one history message as a prompt line, and estimate its size.
+
+    Not cached: the estimate is only a length, and a cache shared by the
+    process would keep every user message in memory. The static system
+    prefix is cached per provider instead (see _rendered_prefix()).
+
+    Returns:
+        (line, tokens) - line is None for roles the prompt leaves out
+    """
+    if role == "user":
+        line = f"User: {content}"
+    elif role == "assistant":
+        line = f"Assistant: {content}"
+    else:
+        return None, 0
+    return line, estimate_tokens(line) + 1  # plus the newline
+
+
+class BaseModelProvider:
+    """Request building and response parsing shared by all providers."""
+
     def __init__(self):
-        """Initialize the model provider with retry logic."""
+        """Initialize endpoints, model name and response cache from config."""
         self.endpoint = MODEL_ENDPOINT
+        # Generations go to the least busy endpoint (see endpoint_pool.py)
+        self.pool = get_endpoint_pool()
+        # ...and fail at once while the backend is down (see circuit_breaker.py)
+        self.breaker = get_circuit_breaker()
+        # Upstream slots shared by all generations (see generation_scheduler.py)
+        self.scheduler = get_scheduler()
         self.model_name = MODEL_NAME
+        self.prompt_token_budget = PROMPT_TOKEN_BUDGET
+        self.request_deadline_seconds = REQUEST_DEADLINE_SECONDS
+        # Stop sequences and num_predict per message (see generation_budget.py)
+        self.budget = get_budget_controller()
+        self._prefix_cache: Dict[str, Tuple[str, int]] = {}
+        self.response_cache: Optional[ResponseCache] = None
+        if RESPONSE_CACHE_ENABLED:
+            self.response_cache = ResponseCache(
+                RESPONSE_CACHE_FILE,
+                max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+                max_age_seconds=RESPONSE_CACHE_MAX_AGE_SECONDS,
+            )
+
+    def _check_models(self, tags: Dict):
+        """
+        Check that the configured model is in an /api/tags response.
+
+        Args:
+            tags: Parsed /api/tags response
+
+        Raises:
+            RuntimeError: If the model is not available
+        """
+        models = tags.get("models", [])
+        model_names = [m.get("name", "") for m in models]
+
+        if self.model_name not in model_names:
+            available = ", ".join(model_names) if model_names else "none"
+            raise RuntimeError(
+                f"Model '{self.model_name}' not found. "
+                f"Available models: {available}. "
+                f"Run: ollama pull {self.model_name}"
+            )
+
+        logger.info(f"Successfully connected to Ollama with model {self.model_name}")
+
+    def _build_request(
+        self,
+        prompt: str,
+        system_prompt: Optional[str],
+        conversation_history: Optional[List[Dict]],
+        stream: bool,
+        context: Optional[List[int]] = None,
+        model: Optional[str] = None,
+        **kwargs
+    ) -> Tuple[Dict, Dict]:
+        """
+        Build the /api/generate request body.
+
+        Args:
+            prompt: User input prompt
+            system_prompt: System prompt for behavior
+            conversation_history: Previous conversation turns
+            stream: Whether Ollama should stream the response
+            context: Context tokens from the previous turn; if given, only
+                the new message is sent and the other prompt parts are unused
+            model: Model to use instead of the configured one
+            **kwargs: Additional parameters to override defaults
+
+        Returns:
+            (request body, prompt size and budget report for the result
+            metadata)
+        """
+        # Prepare the full prompt, or just the next turn on top of the context
+        if context:
+            full_prompt = self._build_continuation(prompt)
+            prompt_info = {
+                "prompt_chars": len(full_prompt),
+                "prompt_tokens_est": estimate_tokens(full_prompt),
+                "history_turns": 0,
+                "history_dropped": 0,
+            }
+        else:
+            full_prompt, prompt_info = self._build_prompt(
+                prompt, system_prompt, conversation_history
+            )
+        
+        # Get model configuration
+        config = get_model_config()
+        
+        # Override with any provided kwargs
+        if kwargs:
+            config["options"].update(kwargs)
+
+        # Stop sequences and num_predict for this message, unless given
+        prompt_info["budget"] = self.budget.apply(prompt, config["options"], kwargs)
+        
+        request_data = {
+            "model": model or config["model"],
+            "prompt": full_prompt,
+            "stream": stream,
+            "options": config["options"],
+        }
+        if context:
+            request_data["context"] = context
+            request_data["keep_alive"] = CONTEXT_KEEP_ALIVE
+        return request_data, prompt_info
+
+    def _format_result(
+        self,
+        result: Dict,
+        request_data: Dict,
+        start_time: float,
+        prompt_info: Dict,
+    ) -> Dict:
+        """
+        Turn a final Ollama response object into the provider's result dict.
+
+        Called once per generation, so this is also where its timing and
+        budget outcome are added to the process-wide totals.
+
+        Args:
+            result: Parsed /api/generate response (or last stream chunk)
+            request_data: Request body that was sent
+            start_time: time.time() when the request started
+            prompt_info: Prompt size and budget report from _build_request()
+
+        Returns:
+            Dict containing response and metadata
+        """
+        elapsed_ms = int((time.time() - start_time) * 1000)
+        timing = GenerationTiming.from_response(result)
+        get_timing_stats().record(timing)
+        budget = self.budget.record(prompt_info["budget"], result.get("done_reason"))
+        return {
+            "response": result.get("response", ""),
+            "model": result.get("model", self.model_name),
+            "created_at": result.get("created_at", ""),
+            "done": result.get("done", True),
+            "context": result.get("context", []),
+            "total_duration": result.get("total_duration", 0),
+            "prompt_eval_count": result.get("prompt_eval_count", 0),
+            "prompt_eval_duration": result.get("prompt_eval_duration", 0),
+            "context_reused": "context" in request_data,
+            **prompt_info,
+            "budget": budget,
+            "timing": timing.to_dict(),
+            "latency_ms": elapsed_ms,
+            "deterministic": request_data["options"]["temperature"] == 0,
+            "cached": False,
+            "coalesced": False,
+            "attempts": 1,
+            "retry_ms": 0,
+        }
+
+    def _add_schedule(self, result: Dict, slot: Dict):
+        """Report the wait for an upstream slot apart from the generation time."""
+        result["schedule"] = {**slot, "generation_ms": result["latency_ms"] - slot["queue_ms"]}
+
+    def _retry_backoff(
+        self, attempts: int, deadline: float, endpoint: Endpoint, failover: bool = False
+    ) -> Optional[float]:
+        """
+        Decide whether a failed attempt is retried within the deadline.
+
+        Args:
+            attempts: Attempts made so far
+            deadline: time.time() by which the call has to finish
+            endpoint: Endpoint of the failed attempt (its recent latency is
+                how long the next attempt is expected to take)
+            failover: The request never reached Ollama and an endpoint not
+                tried yet is left, so it is retried without backoff
+
+        Returns:
+            Seconds to wait before the next attempt, or None to give up
+        """
+        if attempts > MAX_RETRIES:
+            return None
+        backoff = 0.0 if failover else BACKOFF_FACTOR * (2 ** (attempts - 1))
+        expected = max(MIN_ATTEMPT_SECONDS, (endpoint.latency_ewma_ms or 0.0) / 1000)
+        remaining = deadline - time.time()
+        if backoff + expected > remaining:
+            logger.warning(
+                f"Not retrying model request: {remaining:.1f}s left of the "
+                f"{self.request_deadline_seconds}s deadline"
+            )
+            return None
+        return backoff
+
+    def _cached_result(self, request_data: Dict, start_time: float) -> Optional[Dict]:
+        """
+        Look up a deterministic request in the response cache.
+
+        Args:
+            request_data: Request body about to be sent
+            start_time: time.time() when the request started
+
+        Returns:
+            Cached result marked "cached": True, or None
+        """
+        if self.response_cache is None or request_data["options"]["temperature"] != 0:
+            return None
+
+        result = self.response_cache.get(ResponseCache.make_key(request_data))
+        if result is None:
+            return None
+
+        result["cached"] = True
+        result["latency_ms"] = int((time.time() - start_time) * 1000)
+        result["attempts"] = 0
+        result["retry_ms"] = 0
+        logger.info("Served model response from cache")
+        return result
+
+    def _store_result(self, request_data: Dict, result: Dict):
+        """Cache the result of a deterministic request."""
+        if (
+            self.response_cache is None
+            or request_data["options"]["temperature"] != 0
+            or not result.get("response")
+        ):
+            return
+
+        self.response_cache.put(
+            ResponseCache.make_key(request_data),
+            {k: v for k, v in result.items() if k not in PER_CALL_FIELDS},
+        )
+
+    def _build_prompt(
+        self,
+        user_prompt: str,
+        system_prompt: Optional[str] = None,
+        conversation_history: Optional[List[Dict]] = None,
+    ) -> Tuple[str, Dict]:
+        """
+        Build full prompt with system prompt and conversation history.
+
+        History is added newest first while it fits in prompt_token_budget,
+        so one long message costs older turns rather than overflowing the
+        model's context. The system prompt and the current message are
+        always included.
+        
+        Args:
+            user_prompt: Current user input
+            system_prompt: System instructions
+            conversation_history: List of previous turns
+            
+        Returns:
+            Formatted prompt string, and a report of its estimated size and
+            how many history messages were included or dropped
+        """
+        # Add system prompt if provided (a fixed prefix, see warm_up())
+        prefix, prefix_tokens = (
+            self._rendered_prefix(system_prompt) if system_prompt else ("", 0)
+        )
+        
+        # Add current user prompt
+        tail = "\n".join([f"User: {user_prompt}", "\n### Response ###", "Assistant: "])
+        tokens = prefix_tokens + estimate_tokens(tail)
+        
+        # Add conversation history, newest first, while it fits the budget
+        lines = []
+        dropped = 0
+        for turn in reversed(conversation_history or []):
+            line, turn_tokens = _render_turn(
+                turn.get("role", "user"), turn.get("content", "")
+            )
+            if line is None:
+                continue
+            if dropped or tokens + turn_tokens > self.prompt_token_budget:
+                dropped += 1
+                continue
+            lines.append(line)
+            tokens += turn_tokens
+        lines.reverse()
+        if conversation_history:
+            lines.append("")  # Empty line before current prompt
+        if dropped:
+            logger.info(
+                f"Dropped {dropped} oldest history messages to fit "
+                f"{self.prompt_token_budget} prompt tokens"
+            )
+        
+        full_prompt = prefix + "\n".join(lines + [tail])
+        return full_prompt, {
+            "prompt_chars": len(full_prompt),
+            "prompt_tokens_est": tokens,
+            "history_turns": len(lines) - 1 if conversation_history else 0,
+            "history_dropped": dropped,
+        }
+
+    def _system_prefix(self, system_prompt: str) -> str:
+        """
+        Build the static start of every prompt that has a system prompt.
+
+        Args:
+            system_prompt: System instructions
+
+        Returns:
+            Prompt prefix, identical for every turn
+        """
+        return self._rendered_prefix(system_prompt)[0]
+
+    def _rendered_prefix(self, system_prompt: str) -> Tuple[str, int]:
+        """Render the system prefix once per system prompt, with its size."""
+        cached = self._prefix_cache.get(system_prompt)
+        if cached is None:
+            prefix = "\n".join([
+                "### System Instructions ###",
+                system_prompt,
+                "\n### Conversation ###\n",
+                "",
+            ])
+            cached = self._prefix_cache[system_prompt] = (prefix, estimate_tokens(prefix))
+        return cached
+
+    def _build_continuation(self, user_prompt: str) -> str:
+        """
+        Build the text appended to a reused context for the next turn.
+
+        The context already holds the system prompt, earlier turns and the
+        model's last answer, so this only adds the new user message in the
+        same layout as _build_prompt().
+
+        Args:
+            user_prompt: Current user input
+
+        Returns:
+            Prompt string for the new turn
+        """
+        return "\n".join([
+            "",
+            f"User: {user_prompt}",
+            "\n### Response ###",
+            "Assistant: ",
+        ])
+
+
+class ModelProvider(BaseModelProvider):
+    """
+    Handles communication with Ollama API.
+
+    The connection is verified in the constructor by default. With
+    verify=False, call start_background() instead: the provider then
+    starts in the "starting" state, and generate() waits until it is
+    "ready".
+    """
+    
+    def __init__(self, verify: bool = True):
+        """
+        Initialize the model provider with retry logic.
+
+        Args:
+            verify: Verify the connection now (raises if Ollama is down)
+        """
+        super().__init__()
         self.session = self._create_session()
-        self._verify_connection()
+        self.single_flight = SingleFlight() if COALESCE_REQUESTS else None
+        self.state = "starting"
+        self.startup_error: Optional[str] = None
+        self.warm_up_ms: Optional[int] = None
+        self._ready = threading.Event()
+        if verify:
+            self._verify_connection()
+            self._mark_ready()
+
+    def start_background(self, warm_up: bool = WARM_UP_ON_START):
+        """
+        Verify the connection (and warm up) in a background thread.
+
+        Retries with backoff until Ollama answers, so the process can start
+        before Ollama does.
+
+        Args:
+            warm_up: Preload the model and prefill the system prompt
+        """
+        threading.Thread(
+            target=self._startup, args=(warm_up,), name="model-startup", daemon=True
+        ).start()
+
+    def _startup(self, warm_up: bool):
+        """Background startup: verify until it succeeds, then warm up."""
+        start_time = time.time()
+        retry_seconds, max_retry_seconds = STARTUP_RETRY_SECONDS
+        while True:
+            try:
+                self._verify_connection()
+                break
+            except RuntimeError as e:
+                self.startup_error = str(e)
+                logger.warning(f"Model provider not ready, retrying in {retry_seconds:.0f}s: {e}")
+                time.sleep(retry_seconds)
+                retry_seconds = min(retry_seconds * 2, max_retry_seconds)
+
+        if warm_up:
+            self.state = "warming_up"
+            self.warm_up()
+        self._mark_ready()
+        logger.info(f"Model provider ready after {time.time() - start_time:.1f}s")
+
+    def _mark_ready(self):
+        """Switch to the ready state and release waiting requests."""
+        self.state = "ready"
+        self.startup_error = None
+        self._ready.set()
+
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until startup has finished.
+
+        Args:
+            timeout: Seconds to wait at most (None waits forever)
+
+        Returns:
+            True if the provider is ready
+        """
+        return self._ready.wait(timeout)
+
+    def readiness(self) -> Dict:
+        """
+        Describe the startup state.
+
+        Returns:
+            Dict with "state" ("starting", "warming_up" or "ready"),
+            "ready", the last startup "error", "warm_up_ms" and the
+            circuit "breaker" state ("closed", "open" or "half_open")
+        """
+        return {
+            "state": self.state,
+            "ready": self._ready.is_set(),
+            "error": self.startup_error,
+            "warm_up_ms": self.warm_up_ms,
+            "breaker": self.breaker.state,
+        }
+
+    def warm_up(self, system_prompt: str = SYSTEM_PROMPT):
+        """
+        Load the model and prefill the static system-prompt prefix.
+
+        Every prompt starts with the same prefix, which Ollama keeps in its
+        KV cache, so the first real request skips both the model load and
+        the system prompt prefill. Each endpoint has its own model and
+        cache, so all of them are warmed up. Failures are logged, not raised.
+
+        Args:
+            system_prompt: System prompt whose prefix is prefilled
+        """
+        config = get_model_config()
+        request_data = {
+            "model": config["model"],
+            "prompt": self._system_prefix(system_prompt),
+            "stream": False,
+            "keep_alive": CONTEXT_KEEP_ALIVE,
+            # Same options as real requests (so the model is not reloaded),
+            # but only one token is generated
+            "options": {**config["options"], "num_predict": 1},
+        }
+
+        start_time = time.time()
+        for url in self.pool.urls:
+            try:
+                response = self.session.post(
+                    f"{url}/api/generate",
+                    json=request_data,
+                    timeout=TIMEOUT_SECONDS,
+                )
+                response.raise_for_status()
+                result = response.json()
+            except requests.exceptions.RequestException as e:
+                logger.warning(f"Model warm-up failed on {url}: {e}")
+                continue
+
+            timing = GenerationTiming.from_response(result).to_dict()
+            logger.info(
+                f"Warmed up {self.model_name} on {url} "
+                f"(load {timing['load_ms']:.0f}ms, "
+                f"{timing['prompt_eval_count']} prompt tokens prefilled)"
+            )
+        self.warm_up_ms = int((time.time() - start_time) * 1000)
+
+    def _ensure_ready(self, timeout: float = TIMEOUT_SECONDS):
+        """Wait (at most timeout seconds) for background startup before sending a request."""
+        if not self._ready.is_set() and not self.wait_until_ready(max(timeout, 0.0)):
+            raise RuntimeError(
+                f"Model provider is not ready ({self.state}): {self.startup_error}"
+            )
     
     def _create_session(self) -> requests.Session:
-        """Create HTTP session with retry logic."""
-        session = requests.Session()
-        retry_strategy = Retry(
-            total=3,
-            backoff_factor=1,
-            status_forcelist=[429, 500, 502, 503, 504],
-        )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        session.mount("http://", adapter)
-        session.mount("https://", adapter)
-        return session
+        """
+        Create the HTTP session.
+
+        Generations are retried by _post_generate() within their deadline,
+        so the session itself does not retry.
+        """
+        return requests.Session()
     
     def _verify_connection(self):
-        """Verify Ollama is running and model is available."""
+        """Verify Ollama is running and model is available (on any endpoint)."""
+        for url in self.pool.urls[:-1]:
+            try:
+                self._verify_endpoint(url)
+                return
+            except RuntimeError as e:
+                logger.warning(f"Endpoint {url} not usable: {e}")
+        self._verify_endpoint(self.pool.urls[-1])
+
+    def _verify_endpoint(self, url: str):
+        """Verify one Ollama endpoint is running and has the model."""
         try:
             # Check Ollama is running
             response = self.session.get(
-                f"{self.endpoint}/api/tags",
+                f"{url}/api/tags",
                 timeout=5
             )
             response.raise_for_status()
             
             # Check model is available
-            models = response.json().get("models", [])
-            model_names = [m.get("name", "") for m in models]
-            
-            if self.model_name not in model_names:
-                available = ", ".join(model_names) if model_names else "none"
-                raise RuntimeError(
-                    f"Model '{self.model_name}' not found. "
-                    f"Available models: {available}. "
-                    f"Run: ollama pull {self.model_name}"
-                )
-            
-            logger.info(f"Successfully connected to Ollama with model {self.model_name}")
+            self._check_models(response.json())
             
         except requests.exceptions.ConnectionError:
-            raise RuntimeError(
-                "Cannot connect to Ollama. Please ensure:\n"
-                "1. Ollama is installed\n"
-                "2. Ollama service is running (run: ollama serve)\n"
-                "3. Port 11434 is not blocked"
-            )
+            raise RuntimeError(CONNECTION_HELP)
         except Exception as e:
             raise RuntimeError(f"Failed to verify Ollama connection: {e}")
     
@@ -84,114 +647,275 @@ class ModelProvider:
         prompt: str,
         system_prompt: Optional[str] = None,
         conversation_history: Optional[List[Dict]] = None,
+        context: Optional[List[int]] = None,
+        model: Optional[str] = None,
+        use_cache: bool = True,
+        priority: Optional[str] = None,
         **kwargs
     ) -> Dict:
         """
         Generate response from the model.
+
+        The call finishes within request_deadline_seconds, retries included.
+        While the circuit breaker is open it fails at once with
+        CircuitOpenError, without queueing for a model slot (cached
+        responses are still served).
         
         Args:
             prompt: User input prompt
             system_prompt: System prompt for behavior
             conversation_history: Previous conversation turns
+            context: Context tokens returned by the previous turn, to send
+                only the new message instead of the whole transcript
+            model: Model to use instead of MODEL_NAME
+            use_cache: Read and write the response cache (if enabled)
+            priority: Scheduling class, "interactive" or "batch" (defaults
+                to the scheduler's default_priority)
             **kwargs: Additional parameters to override defaults
             
         Returns:
-            Dict containing response and metadata
+            Dict containing response and metadata ("cached" marks cache
+            hits, "coalesced" results shared with an identical request,
+            "attempts" and "retry_ms" the requests made and the time spent
+            before the last one, "schedule" the priority, queue wait and
+            generation time)
         """
         start_time = time.time()
-        
-        # Prepare the full prompt
-        full_prompt = self._build_prompt(prompt, system_prompt, conversation_history)
-        
-        # Get model configuration
-        config = get_model_config()
-        
-        # Override with any provided kwargs
-        if kwargs:
-            config["options"].update(kwargs)
-        
-        # Prepare request
-        request_data = {
-            "model": config["model"],
-            "prompt": full_prompt,
-            "stream": False,
-            "options": config["options"],
-        }
-        
+        deadline = start_time + self.request_deadline_seconds
+        request_data, prompt_info = self._build_request(
+            prompt, system_prompt, conversation_history,
+            stream=False, context=context, model=model, **kwargs
+        )
+
+        if use_cache:
+            cached = self._cached_result(request_data, start_time)
+            if cached is not None:
+                return cached
+
+        def send() -> Dict:
+            # Waiting for startup is not a backend failure and holds no slot
+            self._ensure_ready(deadline - time.time())
+            # Don't queue for a slot while the backend is known to be down
+            self.breaker.check()
+            with self.scheduler.slot(
+                priority, request_data["model"], deadline - time.time()
+            ) as slot, self.breaker.guard():
+                result = self._post_generate(request_data, start_time, prompt_info, deadline)
+            self._add_schedule(result, slot)
+            if use_cache:
+                self._store_result(request_data, result)
+            return result
+
+        if self.single_flight is None or request_data["options"]["temperature"] != 0:
+            return send()
+
+        result, shared = self.single_flight.do(ResponseCache.make_key(request_data), send)
+        if shared:
+            result["coalesced"] = True
+            result["latency_ms"] = int((time.time() - start_time) * 1000)
+            logger.info("Shared an identical in-flight model request")
+        return result
+
+    def _post_generate(
+        self, request_data: Dict, start_time: float, prompt_info: Dict, deadline: float
+    ) -> Dict:
+        """
+        Send one non-streaming /api/generate request, retrying until the deadline.
+
+        Each attempt may use whatever is left of the deadline, and a
+        failed attempt is only retried if another one still fits.
+
+        Args:
+            request_data: Request body
+            start_time: time.time() when the request started
+            prompt_info: Prompt size report from _build_request()
+            deadline: time.time() by which the call has to finish
+
+        Returns:
+            Formatted result
+        """
         try:
             logger.debug(f"Sending request to model: {json.dumps(request_data, indent=2)}")
-            
-            response = self.session.post(
-                f"{self.endpoint}/api/generate",
-                json=request_data,
-                timeout=TIMEOUT_SECONDS,
-            )
-            response.raise_for_status()
-            
-            result = response.json()
-            elapsed_ms = int((time.time() - start_time) * 1000)
-            
-            return {
-                "response": result.get("response", ""),
-                "model": result.get("model", self.model_name),
-                "created_at": result.get("created_at", ""),
-                "done": result.get("done", True),
-                "context": result.get("context", []),
-                "total_duration": result.get("total_duration", 0),
-                "latency_ms": elapsed_ms,
-                "deterministic": config["options"]["temperature"] == 0,
-            }
-            
+
+            tried = []
+            attempts = 0
+            first_attempt = time.time()
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise requests.exceptions.Timeout()
+                attempts += 1
+                attempt_start = time.time()
+                try:
+                    # Each attempt goes to the least busy endpoint not tried
+                    # yet; retryable statuses count against that endpoint
+                    with self.pool.lease(exclude=tried) as endpoint:
+                        response = self.session.post(
+                            f"{endpoint.url}/api/generate",
+                            json=request_data,
+                            timeout=remaining,
+                        )
+                        if response.status_code in RETRY_STATUS_CODES:
+                            response.raise_for_status()
+                except (requests.exceptions.ConnectionError, requests.exceptions.HTTPError) as e:
+                    tried.append(endpoint.url)
+                    # A request that never reached Ollama can go straight
+                    # to another endpoint
+                    failover = (
+                        isinstance(e, requests.exceptions.ConnectionError)
+                        and len(set(tried)) < len(self.pool.endpoints)
+                    )
+                    backoff = self._retry_backoff(attempts, deadline, endpoint, failover)
+                    if backoff is None:
+                        raise
+                    logger.warning(
+                        f"Retrying model request in {backoff:.1f}s "
+                        f"(attempt {attempts} on {endpoint.url} failed: {e})"
+                    )
+                    time.sleep(backoff)
+                    continue
+                response.raise_for_status()
+                break
+
+            result = self._format_result(response.json(), request_data, start_time, prompt_info)
+            result["attempts"] = attempts
+            result["retry_ms"] = int((attempt_start - first_attempt) * 1000)
+            return result
+
         except requests.exceptions.Timeout:
-            logger.error(f"Model request timed out after {TIMEOUT_SECONDS}s")
-            raise TimeoutError(f"Model generation timed out after {TIMEOUT_SECONDS}s")
+            logger.error(f"Model request timed out after {self.request_deadline_seconds}s")
+            raise TimeoutError(
+                f"Model generation timed out after {self.request_deadline_seconds}s"
+            )
         except requests.exceptions.RequestException as e:
             logger.error(f"Model request failed: {e}")
             raise RuntimeError(f"Failed to generate response: {e}")
-    
-    def _build_prompt(
+
+    def generate_stream(
         self,
-        user_prompt: str,
+        prompt: str,
         system_prompt: Optional[str] = None,
         conversation_history: Optional[List[Dict]] = None,
-    ) -> str:
+        context: Optional[List[int]] = None,
+        model: Optional[str] = None,
+        use_cache: bool = True,
+        priority: Optional[str] = None,
+        **kwargs
+    ) -> Iterator[Dict]:
         """
-        Build full prompt with system prompt and conversation history.
-        
+        Generate a response from the model token by token.
+
+        Consumes Ollama's streaming NDJSON output. Each chunk is yielded as
+        {"token": str, "done": False}. The last item has "done": True and
+        the same fields as generate(), plus "ttft_ms" (time to first token).
+
         Args:
-            user_prompt: Current user input
-            system_prompt: System instructions
-            conversation_history: List of previous turns
-            
+            prompt: User input prompt
+            system_prompt: System prompt for behavior
+            conversation_history: Previous conversation turns
+            context: Context tokens returned by the previous turn
+            model: Model to use instead of MODEL_NAME
+            use_cache: Read and write the response cache (if enabled)
+            priority: Scheduling class, "interactive" or "batch" (defaults
+                to the scheduler's default_priority)
+            **kwargs: Additional parameters to override defaults
+
+        Yields:
+            Token chunks, then the final response dict
+        """
+        start_time = time.time()
+        request_data, prompt_info = self._build_request(
+            prompt, system_prompt, conversation_history,
+            stream=True, context=context, model=model, **kwargs
+        )
+
+        if use_cache:
+            cached = self._cached_result(request_data, start_time)
+            if cached is not None:
+                # A cached response arrives as a single chunk
+                cached["ttft_ms"] = cached["latency_ms"]
+                yield {"token": cached["response"], "done": False}
+                yield cached
+                return
+
+        self._ensure_ready()
+
+        try:
+            logger.debug(f"Sending streaming request to model: {json.dumps(request_data, indent=2)}")
+
+            self.breaker.check()
+            with self.scheduler.slot(
+                priority, request_data["model"], TIMEOUT_SECONDS
+            ) as slot, self.breaker.guard(), self.pool.lease() as endpoint, self.session.post(
+                f"{endpoint.url}/api/generate",
+                json=request_data,
+                timeout=TIMEOUT_SECONDS,
+                stream=True,
+            ) as response:
+                response.raise_for_status()
+
+                tokens = []
+                ttft_ms = None
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if "error" in chunk:
+                        raise RuntimeError(f"Model stream failed: {chunk['error']}")
+
+                    token = chunk.get("response", "")
+                    if token:
+                        if ttft_ms is None:
+                            ttft_ms = int((time.time() - start_time) * 1000)
+                        tokens.append(token)
+                        yield {"token": token, "done": False}
+
+                    if chunk.get("done"):
+                        break
+                else:
+                    raise RuntimeError("Model stream ended before completion")
+
+            result = self._format_result(
+                {**chunk, "response": "".join(tokens)}, request_data, start_time, prompt_info
+            )
+            result["ttft_ms"] = ttft_ms
+            self._add_schedule(result, slot)
+            if use_cache:
+                self._store_result(request_data, result)
+            logger.info(
+                f"Streamed {len(tokens)} chunks: ttft {ttft_ms}ms, "
+                f"total {result['latency_ms']}ms"
+            )
+            yield result
+
+        except requests.exceptions.Timeout:
+            logger.error(f"Model stream timed out after {TIMEOUT_SECONDS}s")
+            raise TimeoutError(f"Model generation timed out after {TIMEOUT_SECONDS}s")
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Model stream failed: {e}")
+            raise RuntimeError(f"Failed to generate response: {e}")
+
+    def list_models(self) -> List[str]:
+        """
+        List the models installed in Ollama (on every reachable endpoint).
+
         Returns:
-            Formatted prompt string
+            Model names, as in /api/tags
         """
-        parts = []
-        
-        # Add system prompt if provided
-        if system_prompt:
-            parts.append(f"### System Instructions ###")
-            parts.append(system_prompt)
-            parts.append("\n### Conversation ###\n")
-        
-        # Add conversation history if provided
-        if conversation_history:
-            for turn in conversation_history:
-                role = turn.get("role", "user")
-                content = turn.get("content", "")
-                if role == "user":
-                    parts.append(f"User: {content}")
-                elif role == "assistant":
-                    parts.append(f"Assistant: {content}")
-            parts.append("")  # Empty line before current prompt
-        
-        # Add current user prompt
-        parts.append(f"User: {user_prompt}")
-        parts.append("\n### Response ###")
-        parts.append("Assistant: ")
-        
-        return "\n".join(parts)
-    
+        installed = None
+        for url in self.pool.urls:
+            try:
+                response = self.session.get(f"{url}/api/tags", timeout=5)
+                response.raise_for_status()
+            except requests.exceptions.RequestException as e:
+                logger.warning(f"Could not list models on {url}: {e}")
+                continue
+            names = {m.get("name", "") for m in response.json().get("models", [])}
+            installed = names if installed is None else installed & names
+        if installed is None:
+            raise RuntimeError(CONNECTION_HELP)
+        return sorted(installed)
+
     def health_check(self) -> bool:
         """
         Check if model provider is healthy.
@@ -199,23 +923,34 @@ class ModelProvider:
         Returns:
             True if healthy, False otherwise
         """
-        try:
-            response = self.session.get(
-                f"{self.endpoint}/api/tags",
-                timeout=5
-            )
-            return response.status_code == 200
-        except:
-            return False
+        for url in self.pool.urls:
+            try:
+                response = self.session.get(
+                    f"{url}/api/tags",
+                    timeout=5
+                )
+                if response.status_code == 200:
+                    return True
+            except:
+                pass
+        return False
 
 
 # Singleton instance
 _provider_instance = None
 
 
-def get_provider() -> ModelProvider:
-    """Get or create singleton model provider instance."""
+def get_provider(background: bool = False) -> ModelProvider:
+    """
+    Get or create singleton model provider instance.
+
+    Args:
+        background: If creating it, verify and warm up in the background
+            instead of blocking (see ModelProvider.start_background)
+    """
     global _provider_instance
     if _provider_instance is None:
-        _provider_instance = ModelProvider()
+        _provider_instance = ModelProvider(verify=not background)
+        if background:
+            _provider_instance.start_background()
     return _provider_instance
\ No newline at end of file
@@ -0,0 +1,197 @@
+"""
+Routing of generations between local models.
+
+Short, unflagged messages (greetings, quick follow-ups) do not need the
+full model; a much smaller one answers them in a fraction of the time.
+The router picks a route per message from its length, the input
+moderation result and how many generations are already in flight, and
+keeps latency counters per route.
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional
+
+from .config import MODEL_NAME
+from .moderation import ModerationResult
+
+logger = logging.getLogger(__name__)
+
+# Off by default: evaluation runs must all use MODEL_NAME
+ROUTING_ENABLED = False
+
+# Route name -> local model. "full" is the default route; a route whose
+# model is not installed is never chosen
+ROUTES = {
+    "full": MODEL_NAME,
+    "fast": "qwen2.5:0.5b",
+}
+
+# Messages up to this many characters go to the fast model
+FAST_MAX_CHARS = 80
+
+# With this many generations in flight, messages up to
+# FAST_MAX_CHARS_UNDER_LOAD characters go to the fast model as well
+QUEUE_DEPTH_THRESHOLD = 4
+FAST_MAX_CHARS_UNDER_LOAD = 400
+
+
+@dataclass(frozen=True)
+class RouteDecision:
+    """The route chosen for one generation, and why."""
+    name: str
+    model: str
+    reason: str
+    queue_depth: int
+
+
+class ModelRouter:
+    """
+    Thread-safe router between the models in ROUTES.
+
+    choose() picks a route, and dispatch() wraps the generation so the
+    queue depth and per-route latency stay current.
+    """
+
+    def __init__(
+        self,
+        list_models: Callable[[], List[str]],
+        routes: Optional[Dict[str, str]] = None,
+        enabled: Optional[bool] = None,
+    ):
+        """
+        Args:
+            list_models: Returns the installed model names (checked once,
+                on the first routed message)
+            routes: Route name -> model (defaults to ROUTES)
+            enabled: If False, every message takes the "full" route
+                (defaults to ROUTING_ENABLED)
+        """
+        self.routes = dict(routes or ROUTES)
+        self.enabled = ROUTING_ENABLED if enabled is None else enabled
+        self._list_models = list_models
+        self._installed: Optional[set] = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        # route name -> [requests, errors, total latency ms, max latency ms]
+        self._stats: Dict[str, list] = {name: [0, 0, 0, 0] for name in self.routes}
+
+    def choose(
+        self,
+        user_input: str,
+        input_moderation: ModerationResult,
+        context_model: Optional[str] = None,
+    ) -> RouteDecision:
+        """
+        Pick the route for a message that passed input moderation.
+
+        Args:
+            user_input: User's message
+            input_moderation: Result of the input check
+            context_model: Model that produced the context tokens being
+                reused, if any (they only make sense to the same model)
+
+        Returns:
+            Route decision
+        """
+        depth = self.in_flight
+        if not self.enabled:
+            return self._decision("full", "routing_disabled", depth)
+        if context_model is not None:
+            name = next((n for n, m in self.routes.items() if m == context_model), "full")
+            return self._decision(name, "context_reuse", depth)
+        if input_moderation.tags:
+            # Anything the moderator noticed gets the full model
+            return self._decision("full", "moderation_tags", depth)
+
+        length = len(user_input)
+        if length <= FAST_MAX_CHARS:
+            reason = "short_message"
+        elif depth >= QUEUE_DEPTH_THRESHOLD and length <= FAST_MAX_CHARS_UNDER_LOAD:
+            reason = "queue_depth"
+        else:
+            return self._decision("full", "default", depth)
+
+        if not self._is_installed(self.routes.get("fast")):
+            return self._decision("full", "fast_unavailable", depth)
+        return self._decision("fast", reason, depth)
+
+    def _decision(self, name: str, reason: str, depth: int) -> RouteDecision:
+        return RouteDecision(name=name, model=self.routes[name], reason=reason, queue_depth=depth)
+
+    def _is_installed(self, model: Optional[str]) -> bool:
+        """Check a model against the installed ones (listed once)."""
+        if model is None:
+            return False
+        if self._installed is None:
+            try:
+                self._installed = set(self._list_models())
+            except Exception as e:
+                logger.warning(f"Could not list models, routing everything to full: {e}")
+                return False
+            missing = [m for m in self.routes.values() if m not in self._installed]
+            if missing:
+                logger.warning(f"Routes disabled, models not installed: {', '.join(missing)}")
+        return model in self._installed
+
+    @contextmanager
+    def dispatch(self, decision: RouteDecision) -> Iterator[Dict]:
+        """
+        Count a generation as in flight and time it.
+
+        Yields:
+            Route metadata for the response; "latency_ms" is filled in when
+            the block exits. Leaving the block with an exception, or after
+            setting "error": True, counts as an error.
+        """
+        info = {
+            "name": decision.name,
+            "model": decision.model,
+            "reason": decision.reason,
+            "queue_depth": decision.queue_depth,
+            "latency_ms": None,
+        }
+        with self._lock:
+            self.in_flight += 1
+        start = time.time()
+        failed = True
+        try:
+            yield info
+            failed = bool(info.pop("error", False))
+        finally:
+            latency_ms = int((time.time() - start) * 1000)
+            info["latency_ms"] = latency_ms
+            with self._lock:
+                self.in_flight -= 1
+                entry = self._stats[decision.name]
+                entry[0] += 1
+                entry[1] += failed
+                entry[2] += latency_ms
+                entry[3] = max(entry[3], latency_ms)
+
+    def stats(self) -> Dict:
+        """
+        Return per-route counters.
+
+        Returns:
+            {"enabled", "in_flight", "routes": {name: {"model", "requests",
+            "errors", "mean_latency_ms", "max_latency_ms"}}}
+        """
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "in_flight": self.in_flight,
+                "routes": {
+                    name: {
+                        "model": self.routes[name],
+                        "requests": requests,
+                        "errors": errors,
+                        "mean_latency_ms": round(total / requests, 1) if requests else 0.0,
+                        "max_latency_ms": max_ms,
+                    }
+                    for name, (requests, errors, total, max_ms) in self._stats.items()
+                },
+            }
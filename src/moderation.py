@@ -3,16 +3,50 @@ Content moderation module for safety enforcement.
 Students must complete TODO sections according to POLICY.md.
 """
 
+import atexit
+import hashlib
+import json
 import logging
-import re
-from dataclasses import dataclass
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
 from enum import Enum
-from typing import Dict, List, Optional, Set, Tuple
+from typing import Dict, List, Optional, Sequence, Set, Tuple
 
-from .config import SAFETY_MODE
+from .config import CONTEXT_WINDOW_SIZE, SAFETY_MODE
+from .rule_engine import BudgetExceeded, RuleSet, RuleStats, ScanBudget, build_rules
 
 logger = logging.getLogger(__name__)
 
+# Number of distinct texts each worker process handles per task in moderate_batch
+BATCH_CHUNK_SIZE = 256
+
+# Fewest distinct texts for which moderate_batch uses worker processes;
+# smaller batches are checked in this process (see moderate_batch)
+PARALLEL_MIN_TEXTS = 20000
+
+# Maximum number of input verdicts kept in the LRU cache (0 disables caching)
+VERDICT_CACHE_SIZE = 1024
+
+# Crisis keyword hits within the context window that count as escalation
+ESCALATION_THRESHOLD = 3
+
+# Regex execution mode: "linear" evaluates ".*" rules as segment chains so
+# scans stay linear in the input length; "standard" runs the raw patterns
+REGEX_MODE = "linear"
+
+# CPU time allowed for moderating one message, in ms (None disables)
+MODERATION_BUDGET_MS = 50.0
+
+# Record per-rule evaluation counts, hits and CPU time (slows scans down)
+RULE_STATS_ENABLED = False
+
+# JSON file the rule stats are written to at exit, if enabled
+RULE_STATS_DUMP_FILE: Optional[str] = None
+
 
 class ModerationAction(Enum):
     """Possible moderation actions."""
@@ -29,6 +63,140 @@ class ModerationResult:
     reason: str  # Human-readable explanation
     confidence: float  # Confidence level (0-1)
     fallback_response: Optional[str] = None  # Response to use if action != ALLOW
+    scan_ms: Optional[float] = None  # Time spent scanning (model output checks only)
+
+
+class VerdictCache:
+    """
+    Thread-safe LRU cache of input moderation verdicts.
+
+    Keys are a hash of the normalized text plus the safety mode, so the
+    cache never holds user text itself. Cached results are copied on the
+    way in and out, so callers can mutate what they receive.
+    """
+
+    def __init__(self, capacity: int = VERDICT_CACHE_SIZE):
+        """
+        Initialize an empty cache.
+
+        Args:
+            capacity: Maximum number of verdicts kept (0 disables caching)
+        """
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, bytes], ModerationResult]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(normalized_text: str, safety_mode: str) -> Tuple[str, bytes]:
+        """Build the cache key for a normalized text and safety mode."""
+        digest = hashlib.blake2b(
+            normalized_text.encode("utf-8"), digest_size=16
+        ).digest()
+        return safety_mode, digest
+
+    def get(self, key: Tuple[str, bytes]) -> Optional[ModerationResult]:
+        """
+        Look up a verdict and mark it as recently used.
+
+        Args:
+            key: Key from make_key()
+
+        Returns:
+            Copy of the cached verdict, or None on a miss
+        """
+        with self._lock:
+            result = self._entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return replace(result, tags=list(result.tags))
+
+    def put(self, key: Tuple[str, bytes], result: ModerationResult):
+        """
+        Store a verdict, evicting the least recently used one if full.
+
+        Args:
+            key: Key from make_key()
+            result: Verdict to cache
+        """
+        if self.capacity <= 0:
+            return
+        result = replace(result, tags=list(result.tags))
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop all cached verdicts (counters are kept)."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """Return size and hit/miss counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def __getstate__(self):
+        """Pickle as an empty cache (locks cannot be pickled)."""
+        return {"capacity": self.capacity}
+
+    def __setstate__(self, state):
+        """Restore an empty cache with the pickled capacity."""
+        self.__init__(state["capacity"])
+
+
+class EscalationTracker:
+    """
+    Per-session running count of crisis keyword hits in the context window.
+
+    Each message is scanned once when it enters the window, and its hit
+    count is subtracted again when it leaves, so the escalation decision
+    costs O(1) regardless of how long the conversation is. The window
+    covers the same messages as conversation_history[-window_size:].
+    """
+
+    def __init__(self, window_size: int = CONTEXT_WINDOW_SIZE):
+        """
+        Initialize an empty tracker.
+
+        Args:
+            window_size: Number of most recent messages in the window
+        """
+        self.window_size = window_size
+        self.crisis_count = 0
+        self._window: deque = deque()
+
+    def push(self, crisis_hits: int):
+        """
+        Record a message entering the window.
+
+        Args:
+            crisis_hits: Crisis keyword hits in the message (0 for non-user turns)
+        """
+        if self.window_size <= 0:
+            return
+        if len(self._window) == self.window_size:
+            self.crisis_count -= self._window.popleft()
+        self._window.append(crisis_hits)
+        self.crisis_count += crisis_hits
+
+    def reset(self):
+        """Forget all messages (e.g. on session reset)."""
+        self._window.clear()
+        self.crisis_count = 0
 
 
 class Moderator:
@@ -37,7 +205,13 @@ class Moderator:
     def __init__(self):
         """Initialize the moderator with safety rules."""
         self.safety_mode = SAFETY_MODE
+        self.regex_mode = REGEX_MODE
+        self.budget_ms = MODERATION_BUDGET_MS
+        self.verdict_cache = VerdictCache(VERDICT_CACHE_SIZE)
+        self.rule_stats: Optional[RuleStats] = None
         self._initialize_rules()
+        if RULE_STATS_ENABLED:
+            self.enable_rule_stats(RULE_STATS_DUMP_FILE)
     
     def _initialize_rules(self):
         """
@@ -186,6 +360,34 @@ class Moderator:
             ] # DONE: Harassment indicators
         }
         
+        # Output check: phrases that make medical terms in a response safe
+        self.output_safe_patterns = [
+            # Flexible: "not a diagnosis", "without diagnosis", "without judgement and diagnosis"
+            r"\b(not\s+.*?diagnosis|without\s+.*?diagnosis)\b",
+
+            # Flexible: denies being a licensed clinician
+            r"\b(i\s+am\s+not\s+.*?(licensed\s+clinician|qualified\s+professional)|not\s+a\s+licensed\s+clinician)\b",
+
+            # Flexible: cannot or do not provide medical advice
+            r"\b(cannot\s+.*?(diagnose|provide\s+medical\s+advice)|do\s+not\s+.*?provide\s+medical\s+advice|not\s+able\s+to\s+.*?give\s+medical\s+advice)\b",
+
+            # Explicit "this is not medical advice"
+            r"\b(this\s+is\s+not\s+medical\s+advice)\b"
+        ]
+
+        # Output check: diagnostic statements
+        self.output_diagnostic_patterns = [
+            r"\b(you are suffering from|diagnosed with|it is likely you have)\b",
+            r"\b(this means you have|this indicates you have|you may have)\b"
+        ]
+
+        # Output check: treatment recommendations
+        self.output_treatment_patterns = [
+            r"\b(you should|you need to|it is recommended to|you must)\b.*\b(take|use|start|stop|change)\b.*\b(medication|therapy|treatment|drugs?)\b",
+            r"\b(the best treatment is|the best medication is)\b",
+            r"\btry (ssri|prozac|xanax|antidepressants)\b"
+        ]
+
         # TODO: Define confidence thresholds based on safety mode
         self.confidence_thresholds = {
             "strict": { 
@@ -252,6 +454,12 @@ If your message was not intended to promote harm and you are feeling strong emot
 If you are experiencing thoughts of self-harm or harming others, please reach out to a crisis hotline or emergency services immediately. My core function is to support your well-being, and I am unable to engage in conversations that could lead to harm. Instead, I can provide resources for mental health support, offer emotional guidance, or discuss a different, safer topic.
             """,
             
+            "generic": """
+I'm sorry, I can't respond to that message properly right now. Could you try rephrasing it, or tell me a little more about how you're feeling?
+
+If you are in distress or need urgent help, please contact a crisis helpline or emergency services.
+            """,
+
             "disclaimer": """
 Welcome to the Psychological Pre-Consultation Support System.
 
@@ -288,18 +496,136 @@ What I Can Offer:
 Your wellbeing is important. How can I support you today?
             """,
         }
+
+        # Compile all patterns once so each check is a single scan
+        self.reload_rules()
+
+    def reload_rules(self):
+        """
+        Recompile the rule set and invalidate cached verdicts.
+
+        Call this after changing any keyword, pattern, threshold, template
+        or the regex mode.
+        """
+        self.rule_set = self._compile_rules()
+        self.verdict_cache.clear()
+        if self.rule_stats is not None:
+            # Rule names are positional, so old counters would be mislabeled
+            self.rule_stats.reset()
+            self.rule_set.enable_stats(self.rule_stats)
+
+    def enable_rule_stats(self, dump_file: Optional[str] = None) -> RuleStats:
+        """
+        Start recording per-rule evaluation counts, hits and CPU time.
+
+        Cached verdicts are not rescanned, so only cache misses are counted.
+        Batch worker processes keep their own counters, which are not merged.
+
+        Args:
+            dump_file: JSON file to write the stats to at interpreter exit
+
+        Returns:
+            The live counters
+        """
+        if self.rule_stats is None:
+            self.rule_stats = self.rule_set.enable_stats()
+        if dump_file:
+            atexit.register(self.dump_rule_stats, dump_file)
+        return self.rule_stats
+
+    def disable_rule_stats(self):
+        """Stop recording per-rule stats and drop the counters."""
+        self.rule_stats = None
+        self.rule_set.disable_stats()
+
+    def rule_stats_snapshot(self) -> Dict[str, Dict]:
+        """
+        Copy the per-rule counters.
+
+        Returns:
+            RuleStats.snapshot() output, or an empty dict if stats are off
+        """
+        if self.rule_stats is None:
+            return {}
+        return self.rule_stats.snapshot()
+
+    def dump_rule_stats(self, filepath: Optional[str] = None, top: int = 10):
+        """
+        Write the per-rule stats to a JSON file, or log the costliest rules.
+
+        Args:
+            filepath: Output file (logs a summary if None)
+            top: Number of rules in the logged summary
+        """
+        snapshot = self.rule_stats_snapshot()
+        if not snapshot:
+            return
+
+        if filepath:
+            os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+            with open(filepath, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f, indent=2)
+            logger.info(f"Wrote rule stats to {filepath}")
+            return
+
+        rules = sorted(snapshot["rules"].items(), key=lambda item: -item[1]["cpu_ms"])
+        dead = [name for name, entry in rules if entry["hits"] == 0]
+        logger.info(f"Rule stats: {len(rules)} rules, {len(dead)} without hits")
+        for name, entry in rules[:top]:
+            logger.info(
+                f"  {name}: {entry['cpu_ms']:.2f}ms over {entry['evals']} evals, "
+                f"{entry['hits']} hits"
+            )
+
+    def _compile_rules(self) -> RuleSet:
+        """
+        Compile the regex rules into one combined pattern per category,
+        and the keyword lists into one keyword matcher per category.
+
+        Use reload_rules() whenever the keyword or pattern lists change.
+
+        Returns:
+            Compiled rule set
+        """
+        harmful_rules = []
+        for category, patterns in self.harmful_content.items():
+            harmful_rules.extend(build_rules(category, patterns, 0.75))
+
+        return RuleSet(
+            {
+                "crisis": build_rules("crisis", self.crisis_patterns, 0.85),
+                "medical": build_rules("medical", self.medical_patterns, 0.85),
+                "harmful": harmful_rules,
+                "output": (
+                    build_rules("diagnosis_pattern", self.output_diagnostic_patterns, 0.9)
+                    + build_rules("treatment_pattern", self.output_treatment_patterns, 0.9)
+                ),
+                "safe_context": build_rules("safe_context", self.output_safe_patterns, 1.0),
+            },
+            keywords={
+                "crisis": self.crisis_keywords,
+                "medical": self.medical_keywords,
+            },
+            linear=self.regex_mode == "linear",
+            # A safe-context match lifts a violation, so it must not over-match
+            suppressing=("safe_context",),
+        )
     
     def moderate(
         self,
         user_prompt: str,
         model_response: Optional[str] = None,
         context: Optional[List[Dict]] = None,
+        escalation: Optional[EscalationTracker] = None,
     ) -> ModerationResult:
         """
         Perform moderation on user input and/or model output.
         
         Args:
             user_prompt: The user's input text
+            model_response: Model output to check, if any
+            context: Recent conversation turns to check for escalation
+            escalation: Session tracker used instead of rescanning context
             
         Returns:
             ModerationResult with action and explanation
@@ -310,39 +636,42 @@ Your wellbeing is important. How can I support you today?
         3. Check harmful content (filter inappropriate)
         """
         
-        # Example skeleton:
-        # Step 1: Check for crisis indicators (highest priority)
-        crisis_check = self._check_crisis(user_prompt)
-        if crisis_check.action != ModerationAction.ALLOW:
-            logger.warning(f"Crisis detected: {crisis_check.reason}")
-            return crisis_check
-        
-        # TODO: Other Steps - Check for ???
-        # Step 2: Check for medical requests
-        medical_check = self._check_medical(user_prompt)
-        if medical_check.action != ModerationAction.ALLOW:
-            logger.info(f"Medical request detected: {medical_check.reason}")
-            return medical_check
-        
-        # Step 3: Check for harmful content
-        harmful_check = self._check_harmful(user_prompt)
-        if harmful_check.action != ModerationAction.ALLOW:
-            logger.info(f"Harmful content detected: {harmful_check.reason}")
-            return harmful_check
+        # Steps 1-3: crisis, medical and harmful checks in priority order.
+        # The verdict only depends on the text and safety mode, so it is cached.
+        try:
+            input_check = self._check_input_cached(user_prompt)
+        except BudgetExceeded as e:
+            return self._budget_exceeded_result(e)
+        if input_check.action != ModerationAction.ALLOW:
+            if input_check.tags[:1] == ["crisis"]:
+                logger.warning(f"Crisis detected: {input_check.reason}")
+            elif input_check.tags[:1] == ["medical"]:
+                logger.info(f"Medical request detected: {input_check.reason}")
+            else:
+                logger.info(f"Harmful content detected: {input_check.reason}")
+            return input_check
 
         # If model response provided, check it
         if model_response:
-            output_check = self._check_model_output(model_response)
+            try:
+                output_check = self._check_model_output(model_response, self._new_budget())
+            except BudgetExceeded as e:
+                e.category = "output"
+                return self._budget_exceeded_result(e)
             if output_check.action != ModerationAction.ALLOW:
                 logger.warning(f"Output violation: {output_check.reason}")
                 return output_check
         
-        # Check context for concerning patterns
-        if context:
+        # Check context for concerning patterns. A session tracker already
+        # holds the running count, so the window is not rescanned.
+        context_check = None
+        if escalation is not None:
+            context_check = self._check_escalation(escalation)
+        elif context:
             context_check = self._check_context_patterns(context)
-            if context_check.action != ModerationAction.ALLOW:
-                logger.info(f"Context concern: {context_check.reason}")
-                return context_check
+        if context_check and context_check.action != ModerationAction.ALLOW:
+            logger.info(f"Context concern: {context_check.reason}")
+            return context_check
         
         # Default: Allow
         return ModerationResult(
@@ -352,7 +681,180 @@ Your wellbeing is important. How can I support you today?
             confidence=1.0,
         )
     
-    def _check_crisis(self, text: str) -> ModerationResult:
+    def moderate_batch(
+        self,
+        texts: Sequence[str],
+        safety_mode: Optional[str] = None,
+        workers: int = 1,
+    ) -> List[ModerationResult]:
+        """
+        Moderate many user prompts at once.
+
+        Gives the same results as calling moderate() on each text, but each
+        text is normalized once, identical texts are checked only once, and
+        very large batches can be spread over worker processes.
+
+        Worker processes only pay off once the batch outweighs starting
+        them and pickling the moderator into each. Measured with
+        scripts/benchmark_moderation.py: at 2000 texts workers=2 ran at
+        0.99x of per-call moderate() against 1.22x in this process; a
+        distinct text takes ~70us to check, and starting a pool costs
+        ~20ms with fork and several hundred ms with spawn (macOS,
+        Windows). The pool is therefore used only from
+        PARALLEL_MIN_TEXTS distinct texts and with more than one CPU, and
+        never runs more workers than there are CPUs.
+
+        Args:
+            texts: User inputs to moderate
+            safety_mode: Safety mode for this batch (defaults to self.safety_mode)
+            workers: Maximum number of worker processes (1 = run in this process)
+
+        Returns:
+            One ModerationResult per input, in input order
+        """
+        mode = safety_mode or self.safety_mode
+        if mode not in self.confidence_thresholds:
+            raise ValueError(f"Invalid safety_mode: {mode}")
+
+        # Normalize once; identical texts share one verdict
+        unique: Dict[str, int] = {}
+        slots = [unique.setdefault(text.lower(), len(unique)) for text in texts]
+        normalized = list(unique)
+
+        workers = min(workers, os.cpu_count() or 1)
+        if workers > 1 and len(normalized) >= PARALLEL_MIN_TEXTS:
+            chunks = [
+                normalized[i:i + BATCH_CHUNK_SIZE]
+                for i in range(0, len(normalized), BATCH_CHUNK_SIZE)
+            ]
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_batch_worker,
+                initargs=(self,),
+            ) as executor:
+                verdicts = [
+                    result
+                    for chunk_results in executor.map(
+                        _moderate_chunk, chunks, [mode] * len(chunks)
+                    )
+                    for result in chunk_results
+                ]
+        else:
+            verdicts = [self._check_input_within_budget(text, mode) for text in normalized]
+
+        # Duplicates get their own copy so callers can mutate results safely
+        results = []
+        used = [False] * len(verdicts)
+        for slot in slots:
+            verdict = verdicts[slot]
+            if used[slot]:
+                verdict = replace(verdict, tags=list(verdict.tags))
+            used[slot] = True
+            results.append(verdict)
+
+        flagged = sum(r.action != ModerationAction.ALLOW for r in results)
+        logger.info(
+            f"Moderated batch of {len(texts)} texts "
+            f"({len(normalized)} distinct, {flagged} flagged)"
+        )
+        return results
+
+    def _check_input_cached(self, text: str) -> ModerationResult:
+        """
+        Run the input checks through the verdict cache.
+
+        Args:
+            text: User input
+
+        Returns:
+            Same result as _check_input() for the current safety mode
+        """
+        key = VerdictCache.make_key(text.lower(), self.safety_mode)
+        result = self.verdict_cache.get(key)
+        if result is None:
+            # Budget overruns raise before caching: they depend on load too
+            result = self._check_input(text, budget=self._new_budget())
+            self.verdict_cache.put(key, result)
+        return result
+
+    def _check_input_within_budget(self, text: str, safety_mode: str) -> ModerationResult:
+        """Run the input checks, failing safe if the CPU budget runs out."""
+        try:
+            return self._check_input(text, safety_mode, self._new_budget())
+        except BudgetExceeded as e:
+            return self._budget_exceeded_result(e)
+
+    def _new_budget(self) -> Optional[ScanBudget]:
+        """Start a CPU budget for one message, if budgets are enabled."""
+        if self.budget_ms is None:
+            return None
+        return ScanBudget(self.budget_ms)
+
+    def _budget_exceeded_result(self, error: BudgetExceeded) -> ModerationResult:
+        """
+        Fail safe when a message could not be moderated within budget.
+
+        The message was not fully checked, so it is never allowed through.
+        Only an overrun in the crisis check gets the crisis template; the
+        others (later input checks, the output check) get the generic one.
+        """
+        logger.warning(f"Moderation budget exceeded in {error.category} check: {error}")
+        template = "crisis" if error.category == "crisis" else "generic"
+        return ModerationResult(
+            action=ModerationAction.SAFE_FALLBACK,
+            tags=["moderation_budget_exceeded"],
+            reason=str(error),
+            confidence=0.0,
+            fallback_response=self.fallback_templates[template],
+        )
+
+    def _check_input(
+        self,
+        text: str,
+        safety_mode: Optional[str] = None,
+        budget: Optional[ScanBudget] = None,
+    ) -> ModerationResult:
+        """
+        Run the input checks in priority order and return the first hit.
+
+        Args:
+            text: User input
+            safety_mode: Safety mode to apply (defaults to self.safety_mode)
+            budget: CPU budget shared by all checks
+
+        Returns:
+            First non-ALLOW result, or an ALLOW result
+
+        Raises:
+            BudgetExceeded: If the budget runs out
+        """
+        checks = (
+            ("crisis", self._check_crisis),
+            ("medical", self._check_medical),
+            ("harmful", self._check_harmful),
+        )
+        for category, check in checks:
+            try:
+                result = check(text, safety_mode, budget)
+            except BudgetExceeded as e:
+                e.category = category
+                raise
+            if result.action != ModerationAction.ALLOW:
+                return result
+
+        return ModerationResult(
+            action=ModerationAction.ALLOW,
+            tags=[],
+            reason="Content passes all safety checks",
+            confidence=1.0,
+        )
+
+    def _check_crisis(
+        self,
+        text: str,
+        safety_mode: Optional[str] = None,
+        budget: Optional[ScanBudget] = None,
+    ) -> ModerationResult:
         """
         Check for crisis indicators.
         
@@ -380,23 +882,21 @@ Your wellbeing is important. How can I support you today?
         confidence = 0.0
 
         # Keyword checking
-        for keyword in self.crisis_keywords:
-            if keyword in text_lower:
-                detected_keywords.append(keyword)
-                confidence = max(confidence, 0.7)
+        for keyword in self.rule_set.find_keywords("crisis", text_lower):
+            detected_keywords.append(keyword)
+            confidence = max(confidence, 0.7)
 
         # Pattern checking
-        for pattern in self.crisis_patterns:
-            if re.search(pattern, text_lower):
-                detected_keywords.append(f"pattern:{pattern}")
-                confidence = max(confidence, 0.85)
+        for rule in self.rule_set.scan("crisis", text_lower, budget):
+            detected_keywords.append(f"pattern:{rule.source}")
+            confidence = max(confidence, rule.confidence)
         
         # Maixmum confidence if multiple matches
         if len(detected_keywords) > 4:
             confidence = max(confidence, MAXIMUM_CONFIDENCE := 0.95)
 
         # Threshold comparison
-        threshold = self.confidence_thresholds[self.safety_mode]["crisis"]
+        threshold = self.confidence_thresholds[safety_mode or self.safety_mode]["crisis"]
 
         if confidence >= threshold:
             return ModerationResult(
@@ -414,7 +914,12 @@ Your wellbeing is important. How can I support you today?
             confidence=confidence,
         )
     
-    def _check_medical(self, text: str) -> ModerationResult:
+    def _check_medical(
+        self,
+        text: str,
+        safety_mode: Optional[str] = None,
+        budget: Optional[ScanBudget] = None,
+    ) -> ModerationResult:
         """
         Check for medical requests.
         
@@ -436,23 +941,21 @@ Your wellbeing is important. How can I support you today?
 
         # DONE: Implement keyword checking
         # Similar to crisis checking but with medical keywords
-        for keyword in self.medical_keywords:
-            if keyword in text_lower:
-                detected_keywords.append(keyword)
-                confidence = max(confidence, 0.7)
+        for keyword in self.rule_set.find_keywords("medical", text_lower):
+            detected_keywords.append(keyword)
+            confidence = max(confidence, 0.7)
         
         # DONE: Implement pattern checking
         # Similar to crisis checking but with medical patterns
-        for pattern in self.medical_patterns:
-            if re.search(pattern, text_lower):
-                detected_keywords.append(f"pattern:{pattern}")
-                confidence = max(confidence, 0.85)
+        for rule in self.rule_set.scan("medical", text_lower, budget):
+            detected_keywords.append(f"pattern:{rule.source}")
+            confidence = max(confidence, rule.confidence)
 
         logger.info(f"medical detected keywords: {detected_keywords}")
         
         # DONE: Threshold comparison and return
         # Remember to use ModerationAction.SAFE_FALLBACK for medical
-        threshold = self.confidence_thresholds[self.safety_mode]["medical"]
+        threshold = self.confidence_thresholds[safety_mode or self.safety_mode]["medical"]
         if confidence >= threshold:
             return ModerationResult(
                 action=ModerationAction.SAFE_FALLBACK,
@@ -469,7 +972,12 @@ Your wellbeing is important. How can I support you today?
             confidence=confidence,
         )
     
-    def _check_harmful(self, text: str) -> ModerationResult:
+    def _check_harmful(
+        self,
+        text: str,
+        safety_mode: Optional[str] = None,
+        budget: Optional[ScanBudget] = None,
+    ) -> ModerationResult:
         """
         Check for harmful content.
         
@@ -492,15 +1000,13 @@ Your wellbeing is important. How can I support you today?
         confidence = 0.0
 
         # Check patterns in each harmful category
-        for category, patterns in self.harmful_content.items():
-            for pattern in patterns:
-                if re.search(pattern, text_lower):
-                    detected_categories.append(category)
-                    confidence = max(confidence, 0.75)
-                    break  # No need to check more patterns in this category
+        for rule in self.rule_set.scan("harmful", text_lower, budget):
+            if rule.category not in detected_categories:
+                detected_categories.append(rule.category)
+            confidence = max(confidence, rule.confidence)
 
         # Threshold comparison
-        threshold = self.confidence_thresholds[self.safety_mode]["harmful"]
+        threshold = self.confidence_thresholds[safety_mode or self.safety_mode]["harmful"]
         if confidence >= threshold:
             return ModerationResult(
                 action=ModerationAction.BLOCK,
@@ -517,7 +1023,11 @@ Your wellbeing is important. How can I support you today?
             confidence=confidence,
         )
     
-    def _check_model_output(self, response: str) -> ModerationResult:
+    def _check_model_output(
+        self,
+        response: str,
+        budget: Optional[ScanBudget] = None,
+    ) -> ModerationResult:
         """
         Check model output for policy violations.
         
@@ -531,57 +1041,26 @@ Your wellbeing is important. How can I support you today?
 
         """
 
+        start_time = time.perf_counter()
         response_lower = response.lower()
         violations = []
 
         logger.info(f"model output to check: {response}")
 
-        # Define safe words/phrases where medical terms are allowed
-        safe_patterns = [
-            # Flexible: "not a diagnosis", "without diagnosis", "without judgement and diagnosis"
-            r"\b(not\s+.*?diagnosis|without\s+.*?diagnosis)\b",
+        # Check for medical keywords in output. Whether the response is a
+        # safe context (e.g. "this is not medical advice") does not depend
+        # on the keyword, so it is evaluated at most once per response.
+        keywords = self.rule_set.find_keywords("medical", response_lower)
+        if keywords and not self.rule_set.any_match("safe_context", response_lower, budget):
+            violations.extend(f"medical:{keyword}" for keyword in keywords)
 
-            # Flexible: denies being a licensed clinician
-            r"\b(i\s+am\s+not\s+.*?(licensed\s+clinician|qualified\s+professional)|not\s+a\s+licensed\s+clinician)\b",
+        # Check for diagnostic statements and treatment recommendations
+        for rule in self.rule_set.scan("output", response_lower, budget):
+            violations.append(f"{rule.category}:{rule.source}")
 
-            # Flexible: cannot or do not provide medical advice
-            r"\b(cannot\s+.*?(diagnose|provide\s+medical\s+advice)|do\s+not\s+.*?provide\s+medical\s+advice|not\s+able\s+to\s+.*?give\s+medical\s+advice)\b",
-
-            # Explicit "this is not medical advice"
-            r"\b(this\s+is\s+not\s+medical\s+advice)\b"
-        ]
+        scan_ms = (time.perf_counter() - start_time) * 1000
+        logger.debug(f"Output scan of {len(response)} chars took {scan_ms:.3f}ms")
 
-        def is_safe_context(text: str) -> bool:
-            for pattern in safe_patterns:
-                if re.search(pattern, text):
-                    return True
-            return False
-
-        # Check for medical keywords in output
-        for keyword in self.medical_keywords:
-            if keyword in response_lower:
-                if not is_safe_context(response_lower):
-                    violations.append(f"medical:{keyword}")
-
-        # Check for diagnostic statements
-        diagnostic_patterns = [
-            r"\b(you are suffering from|diagnosed with|it is likely you have)\b",
-            r"\b(this means you have|this indicates you have|you may have)\b"
-        ]
-        for pattern in diagnostic_patterns:
-            if re.search(pattern, response_lower):
-                violations.append(f"diagnosis_pattern:{pattern}")
-        
-        # Check for treatment recommendations
-        treatment_patterns = [
-            r"\b(you should|you need to|it is recommended to|you must)\b.*\b(take|use|start|stop|change)\b.*\b(medication|therapy|treatment|drugs?)\b",
-            r"\b(the best treatment is|the best medication is)\b",
-            r"\btry (ssri|prozac|xanax|antidepressants)\b"
-        ]
-        for pattern in treatment_patterns:
-            if re.search(pattern, response_lower):
-                violations.append(f"treatment_pattern:{pattern}")
-        
         if violations:
             return ModerationResult(
                 action=ModerationAction.SAFE_FALLBACK,
@@ -589,6 +1068,7 @@ Your wellbeing is important. How can I support you today?
                 reason=f"Model output contains medical advice or diagnosis: {', '.join(violations)}",
                 confidence=0.9,
                 fallback_response=self.fallback_templates["medical"],
+                scan_ms=scan_ms,
             )
         
         return ModerationResult(
@@ -596,6 +1076,7 @@ Your wellbeing is important. How can I support you today?
             tags=[],
             reason="Model output is appropriate",
             confidence=1.0,
+            scan_ms=scan_ms,
         )
     
     def _check_context_patterns(self, context: List[Dict]) -> ModerationResult:
@@ -603,13 +1084,34 @@ Your wellbeing is important. How can I support you today?
         # Check for escalation
         crisis_count = 0
         for turn in context:
-            if turn.get("role") == "user":
-                content = turn.get("content", "").lower()
-                for keyword in self.crisis_keywords:
-                    if keyword in content:
-                        crisis_count += 1
+            crisis_count += self._count_crisis_hits(turn)
         
-        if crisis_count >= 3:
+        return self._escalation_result(crisis_count)
+
+    def _check_escalation(self, tracker: EscalationTracker) -> ModerationResult:
+        """Check escalation from a session tracker's running count (O(1))."""
+        return self._escalation_result(tracker.crisis_count)
+
+    def record_turn(self, tracker: EscalationTracker, turn: Dict):
+        """
+        Add a conversation message to a session's escalation tracker.
+
+        Args:
+            tracker: The session's tracker
+            turn: Message with "role" and "content"
+        """
+        tracker.push(self._count_crisis_hits(turn))
+
+    def _count_crisis_hits(self, turn: Dict) -> int:
+        """Count crisis keywords in a message (user messages only)."""
+        if turn.get("role") != "user":
+            return 0
+        content = turn.get("content", "").lower()
+        return len(self.rule_set.find_keywords("crisis", content))
+
+    def _escalation_result(self, crisis_count: int) -> ModerationResult:
+        """Turn a crisis keyword count over the window into a verdict."""
+        if crisis_count >= ESCALATION_THRESHOLD:
             return ModerationResult(
                 action=ModerationAction.SAFE_FALLBACK,
                 tags=["pattern_escalation", "repeated_crisis"],
@@ -629,6 +1131,21 @@ Your wellbeing is important. How can I support you today?
         """Get initial disclaimer."""
         return self.fallback_templates.get("disclaimer", "")
 
+# Moderator used by moderate_batch worker processes
+_worker_moderator: Optional[Moderator] = None
+
+
+def _init_batch_worker(moderator: Moderator):
+    """Install the parent's moderator in a batch worker process."""
+    global _worker_moderator
+    _worker_moderator = moderator
+
+
+def _moderate_chunk(texts: List[str], safety_mode: str) -> List[ModerationResult]:
+    """Moderate one chunk of normalized texts in a batch worker process."""
+    return [_worker_moderator._check_input_within_budget(text, safety_mode) for text in texts]
+
+
 # Singleton instance
 _moderator_instance = None
 
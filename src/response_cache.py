@@ -0,0 +1,147 @@
+"""
+On-disk cache of deterministic model responses.
+
+Generation is pinned deterministic (temperature 0, fixed seed), so the same
+request body always yields the same completion. Responses are stored in a
+SQLite file keyed by a hash of the request, and survive restarts, so reruns
+of the evaluation do not pay model latency again.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Request fields that do not change the completion
+IGNORED_REQUEST_FIELDS = ("stream", "keep_alive")
+
+
+class ResponseCache:
+    """
+    Thread-safe SQLite cache of model results.
+
+    Entries expire after max_age_seconds, and the least recently used ones
+    are evicted once there are more than max_entries.
+    """
+
+    def __init__(self, path: str, max_entries: int, max_age_seconds: float):
+        """
+        Open (or create) the cache file.
+
+        Args:
+            path: SQLite file path
+            max_entries: Maximum number of cached responses
+            max_age_seconds: Age after which an entry is no longer used
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " result TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)"
+        )
+        self._db.commit()
+
+    @staticmethod
+    def make_key(request_data: Dict) -> str:
+        """Hash the parts of a request body that determine the completion."""
+        relevant = {
+            k: v for k, v in request_data.items() if k not in IGNORED_REQUEST_FIELDS
+        }
+        canonical = json.dumps(relevant, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """
+        Look up a result and mark it as recently used.
+
+        Args:
+            key: Key from make_key()
+
+        Returns:
+            Cached result, or None on a miss or if the entry expired
+        """
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT result, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.max_age_seconds:
+                self.misses += 1
+                return None
+
+            self._db.execute(
+                "UPDATE responses SET last_used = ? WHERE key = ?", (now, key)
+            )
+            self._db.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, result: Dict):
+        """
+        Store a result, then evict expired and least recently used entries.
+
+        Args:
+            key: Key from make_key()
+            result: Result to cache (must be JSON serializable)
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, result, created_at, last_used)"
+                " VALUES (?, ?, ?, ?)",
+                (key, json.dumps(result), now, now),
+            )
+            self._db.execute(
+                "DELETE FROM responses WHERE created_at < ?",
+                (now - self.max_age_seconds,),
+            )
+            self._db.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._db.commit()
+
+    def clear(self):
+        """Drop all cached responses (counters are kept)."""
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+
+    def stats(self) -> Dict[str, float]:
+        """Return size and hit/miss counters."""
+        with self._lock:
+            size = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "path": self.path,
+                "size": size,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._db.close()
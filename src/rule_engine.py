@@ -0,0 +1,1200 @@
+"""
+Compiled rule engine for content moderation.
+
+Moderation rules are compiled once into a single combined pattern per
+category, so checking a message is one regex scan instead of one
+re.search() call per rule. Keyword lists are compiled into a trie-shaped
+matcher so that all keyword hits are found in one pass as well.
+
+Before any regex runs, a prefilter looks for the literal anchors each
+rule requires, so messages that cannot match a rule never reach it.
+
+In linear mode, patterns with unbounded ".*" gaps are run as chains of
+gap-free segments (see LinearRule), which keeps every rule linear in the
+text length, and scans can be bounded by a per-message CPU budget.
+
+Per-rule evaluation counts, hit counts and CPU time can be recorded with
+RuleSet.enable_stats(). While stats are on, candidate rules are evaluated
+one by one so each rule's cost can be measured; when off, the only
+overhead is one attribute check per scan.
+"""
+
+import logging
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, List, Optional, Sequence, Set, Tuple
+
+try:
+    from re import _constants as sre_constants
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_constants
+    import sre_parse
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of candidate-subset patterns compiled per category
+SUBSET_PATTERN_LIMIT = 256
+
+# Unbounded wildcard spans that linear mode turns into segment boundaries
+_GAPS = {".*", ".*?", "(.*)", "(.*?)", "(?:.*)", "(?:.*?)"}
+
+
+class BudgetExceeded(Exception):
+    """Raised when a scan runs past its CPU budget."""
+
+    # Check that was running when the budget ran out (set by the moderator)
+    category: Optional[str] = None
+
+
+class ScanBudget:
+    """CPU time budget for moderating one message."""
+
+    def __init__(self, budget_ms: float):
+        """
+        Start the budget clock.
+
+        Args:
+            budget_ms: CPU time allowed, in milliseconds
+        """
+        self.budget_ms = budget_ms
+        self.deadline = time.thread_time() + budget_ms / 1000
+
+    def check(self):
+        """Raise BudgetExceeded if the budget has been used up."""
+        if time.thread_time() > self.deadline:
+            raise BudgetExceeded(f"Moderation exceeded {self.budget_ms:.0f}ms CPU budget")
+
+
+@dataclass(frozen=True)
+class Rule:
+    """A single moderation rule."""
+    name: str  # Unique identifier, also used as the regex group name
+    category: str  # Policy tag reported when the rule matches
+    source: str  # Raw regex pattern as written in the policy
+    confidence: float  # Confidence assigned when the rule matches
+
+
+class RuleStats:
+    """
+    Thread-safe per-rule counters: evaluations, hits and CPU time.
+
+    Rules are keyed by name. Keyword hits are counted per keyword, and the
+    cost of each one-pass matcher (keyword lists and prefilters) is kept
+    separately since it cannot be split across keywords.
+    """
+
+    def __init__(self):
+        """Initialize empty counters."""
+        self._lock = threading.Lock()
+        # rule name -> [category, source, evals, hits, cpu seconds]
+        self._rules: Dict[str, list] = {}
+        # (category, keyword) -> hits
+        self._keywords: Dict[Tuple[str, str], int] = {}
+        # matcher name -> [evals, cpu seconds]
+        self._matchers: Dict[str, list] = {}
+
+    def register(self, rule_set: "RuleSet"):
+        """
+        Add zeroed entries for every rule and keyword of a rule set, so
+        rules that never run or never match show up in snapshots.
+
+        Args:
+            rule_set: Rule set to register
+        """
+        with self._lock:
+            for category in rule_set.categories.values():
+                for rule in category.rules:
+                    self._rules.setdefault(rule.name, [rule.category, rule.source, 0, 0, 0.0])
+            for name, matcher in rule_set.keywords.items():
+                for keyword in matcher.keywords:
+                    self._keywords.setdefault((name, keyword), 0)
+
+    def record_rule(self, rule: "Rule", hit: bool, seconds: float):
+        """Count one evaluation of a rule."""
+        with self._lock:
+            entry = self._rules.setdefault(rule.name, [rule.category, rule.source, 0, 0, 0.0])
+            entry[2] += 1
+            entry[3] += hit
+            entry[4] += seconds
+
+    def record_matcher(self, name: str, seconds: float):
+        """Count one pass of a keyword matcher or prefilter."""
+        with self._lock:
+            entry = self._matchers.setdefault(name, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def record_keywords(self, category: str, keywords: Sequence[str]):
+        """Count the keywords of a category found in one message."""
+        with self._lock:
+            for keyword in set(keywords):
+                key = (category, keyword)
+                self._keywords[key] = self._keywords.get(key, 0) + 1
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """
+        Copy the current counters.
+
+        Returns:
+            Dict with "rules" (by rule name), "keywords" (by
+            "category:keyword") and "matchers" (by matcher name)
+        """
+        with self._lock:
+            return {
+                "rules": {
+                    name: {
+                        "category": category,
+                        "source": source,
+                        "evals": evals,
+                        "hits": hits,
+                        "cpu_ms": cpu * 1000,
+                    }
+                    for name, (category, source, evals, hits, cpu) in self._rules.items()
+                },
+                "keywords": {
+                    f"{category}:{keyword}": hits
+                    for (category, keyword), hits in self._keywords.items()
+                },
+                "matchers": {
+                    name: {"evals": evals, "cpu_ms": cpu * 1000}
+                    for name, (evals, cpu) in self._matchers.items()
+                },
+            }
+
+    def reset(self):
+        """Drop all counters."""
+        with self._lock:
+            self._rules.clear()
+            self._keywords.clear()
+            self._matchers.clear()
+
+    def __getstate__(self):
+        """Pickle as empty counters (locks cannot be pickled)."""
+        return {}
+
+    def __setstate__(self, state):
+        """Restore empty counters."""
+        self.__init__()
+
+
+class CompiledCategory:
+    """
+    All rules of one category compiled into a single pattern.
+
+    Every rule is wrapped in an optional lookahead with a named group, and
+    the whole alternation is required to match at the current position.
+    A finditer() scan therefore stops only at positions where at least
+    one rule matches, and at each stop every rule matching there sets its
+    group. The union over all stops is exactly the set of rules for which
+    re.search() would succeed, found in one pass over the text.
+
+    A leading word boundary shared by most rules is hoisted out of the
+    required alternation, so positions inside words are rejected with a
+    single check instead of one check per rule.
+
+    With the prefilter enabled, each rule's required literals (see
+    required_literals()) go into one KeywordMatcher. A scan first finds
+    which anchors occur, and only the rules whose anchors were seen (plus
+    rules without anchors) are run, through a pattern combining just
+    those rules. A rule cannot match without one of its anchors in the
+    text, so the prefilter never drops a match.
+
+    In linear mode the candidate rules are evaluated one by one as
+    LinearRules instead, checking the scan budget between rules.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rules: Sequence[Rule],
+        prefilter: bool = True,
+        linear: bool = False,
+        fail_safe_match: bool = True,
+    ):
+        """
+        Compile the rules of a category.
+
+        Args:
+            name: Category name (e.g. "crisis")
+            rules: Rules in policy order
+            prefilter: Skip rules whose required literals are absent
+            linear: Evaluate rules with the linear-time matcher
+            fail_safe_match: Direction in which linear matching may err:
+                True reports a match when unsure (rules that block),
+                False reports no match (rules that suppress a block)
+        """
+        self.name = name
+        self.rules: Tuple[Rule, ...] = tuple(rules)
+        self.linear = linear
+        self.fail_safe_match = fail_safe_match
+        self._linear_rules: Tuple["LinearRule", ...] = ()
+        self._single_patterns: Optional[List[re.Pattern]] = None
+        if linear:
+            self._linear_rules = tuple(LinearRule(rule.source) for rule in self.rules)
+        self._index = {rule.name: i for i, rule in enumerate(self.rules)}
+        self._all = frozenset(range(len(self.rules)))
+        self._subset_patterns: Dict[FrozenSet[int], re.Pattern] = {}
+        self.pattern: Optional[re.Pattern] = None
+        if self.rules:
+            self.pattern = self._pattern_for(self._all)
+
+        # Prefilter: anchor literal -> rules that require it
+        self.anchors: List[Optional[FrozenSet[str]]] = [
+            required_literals(rule.source) for rule in self.rules
+        ]
+        self._unanchored = frozenset(
+            i for i, anchors in enumerate(self.anchors) if anchors is None
+        )
+        self._anchor_rules: Dict[str, Set[int]] = {}
+        for i, anchors in enumerate(self.anchors):
+            for anchor in anchors or ():
+                self._anchor_rules.setdefault(anchor, set()).add(i)
+
+        self.prefilter: Optional[KeywordMatcher] = None
+        if prefilter and self._anchor_rules:
+            self.prefilter = KeywordMatcher(list(self._anchor_rules))
+
+    def candidates(self, text: str) -> FrozenSet[int]:
+        """
+        Find the rules that could possibly match the text.
+
+        Args:
+            text: Lowercased text to scan
+
+        Returns:
+            Indices of candidate rules
+        """
+        if self.prefilter is None:
+            return self._all
+
+        candidates = set(self._unanchored)
+        for anchor in self.prefilter.found(text):
+            candidates.update(self._anchor_rules[anchor])
+        return frozenset(candidates)
+
+    def _pattern_for(self, indices: FrozenSet[int]) -> re.Pattern:
+        """
+        Get the combined pattern for a subset of the rules.
+
+        Args:
+            indices: Rule indices to include
+
+        Returns:
+            Compiled pattern (cached per subset)
+        """
+        pattern = self._subset_patterns.get(indices)
+        if pattern is not None:
+            return pattern
+        if len(self._subset_patterns) >= SUBSET_PATTERN_LIMIT:
+            return self.pattern
+
+        rules = [self.rules[i] for i in sorted(indices)]
+        any_rule = _combine_alternatives([rule.source for rule in rules])
+        each_rule = "".join(
+            f"(?:(?=(?P<{rule.name}>{rule.source})))?" for rule in rules
+        )
+        pattern = re.compile(f"(?={any_rule}){each_rule}")
+        self._subset_patterns[indices] = pattern
+        return pattern
+
+    def scan(self, text: str, budget: Optional[ScanBudget] = None) -> List[Rule]:
+        """
+        Find every rule that matches anywhere in the text.
+
+        Args:
+            text: Lowercased text to scan
+            budget: CPU budget checked before each regex evaluation
+
+        Returns:
+            Matching rules in policy order
+
+        Raises:
+            BudgetExceeded: If the budget runs out
+        """
+        if self.pattern is None:
+            return []
+
+        candidates = self.candidates(text)
+        if not candidates:
+            return []
+        if self.linear:
+            return [self.rules[i] for i in self._scan_linear(text, candidates, budget)]
+        if budget is not None:
+            budget.check()
+        pattern = self._pattern_for(candidates)
+
+        found = set()
+        for match in pattern.finditer(text):
+            for name, value in match.groupdict().items():
+                if value is not None:
+                    found.add(self._index[name])
+            if len(found) == len(candidates):
+                break
+
+        return [self.rules[i] for i in sorted(found)]
+
+    def any_match(self, text: str, budget: Optional[ScanBudget] = None) -> bool:
+        """
+        Check whether at least one rule matches, stopping at the first hit.
+
+        Args:
+            text: Lowercased text to scan
+            budget: CPU budget checked before each regex evaluation
+
+        Returns:
+            True if any rule matches
+
+        Raises:
+            BudgetExceeded: If the budget runs out
+        """
+        if self.pattern is None:
+            return False
+
+        candidates = self.candidates(text)
+        if not candidates:
+            return False
+        if self.linear:
+            return bool(self._scan_linear(text, candidates, budget, first_only=True))
+        if budget is not None:
+            budget.check()
+        return self._pattern_for(candidates).search(text) is not None
+
+    def _scan_linear(
+        self,
+        text: str,
+        candidates: FrozenSet[int],
+        budget: Optional[ScanBudget],
+        first_only: bool = False,
+    ) -> List[int]:
+        """Evaluate candidate rules one by one with the linear matcher."""
+        found = []
+        for i in sorted(candidates):
+            if budget is not None:
+                budget.check()
+            if self._evaluate(i, text):
+                found.append(i)
+                if first_only:
+                    break
+        return found
+
+    def _evaluate(self, index: int, text: str) -> bool:
+        """Evaluate a single rule on its own."""
+        if self.linear:
+            return self._linear_rules[index].matches(text, self.fail_safe_match)
+        if self._single_patterns is None:
+            self._single_patterns = [re.compile(rule.source) for rule in self.rules]
+        return self._single_patterns[index].search(text) is not None
+
+    def scan_profiled(
+        self,
+        text: str,
+        stats: RuleStats,
+        budget: Optional[ScanBudget] = None,
+        first_only: bool = False,
+    ) -> List[Rule]:
+        """
+        Scan rule by rule, recording each rule's evaluation in stats.
+
+        Matches the same rules as scan() (or any_match() with first_only),
+        but is slower: use it only while collecting stats.
+
+        Args:
+            text: Lowercased text to scan
+            stats: Counters to update
+            budget: CPU budget checked before each regex evaluation
+            first_only: Stop at the first matching rule
+
+        Returns:
+            Matching rules in policy order
+        """
+        if self.pattern is None:
+            return []
+
+        start = time.thread_time()
+        candidates = self.candidates(text)
+        if self.prefilter is not None:
+            stats.record_matcher(f"prefilter:{self.name}", time.thread_time() - start)
+
+        found = []
+        for i in sorted(candidates):
+            if budget is not None:
+                budget.check()
+            start = time.thread_time()
+            hit = self._evaluate(i, text)
+            stats.record_rule(self.rules[i], hit, time.thread_time() - start)
+            if hit:
+                found.append(self.rules[i])
+                if first_only:
+                    break
+        return found
+
+
+class LinearRule:
+    """
+    Linear-time evaluation of a rule with unbounded ".*" gaps.
+
+    A pattern like `A.*B.*C` backtracks over every split of the text and
+    goes cubic on long inputs. Here it is rewritten as alternatives of
+    gap-free segments [A, B, C] (alternations around a gap are expanded,
+    and a `(.*)` group counts as a gap), and each segment is found with
+    one forward search, so the cost is linear in the text length.
+
+    A gap cannot cross a line break, since "." does not match "\\n", so a
+    chain is only followed within one line. Segments keep their own
+    semantics: one containing e.g. `\\s` may still span lines.
+
+    The segment chain approximates the regex in a chosen direction:
+
+    - fail_safe_match=True: search each segment from the start of the
+      previous one. Any real match implies a chain, so nothing the regex
+      would match is missed; rare overlaps may over-report.
+    - fail_safe_match=False: search each segment from the end of the
+      previous one. Every chain found is a real match, so nothing is
+      over-reported; rare chains may be missed.
+
+    Patterns without gaps, or with gaps that cannot be expanded (inside
+    a repeated group or a lookaround), run as the original regex.
+    """
+
+    def __init__(self, source: str):
+        """
+        Split and compile the pattern.
+
+        Args:
+            source: Raw regex pattern
+        """
+        self.source = source
+        self.pattern = re.compile(source)
+        self.chains: Optional[List[List[re.Pattern]]] = None
+        # Per chain and segment: whether a segment match may contain "\n"
+        self.spans_lines: Optional[List[List[bool]]] = None
+
+        alternatives = _expand_gaps(source)
+        if alternatives is None:
+            logger.warning(f"Pattern cannot be linearized, running as-is: {source}")
+        elif any(len(segments) > 1 for segments in alternatives):
+            self.chains = [
+                [re.compile(segment) for segment in segments]
+                for segments in alternatives
+            ]
+            self.spans_lines = [
+                [_can_match_newline(segment) for segment in segments]
+                for segments in alternatives
+            ]
+
+    def matches(self, text: str, fail_safe_match: bool = True) -> bool:
+        """
+        Check whether the rule matches the text.
+
+        Args:
+            text: Lowercased text to scan
+            fail_safe_match: Err towards reporting a match (see class docs)
+
+        Returns:
+            True if the rule matches
+        """
+        if self.chains is None:
+            return self.pattern.search(text) is not None
+
+        if fail_safe_match:
+            return any(
+                _chain_over(chain, spans, text)
+                for chain, spans in zip(self.chains, self.spans_lines)
+            )
+        return any(_chain_under(chain, text) for chain in self.chains)
+
+
+class _SegmentSearch:
+    """
+    Leftmost segment matches with the last result per segment reused.
+
+    A chain restarts on later lines, searching each segment again from a
+    later position. While that position is not past the previous result,
+    the result is still the leftmost match, so every part of the text is
+    searched at most once per segment.
+    """
+
+    def __init__(self, segments: Sequence[re.Pattern], text: str):
+        self.segments = segments
+        self.text = text
+        self._last: List[Optional[Tuple[int, Optional[re.Match]]]] = [None] * len(segments)
+
+    def find(self, index: int, pos: int) -> Optional[re.Match]:
+        """Return the leftmost match of a segment starting at or after pos."""
+        last = self._last[index]
+        if last is not None:
+            searched_from, match = last
+            if searched_from <= pos and (match is None or pos <= match.start()):
+                return match
+        match = self.segments[index].search(self.text, pos)
+        self._last[index] = (pos, match)
+        return match
+
+
+def _line_end(text: str, pos: int) -> int:
+    """Index of the line break ending the line at pos (or the text length)."""
+    end = text.find("\n", pos)
+    return len(text) if end == -1 else end
+
+
+def _chain_over(segments: Sequence[re.Pattern], spans_lines: Sequence[bool], text: str) -> bool:
+    """
+    Over-approximate `S0.*S1.*...` with one search per segment and line.
+
+    If a real match has segment starts s0 <= s1 <= ..., the leftmost
+    match of each segment searched from the previous leftmost start is
+    never later than the real one, so the chain is always found. Each
+    gap lies within one line, so the chain is followed one line at a
+    time; after a segment that may span lines, the line of the next gap
+    is unknown and the rest of the chain is searched to the end.
+    """
+    search = _SegmentSearch(segments, text)
+    start = 0
+    while True:
+        match = search.find(0, start)
+        if match is None:
+            return False
+
+        pos = match.start()
+        line_end = _line_end(text, pos)
+        within_line = not spans_lines[0]
+        for index in range(1, len(segments)):
+            match = search.find(index, pos)
+            if match is None:
+                return False
+            if within_line and match.start() > line_end:
+                break
+            pos = match.start()
+            within_line = within_line and not spans_lines[index]
+        else:
+            return True
+        start = line_end + 1
+
+
+def _chain_under(segments: Sequence[re.Pattern], text: str) -> bool:
+    """
+    Under-approximate `S0.*S1.*...`: only report chains that really match.
+
+    Each segment is searched after the previous segment's end and must
+    start before the next line break, since "." does not cross lines (the
+    segment itself may continue past it). When a chain breaks, the search
+    restarts on the following line.
+    """
+    search = _SegmentSearch(segments, text)
+    start = 0
+    while True:
+        match = search.find(0, start)
+        if match is None:
+            return False
+
+        pos = match.end()
+        line_end = len(text)
+        for index in range(1, len(segments)):
+            line_end = _line_end(text, pos)
+            match = search.find(index, pos)
+            if match is None:
+                return False
+            if match.start() > line_end:
+                break
+            pos = match.end()
+        else:
+            return True
+        start = line_end + 1
+
+
+class KeywordMatcher:
+    """
+    Multi-keyword matcher finding all keywords in a text in one pass.
+
+    The keywords are arranged in a trie and the trie is rendered as a
+    regex, so the per-position work is bounded by the keyword length
+    rather than by the number of keywords. The scan runs inside the C
+    regex engine; a pure Python Aho-Corasick loop costs more per character
+    than the keyword checks it replaces on typical message lengths.
+
+    Each stop of the scan yields the longest keyword starting at that
+    position. Every shorter keyword that also starts there is a prefix of
+    it, so those are precomputed per keyword and reported alongside.
+    Matching is exact and case-sensitive, like `keyword in text`.
+    """
+
+    def __init__(self, keywords: Sequence[str]):
+        """
+        Build the matcher.
+
+        Args:
+            keywords: Keywords in policy order (duplicates allowed)
+        """
+        self.keywords: Tuple[str, ...] = tuple(keywords)
+        self._positions: Dict[str, List[int]] = {}
+        for i, keyword in enumerate(self.keywords):
+            if keyword:
+                self._positions.setdefault(keyword, []).append(i)
+
+        unique = list(self._positions)
+        self._prefixes: Dict[str, Tuple[str, ...]] = {
+            keyword: tuple(k for k in unique if keyword.startswith(k))
+            for keyword in unique
+        }
+
+        self.pattern: Optional[re.Pattern] = None
+        if unique:
+            trie: Dict = {}
+            for keyword in unique:
+                node = trie
+                for char in keyword:
+                    node = node.setdefault(char, {})
+                node[""] = True
+            self.pattern = re.compile(f"(?=({_render_trie(trie)}))")
+
+    def matched_keywords(self, text: str) -> List[str]:
+        """
+        List the keywords that occur in the text.
+
+        Equivalent to `[k for k in keywords if k in text]`.
+
+        Args:
+            text: Text to scan
+
+        Returns:
+            Matching keywords in policy order
+        """
+        found = self.found(text)
+        if not found:
+            return []
+
+        indices = sorted(i for keyword in found for i in self._positions[keyword])
+        return [self.keywords[i] for i in indices]
+
+    def found(self, text: str) -> Set[str]:
+        """
+        Find the distinct keywords that occur in the text.
+
+        Args:
+            text: Text to scan
+
+        Returns:
+            Set of matching keywords
+        """
+        found: Set[str] = set()
+        if self.pattern is None:
+            return found
+
+        for match in self.pattern.finditer(text):
+            found.update(self._prefixes[match.group(1)])
+            if len(found) == len(self._positions):
+                break
+        return found
+
+
+class RuleSet:
+    """Compiled moderation rules, one combined pattern per category."""
+
+    def __init__(
+        self,
+        categories: Dict[str, Sequence[Rule]],
+        keywords: Optional[Dict[str, Sequence[str]]] = None,
+        prefilter: bool = True,
+        linear: bool = False,
+        suppressing: Sequence[str] = (),
+    ):
+        """
+        Compile every category.
+
+        Args:
+            categories: Mapping of category name to its regex rules
+            keywords: Mapping of category name to its keyword list
+            prefilter: Skip rules whose required literals are absent
+            linear: Use the linear-time matcher for all categories
+            suppressing: Categories whose matches make content safer, so
+                linear matching errs towards no match for them
+        """
+        self.linear = linear
+        self.stats: Optional[RuleStats] = None
+        self.categories = {
+            name: CompiledCategory(
+                name,
+                rules,
+                prefilter=prefilter,
+                linear=linear,
+                fail_safe_match=name not in suppressing,
+            )
+            for name, rules in categories.items()
+        }
+        self.keywords = {
+            name: KeywordMatcher(words)
+            for name, words in (keywords or {}).items()
+        }
+        logger.debug(
+            "Compiled rule set: "
+            + ", ".join(f"{name}={len(c.rules)}" for name, c in self.categories.items())
+            + "; keywords: "
+            + ", ".join(f"{name}={len(m.keywords)}" for name, m in self.keywords.items())
+        )
+
+    def enable_stats(self, stats: Optional[RuleStats] = None) -> RuleStats:
+        """
+        Start recording per-rule stats.
+
+        Args:
+            stats: Counters to record into (a new RuleStats by default)
+
+        Returns:
+            The counters in use
+        """
+        self.stats = stats or RuleStats()
+        self.stats.register(self)
+        return self.stats
+
+    def disable_stats(self):
+        """Stop recording per-rule stats."""
+        self.stats = None
+
+    def find_keywords(self, category: str, text: str) -> List[str]:
+        """
+        Find the keywords of one category that occur in the text.
+
+        Args:
+            category: Category name
+            text: Lowercased text to scan
+
+        Returns:
+            Matching keywords in policy order
+        """
+        if self.stats is None:
+            return self.keywords[category].matched_keywords(text)
+
+        start = time.thread_time()
+        found = self.keywords[category].matched_keywords(text)
+        self.stats.record_matcher(f"keywords:{category}", time.thread_time() - start)
+        self.stats.record_keywords(category, found)
+        return found
+
+    def scan(
+        self,
+        category: str,
+        text: str,
+        budget: Optional[ScanBudget] = None,
+    ) -> List[Rule]:
+        """
+        Scan text against one category.
+
+        Args:
+            category: Category name
+            text: Lowercased text to scan
+            budget: CPU budget checked before each regex evaluation
+
+        Returns:
+            Matching rules in policy order
+        """
+        if self.stats is None:
+            return self.categories[category].scan(text, budget)
+        return self.categories[category].scan_profiled(text, self.stats, budget)
+
+    def any_match(
+        self,
+        category: str,
+        text: str,
+        budget: Optional[ScanBudget] = None,
+    ) -> bool:
+        """
+        Check whether any rule of one category matches.
+
+        Args:
+            category: Category name
+            text: Lowercased text to scan
+            budget: CPU budget checked before each regex evaluation
+
+        Returns:
+            True if any rule matches
+        """
+        if self.stats is None:
+            return self.categories[category].any_match(text, budget)
+        return bool(
+            self.categories[category].scan_profiled(text, self.stats, budget, first_only=True)
+        )
+
+
+def required_literals(source: str) -> Optional[FrozenSet[str]]:
+    """
+    Find literals of which at least one occurs in every match of a pattern.
+
+    Args:
+        source: Raw regex pattern (case-sensitive, no inline flags)
+
+    Returns:
+        Set of literal anchors, or None if no anchor can be derived
+    """
+    try:
+        parsed = sre_parse.parse(source)
+    except re.error:
+        return None
+    if parsed.state.flags & (re.IGNORECASE | re.VERBOSE):
+        return None
+    return _required_in_sequence(list(parsed))
+
+
+def _required_in_sequence(items: Sequence) -> Optional[FrozenSet[str]]:
+    """
+    Derive anchors for a sequence of parsed regex items.
+
+    Every match of a sequence contains a match of each mandatory item, so
+    any single item's anchors are valid for the whole sequence. The most
+    selective candidate wins: a run of consecutive literal characters, or
+    the anchors of a group, an alternation or a repeat with min >= 1.
+    Optional items, character classes and assertions contribute nothing.
+    """
+    best: Optional[FrozenSet[str]] = None
+    run: List[str] = []
+
+    def consider(candidate: Optional[FrozenSet[str]]):
+        nonlocal best
+        if candidate and (best is None or _selectivity(candidate) > _selectivity(best)):
+            best = candidate
+
+    for op, av in items:
+        if op is sre_constants.LITERAL:
+            run.append(chr(av))
+            continue
+
+        if run:
+            consider(frozenset(["".join(run)]))
+            run = []
+
+        if op is sre_constants.SUBPATTERN:
+            _, add_flags, _, body = av
+            if not add_flags & re.IGNORECASE:
+                consider(_required_in_sequence(list(body)))
+        elif op is sre_constants.BRANCH:
+            branches = [_required_in_sequence(list(branch)) for branch in av[1]]
+            if all(branches):
+                consider(frozenset().union(*branches))
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) or \
+                op is getattr(sre_constants, "POSSESSIVE_REPEAT", None):
+            low, _, body = av
+            if low >= 1:
+                consider(_required_in_sequence(list(body)))
+        elif op is sre_constants.IN:
+            if all(item_op is sre_constants.LITERAL for item_op, _ in av):
+                consider(frozenset(chr(value) for _, value in av))
+
+    if run:
+        consider(frozenset(["".join(run)]))
+    return best
+
+
+def _selectivity(anchors: FrozenSet[str]) -> Tuple[int, int]:
+    """Rank anchor sets: longer shortest literal first, then fewer literals."""
+    return min(len(anchor) for anchor in anchors), -len(anchors)
+
+
+def _can_match_newline(source: str) -> bool:
+    """
+    Check whether a match of a pattern may contain a line break.
+
+    Args:
+        source: Raw regex pattern
+
+    Returns:
+        False only if no match can contain "\\n" (True when unsure)
+    """
+    try:
+        parsed = sre_parse.parse(source)
+    except re.error:
+        return True
+    if parsed.state.flags & (re.DOTALL | re.IGNORECASE | re.VERBOSE):
+        return True
+    return _sequence_matches_newline(list(parsed))
+
+
+def _sequence_matches_newline(items: Sequence) -> bool:
+    """Check whether any parsed item can consume a "\\n"."""
+    for op, av in items:
+        if op is sre_constants.LITERAL:
+            if av == ord("\n"):
+                return True
+        elif op is sre_constants.NOT_LITERAL:
+            if av != ord("\n"):
+                return True
+        elif op is sre_constants.IN:
+            if _class_matches_newline(av):
+                return True
+        elif op is sre_constants.SUBPATTERN:
+            _, add_flags, _, body = av
+            if add_flags & re.DOTALL or _sequence_matches_newline(list(body)):
+                return True
+        elif op is sre_constants.BRANCH:
+            if any(_sequence_matches_newline(list(branch)) for branch in av[1]):
+                return True
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) or \
+                op is getattr(sre_constants, "POSSESSIVE_REPEAT", None):
+            if _sequence_matches_newline(list(av[2])):
+                return True
+        elif op is getattr(sre_constants, "ATOMIC_GROUP", None):
+            if _sequence_matches_newline(list(av)):
+                return True
+        elif op not in (sre_constants.ANY, sre_constants.AT,
+                        sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            # Back references and anything unknown
+            return True
+    return False
+
+
+def _class_matches_newline(items: Sequence) -> bool:
+    """Check whether a parsed character class contains "\\n"."""
+    newline = ord("\n")
+    negated = False
+    found = False
+    for op, av in items:
+        if op is sre_constants.NEGATE:
+            negated = True
+        elif op is sre_constants.LITERAL:
+            found = found or av == newline
+        elif op is sre_constants.RANGE:
+            found = found or av[0] <= newline <= av[1]
+        elif op is sre_constants.CATEGORY:
+            found = found or av in (
+                sre_constants.CATEGORY_SPACE,
+                sre_constants.CATEGORY_NOT_DIGIT,
+                sre_constants.CATEGORY_NOT_WORD,
+                sre_constants.CATEGORY_LINEBREAK,
+            )
+        else:
+            return True
+    return found != negated
+
+
+def _expand_gaps(source: str) -> Optional[List[List[str]]]:
+    """
+    Rewrite a pattern as alternatives of segments separated by ".*" gaps.
+
+    Top-level alternations are split, and groups containing a gap are
+    inlined once per alternative of their body. Existence of a match is
+    preserved: the pattern matches iff some alternative's segments match
+    in order with only non-newline text between them.
+
+    Args:
+        source: Raw regex pattern
+
+    Returns:
+        List of alternatives, each a list of segment patterns, or None if
+        a gap sits where it cannot be expanded
+    """
+    alternatives: List[List[str]] = []
+    for branch in _split_items(_top_level_items(source)):
+        partials: List[List[str]] = [[""]]
+        for item in branch:
+            if item in _GAPS:
+                for partial in partials:
+                    partial.append("")
+            elif _contains_gap(item):
+                body = _plain_group_body(item)
+                if body is None:
+                    return None
+                expanded = _expand_gaps(body)
+                if expanded is None:
+                    return None
+                partials = [
+                    partial[:-1] + [partial[-1] + sub[0]] + sub[1:]
+                    for partial in partials
+                    for sub in expanded
+                ]
+            else:
+                for partial in partials:
+                    partial[-1] += item
+        alternatives.extend(partials)
+    return alternatives
+
+
+def _top_level_items(source: str) -> List[str]:
+    """
+    Tokenize a pattern into top-level atoms (with quantifiers) and "|".
+
+    Args:
+        source: Raw regex pattern
+
+    Returns:
+        List of item strings that concatenate back to the source
+    """
+    items = []
+    i = 0
+    while i < len(source):
+        char = source[i]
+        start = i
+        if char == "\\":
+            i += 2
+        elif char == "[":
+            i += 1
+            if i < len(source) and source[i] == "^":
+                i += 1
+            if i < len(source) and source[i] == "]":
+                i += 1
+            while i < len(source) and source[i] != "]":
+                i += 2 if source[i] == "\\" else 1
+            i += 1
+        elif char == "(":
+            depth = 0
+            in_class = False
+            while i < len(source):
+                c = source[i]
+                if c == "\\":
+                    i += 2
+                    continue
+                if in_class:
+                    in_class = c != "]"
+                elif c == "[":
+                    in_class = True
+                elif c == "(":
+                    depth += 1
+                elif c == ")":
+                    depth -= 1
+                    if depth == 0:
+                        break
+                i += 1
+            i += 1
+        else:
+            i += 1
+
+        # Attach any quantifier (and its lazy/possessive suffix)
+        if char != "|" and i < len(source):
+            if source[i] in "*+?":
+                i += 1
+            elif source[i] == "{":
+                close = source.find("}", i)
+                if close != -1 and re.fullmatch(r"\{\d*(,\d*)?\}", source[i:close + 1]):
+                    i = close + 1
+            if start != i and i < len(source) and source[i] in "?+" and \
+                    source[i - 1] in "*+?}" and i - 1 > start:
+                i += 1
+        items.append(source[start:i])
+    return items
+
+
+def _split_items(items: List[str]) -> List[List[str]]:
+    """Split a list of top-level items on "|" into branches."""
+    branches: List[List[str]] = [[]]
+    for item in items:
+        if item == "|":
+            branches.append([])
+        else:
+            branches[-1].append(item)
+    return branches
+
+
+def _contains_gap(item: str) -> bool:
+    """Check whether an item contains an unescaped ".*"."""
+    return re.search(r"(?<!\\)\.\*", item) is not None
+
+
+def _plain_group_body(item: str) -> Optional[str]:
+    """Return the body of an unquantified capturing or (?:) group."""
+    if not item.startswith("(") or not item.endswith(")"):
+        return None
+    if item.startswith("(?:"):
+        return item[3:-1]
+    if item.startswith("(?"):
+        return None
+    return item[1:-1]
+
+
+def _render_trie(node: Dict) -> str:
+    """
+    Render a keyword trie as a regex that prefers the longest keyword.
+
+    Args:
+        node: Trie node mapping characters to child nodes ("" marks an end)
+
+    Returns:
+        Regex source for the subtree
+    """
+    branches = [
+        re.escape(char) + _render_trie(child)
+        for char, child in sorted(node.items())
+        if char
+    ]
+    if not branches:
+        return ""
+
+    body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    if "" in node:
+        return f"(?:{body})?"
+    return body
+
+
+def _combine_alternatives(sources: Sequence[str]) -> str:
+    """
+    Join patterns into one alternation, factoring out a leading \\b.
+
+    Args:
+        sources: Raw regex patterns
+
+    Returns:
+        Pattern matching wherever any of the sources matches
+    """
+    bounded, other = [], []
+    for source in sources:
+        if source.startswith(r"\b") and not _has_top_level_alternation(source):
+            bounded.append(f"(?:{source[2:]})")
+        else:
+            other.append(f"(?:{source})")
+
+    parts = []
+    if bounded:
+        parts.append(r"\b(?:" + "|".join(bounded) + ")")
+    parts.extend(other)
+    return "|".join(parts)
+
+
+def _has_top_level_alternation(source: str) -> bool:
+    """Check whether a pattern contains a "|" outside any group or class."""
+    depth = 0
+    in_class = False
+    escaped = False
+    for char in source:
+        if escaped:
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif in_class:
+            in_class = char != "]"
+        elif char == "[":
+            in_class = True
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "|" and depth == 0:
+            return True
+    return False
+
+
+def build_rules(
+    prefix: str,
+    patterns: Sequence[str],
+    confidence: float,
+    category: Optional[str] = None,
+) -> List[Rule]:
+    """
+    Turn a list of raw regex patterns into rules.
+
+    Args:
+        prefix: Prefix for the generated rule names
+        patterns: Raw regex patterns in policy order
+        confidence: Confidence assigned to every rule
+        category: Tag reported on match (defaults to prefix)
+
+    Returns:
+        List of rules
+    """
+    return [
+        Rule(
+            name=f"{prefix}_{i}",
+            category=category or prefix,
+            source=pattern,
+            confidence=confidence,
+        )
+        for i, pattern in enumerate(patterns)
+    ]
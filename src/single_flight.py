@@ -0,0 +1,144 @@
+"""
+Single-flight coalescing of identical concurrent requests.
+
+When the same deterministic request is already in flight, later callers
+wait for it and share its result instead of sending their own upstream
+call. Only requests that are in flight at the same moment are merged;
+the response cache covers repeats over time.
+"""
+
+import asyncio
+import copy
+import threading
+from typing import Any, Awaitable, Callable, Dict
+
+
+class _Call:
+    """One in-flight call and the callers waiting on it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+        self.waiters = 0
+        # AsyncSingleFlight only: the shared task and the callers awaiting it
+        self.task: asyncio.Future = None
+        self.awaiting = 0
+
+
+class _Counters:
+    """Counters shared by both single-flight variants."""
+
+    def __init__(self):
+        self.leaders = 0
+        self.coalesced = 0
+        self.max_waiters = 0
+        self._in_flight: Dict[str, Any] = {}
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Return coalescing counters.
+
+        "leaders" are calls that went upstream, "coalesced" are callers
+        served by someone else's call (upstream calls saved).
+        """
+        requests = self.leaders + self.coalesced
+        return {
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._in_flight),
+            "max_waiters": self.max_waiters,
+            "coalesce_rate": self.coalesced / requests if requests else 0.0,
+        }
+
+
+class SingleFlight(_Counters):
+    """Thread-safe single-flight group for blocking calls."""
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable[[], Any]):
+        """
+        Run fn once per key among concurrent callers.
+
+        Args:
+            key: Identity of the request
+            fn: Call to make if no identical one is in flight
+
+        Returns:
+            (result, shared) - shared is True if another caller's call
+            produced the result; every caller gets its own deep copy
+
+        Raises:
+            Whatever fn raised, in every caller waiting on it
+        """
+        with self._lock:
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self._in_flight[key] = _Call()
+                self.leaders += 1
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+                self.max_waiters = max(self.max_waiters, call.waiters)
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result), True
+
+        try:
+            call.result = fn()
+            return copy.deepcopy(call.result), False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            call.done.set()
+
+
+class AsyncSingleFlight(_Counters):
+    """Single-flight group for coroutines on one event loop."""
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]):
+        """
+        Await fn once per key among concurrent callers (see SingleFlight.do).
+
+        The shared call runs as its own task, so cancelling one waiter does
+        not cancel it for the others. When the last waiter is cancelled the
+        task is cancelled too, and the next caller starts a new call.
+        """
+        call = self._in_flight.get(key)
+        leader = call is None
+        if leader:
+            call = self._in_flight[key] = _Call()
+            call.task = asyncio.ensure_future(fn())
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            self.leaders += 1
+        else:
+            call.waiters += 1
+            self.coalesced += 1
+            self.max_waiters = max(self.max_waiters, call.waiters)
+
+        call.awaiting += 1
+        try:
+            result = await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if call.awaiting == 1 and not call.task.done():
+                call.task.cancel()
+                self._forget(key, call)
+            raise
+        finally:
+            call.awaiting -= 1
+        return copy.deepcopy(result), not leader
+
+    def _forget(self, key: str, call: _Call):
+        """Stop sharing a call (unless a new call has taken its key)."""
+        if self._in_flight.get(key) is call:
+            del self._in_flight[key]